@@ -0,0 +1,400 @@
+import heapq
+import re
+import time
+from datetime import datetime
+
+TOP_K = 20
+EXACT_BONUS = 1000
+PREFIX_BONUS = 500
+SUBSTRING_BONUS = 100
+PINYIN_PREFIX_BONUS = 80     # 从第一个字起连续匹配拼音/首字母，如 kh -> 开会
+PINYIN_BONUS = 60            # 从中间某个字起连续匹配
+FUZZY_BONUS = 30             # 跳字匹配或子序列匹配
+FUZZY_BUDGET = 0.03          # 每次按键模糊匹配的时间预算（秒）
+HALF_LIFE = 14 * 86400       # 使用热度的半衰期（秒）
+FRECENCY_WEIGHT = 10         # 热度换算为基础分的系数（一次刚发生的使用约等于 10 分）
+
+_pinyin = None               # 首次需要注音时才导入 pypinyin（导入要加载整部字典，很慢）
+
+
+def pinyin_readings(run):
+    """一串汉字 -> 每个字的全部读音列表；未安装 pypinyin 时每个字都没有读音"""
+    global _pinyin
+    if _pinyin is None:
+        try:
+            from pypinyin import Style, pinyin
+            _pinyin = lambda text: pinyin(text, style=Style.NORMAL, heteronym=True)
+        except ImportError:
+            _pinyin = lambda text: [[] for _ in text]
+    return _pinyin(run)
+
+
+# ---------- 使用热度 ----------
+# 每个名称保存 {"frecency": 热度, "updated": 更新时的时间戳}。热度按半衰期指数衰减，
+# 每次使用先衰减到当前时刻再加 1，只改这一条记录。衰减对所有名称是同一个比例，
+# 因此名称之间的先后顺序不随时间变化，不需要按时间重新计算。
+def frecency_at(data, ts):
+    return data.get("frecency", 0.0) * 2 ** ((data.get("updated", ts) - ts) / HALF_LIFE)
+
+
+def bump_frecency(data, ts):
+    data["frecency"] = frecency_at(data, ts) + 1
+    data["updated"] = ts
+
+
+def migrate_names(names_data, now=None):
+    """把旧格式 {"count", "last_used"} 一次性换算为热度；返回是否有改动
+
+    旧记录按“全部使用都发生在 last_used 时刻”换算，缺少 last_used 的按当前时刻。
+    """
+    ts = (now or datetime.now()).timestamp()
+    changed = False
+    for data in names_data.values():
+        if "frecency" in data:
+            continue
+        updated = ts
+        try:
+            updated = datetime.strptime(data["last_used"], "%Y-%m-%d %H:%M:%S").timestamp()
+        except:
+            pass
+        count = data.get("count", 0)
+        data.clear()
+        data["frecency"] = float(count if isinstance(count, (int, float)) else 0)
+        data["updated"] = min(updated, ts)
+        changed = True
+    return changed
+
+
+def name_score(data, ts):
+    """与输入无关的基础分：衰减到 ts 时刻的使用热度"""
+    return FRECENCY_WEIGHT * frecency_at(data, ts)
+
+
+def query_grams(text):
+    """查询用的 n-gram：长度 ≥ 2 时取全部二元组，否则取单字"""
+    if len(text) < 2:
+        return {text} if text else set()
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def name_grams(name):
+    """名称建索引用的 n-gram：单字和二元组都要收录，单字查询也能走索引"""
+    return set(name) | query_grams(name)
+
+
+# ---------- 模糊匹配 ----------
+_HANZI = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff]+')
+_WORD = re.compile(r'[^\W_]+')
+
+
+def romanize(name):
+    """名称 -> 音节序列，每个音节是可匹配写法的元组
+
+    汉字音节包含汉字本身及其全部读音（需要 pypinyin，缺失时只有汉字本身），
+    其他文字按单词切分并转为小写，因此 "写code" -> (("写", "xie"), ("code",))。
+    """
+    syllables = []
+    pos = 0
+    for m in _HANZI.finditer(name):
+        syllables.extend((w,) for w in _WORD.findall(name[pos:m.start()].lower()))
+        run = m.group()
+        for ch, alts in zip(run, pinyin_readings(run)):
+            syllables.append((ch,) + tuple(dict.fromkeys(alts)))
+        pos = m.end()
+    syllables.extend((w,) for w in _WORD.findall(name[pos:].lower()))
+    return tuple(syllables)
+
+
+def match_syllables(query, syllables):
+    """按音节匹配查询：每个音节匹配其某种写法的非空前缀（首字母、部分或完整拼音），
+    可以跳过音节。返回 (起始音节下标, 跳过的音节数) 中最优的一个；不匹配返回 None。
+    """
+    n, m = len(query), len(syllables)
+    memo = {}
+
+    def take(qi, si):
+        # 音节 si 至少匹配一个字符，返回之后最少还要跳过的音节数
+        key = (qi, si)
+        if key in memo:
+            return memo[key]
+        best = None
+        for alt in syllables[si]:
+            j = 0
+            while j < len(alt) and qi + j < n and alt[j] == query[qi + j]:
+                j += 1
+                r = rest(qi + j, si + 1)
+                if r is not None and (best is None or r < best):
+                    best = r
+                    if best == 0:
+                        break
+            if best == 0:
+                break
+        memo[key] = best
+        return best
+
+    def rest(qi, si):
+        if qi == n:
+            return 0
+        skipped = 0
+        best = None
+        while si < m and (best is None or skipped < best):
+            r = take(qi, si)
+            if r is not None and (best is None or r + skipped < best):
+                best = r + skipped
+            si += 1
+            skipped += 1
+        return best
+
+    found = None
+    for start in range(m):
+        gaps = take(0, start)
+        if gaps is not None and (found is None or gaps < found[1]):
+            found = (start, gaps)
+            if gaps == 0:
+                break
+    return found
+
+
+def is_subsequence(query, text):
+    it = iter(text)
+    return all(ch in it for ch in query)
+
+
+class _Node:
+    __slots__ = ("children", "top", "name")
+
+    def __init__(self):
+        self.children = {}
+        self.top = []      # 该前缀下基础分最高的至多 TOP_K 个名称（降序）
+        self.name = None   # 恰好在此结束的名称
+
+
+class NameIndex:
+    """事件名输入补全索引
+
+    前缀匹配走字典树，每个节点缓存该前缀下基础分最高的 TOP_K 个名称；
+    子串匹配走二元组倒排索引，只在候选集合上取 top-k。基础分是衰减到建索引时刻的使用热度，
+    名称被使用时只沿它在字典树中的路径更新缓存。热度衰减不改变名称之间的顺序，
+    但匹配加分是固定值，因此每天按当天时刻整体重算一次基础分。
+
+    结果不足时再做模糊匹配（拼音首字母/全拼、跳字、子序列）：按基础分从高到低扫描名称，
+    剩余名称即使拿到最高模糊加分也进不了前 k 名时提前结束，超出时间预算时返回已有结果。
+    每个名称的音节在首次加入时计算并缓存，跨天重建时沿用。
+    """
+
+    def __init__(self, names_data, now=None, budget=FUZZY_BUDGET):
+        self.budget = budget
+        self.romans = {}          # 名称 -> (音节序列, 可出现的字符集合)
+        self.truncated = False    # 最近一次搜索是否因超出时间预算而提前结束
+        self.rebuild(names_data, now)
+
+    def rebuild(self, names_data, now=None):
+        now = now or datetime.now()
+        self.day = now.date()
+        self.ref = now.timestamp()
+        self.data = names_data
+        self.scores = {name: name_score(d, self.ref) for name, d in names_data.items()}
+        self.root = _Node()
+        self.grams = {}
+        self.order = sorted(self.scores, key=self.scores.get, reverse=True)
+        self._order_dirty = False
+        for name in self.order:
+            self._add(name)
+
+    def _add(self, name):
+        node = self.root
+        self._promote(node, name)
+        for ch in name:
+            node = node.children.setdefault(ch, _Node())
+            self._promote(node, name)
+        node.name = name
+        for g in name_grams(name):
+            self.grams.setdefault(g, set()).add(name)
+        if name not in self.romans:
+            syllables = romanize(name)
+            chars = set(name.lower())
+            for alts in syllables:
+                for alt in alts:
+                    chars.update(alt)
+            self.romans[name] = (syllables, frozenset(chars))
+
+    def _promote(self, node, name):
+        """名称的基础分只增不减（跨天重算除外），把它放进或上移到节点缓存中"""
+        top = node.top
+        score = self.scores[name]
+        if name in top:
+            top.remove(name)
+        elif len(top) >= TOP_K and self.scores[top[-1]] >= score:
+            return
+        i = 0
+        while i < len(top) and self.scores[top[i]] >= score:
+            i += 1
+        top.insert(i, name)
+        del top[TOP_K:]
+
+    def use(self, name, now=None):
+        """记录一次使用：更新名称的热度（没有则新建）并更新索引"""
+        now = now or datetime.now()
+        bump_frecency(self.data.setdefault(name, {}), now.timestamp())
+        self.touch(name, now)
+
+    def touch(self, name, now=None):
+        """名称的热度变化（只会增加）后增量更新"""
+        now = now or datetime.now()
+        if now.date() != self.day:
+            self.rebuild(self.data, now)
+            return
+        new = name not in self.scores
+        self.scores[name] = name_score(self.data[name], self.ref)
+        self._order_dirty = True
+        if new:
+            self.order.append(name)
+            self._add(name)
+            return
+        node = self.root
+        self._promote(node, name)
+        for ch in name:
+            node = node.children[ch]
+            self._promote(node, name)
+
+    def remove(self, name):
+        """从索引中去掉名称；缓存中丢了它的节点自底向上由子节点的缓存补齐"""
+        if self.scores.pop(name, None) is None:
+            return
+        self.order.remove(name)
+        self.romans.pop(name, None)
+        for g in name_grams(name):
+            p = self.grams.get(g)
+            if p is not None:
+                p.discard(name)
+                if not p:
+                    del self.grams[g]
+        path = [self.root]
+        for ch in name:
+            path.append(path[-1].children[ch])
+        path[-1].name = None
+        scores = self.scores
+        for node in reversed(path):
+            if name not in node.top:
+                continue
+            candidates = {n for child in node.children.values() for n in child.top}
+            if node.name is not None:
+                candidates.add(node.name)
+            node.top = heapq.nlargest(TOP_K, candidates, key=scores.get)
+
+    def trim(self, cap, keep=None):
+        """名称数超过 cap 时淘汰热度最低的，同时从名称数据中删除；返回被淘汰的名称
+
+        keep 为刚使用的名称，新名称热度往往最低，但不应在使用的同时被淘汰。
+        """
+        if len(self.scores) <= cap:
+            return []
+        if self._order_dirty:
+            self.order.sort(key=self.scores.get, reverse=True)
+            self._order_dirty = False
+        excess = len(self.order) - cap
+        removed = [n for n in reversed(self.order) if n != keep][:excess]
+        for name in removed:
+            del self.data[name]
+        if len(removed) > TOP_K:
+            # 一次淘汰很多（如首次迁移或调小上限）时直接重建更快
+            for name in removed:
+                self.romans.pop(name, None)
+            self.rebuild(self.data, datetime.fromtimestamp(self.ref))
+        else:
+            for name in removed:
+                self.remove(name)
+        return removed
+
+    def _find(self, prefix):
+        node = self.root
+        for ch in prefix:
+            node = node.children.get(ch)
+            if node is None:
+                return None
+        return node
+
+    def _substring_candidates(self, text):
+        postings = []
+        for g in query_grams(text):
+            p = self.grams.get(g)
+            if not p:
+                return set()
+            postings.append(p)
+        postings.sort(key=len)
+        result = postings[0]
+        for p in postings[1:]:
+            result = result & p
+            if not result:
+                break
+        return result
+
+    def fuzzy_bonus(self, query, name):
+        """query 须已转为小写并去掉空白"""
+        syllables, chars = self.romans[name]
+        if not chars.issuperset(query):
+            return 0
+        found = match_syllables(query, syllables)
+        if found is not None:
+            start, gaps = found
+            if gaps == 0:
+                return PINYIN_PREFIX_BONUS if start == 0 else PINYIN_BONUS
+            return FUZZY_BONUS
+        if is_subsequence(query, name.lower()):
+            return FUZZY_BONUS
+        return 0
+
+    def search(self, text, k=TOP_K, now=None):
+        """返回按 完全匹配 > 前缀 > 子串 > 拼音/模糊 加分再加基础分 排序的前 k 个名称（k 不超过 TOP_K）"""
+        deadline = time.perf_counter() + self.budget
+        self.truncated = False
+        k = min(k, TOP_K)
+        now = now or datetime.now()
+        if now.date() != self.day:
+            self.rebuild(self.data, now)
+        if not text:
+            return self.root.top[:k]
+        scores = self.scores
+        ranked = {}
+        node = self._find(text)
+        if node is not None:
+            for name in node.top[:k]:
+                ranked[name] = scores[name] + PREFIX_BONUS
+        if text in scores:
+            ranked[text] = scores[text] + EXACT_BONUS
+        others = (n for n in self._substring_candidates(text) if text in n and not n.startswith(text))
+        for name in heapq.nlargest(k, others, key=scores.get):
+            ranked[name] = scores[name] + SUBSTRING_BONUS
+        self._fuzzy(text, k, ranked, deadline)
+        return heapq.nlargest(k, ranked, key=ranked.get)
+
+    def _fuzzy(self, text, k, ranked, deadline):
+        """把模糊匹配结果并入 ranked（名称 -> 总分），只保留可能进入前 k 名的"""
+        query = "".join(text.lower().split())
+        if not query:
+            return
+        if self._order_dirty:
+            self.order.sort(key=self.scores.get, reverse=True)
+            self._order_dirty = False
+        scores = self.scores
+        best = [(total, name) for name, total in ranked.items()]
+        heapq.heapify(best)
+        while len(best) > k:
+            heapq.heappop(best)
+        for i, name in enumerate(self.order):
+            score = scores[name]
+            if len(best) == k and score + PINYIN_PREFIX_BONUS <= best[0][0]:
+                break
+            if i & 63 == 0 and time.perf_counter() > deadline:
+                self.truncated = True
+                break
+            if name in ranked:
+                continue
+            bonus = self.fuzzy_bonus(query, name)
+            if not bonus:
+                continue
+            ranked[name] = score + bonus
+            if len(best) < k:
+                heapq.heappush(best, (score + bonus, name))
+            elif score + bonus > best[0][0]:
+                heapq.heapreplace(best, (score + bonus, name))
@@ -0,0 +1,64 @@
+"""历史分析的 NumPy 向量化实现与纯 Python 实现的对比基准
+
+用法: python benchmarks/bench_analytics.py [--sizes 10000,100000,1000000] [--repeat 3]
+
+每种规模分别计时：列转换、时长百分位、星期 × 小时热力图、每日趋势、长尾，
+取多次中最快的一次，并核对两种实现的结果一致。未安装 NumPy 时只运行纯 Python 实现。
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from history_analytics import HistoryAnalytics, load_numpy
+from history_records import ColumnTable
+from synthetic import make_records
+
+CASES = ("columns", "percentiles", "hour_of_week", "daily", "long_tail")
+
+
+def best_of(fn, repeat):
+    best, result = None, None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def bench(table, use_numpy, repeat):
+    times, results = {}, {}
+    times["columns"], analytics = best_of(lambda: HistoryAnalytics(table, use_numpy=use_numpy), repeat)
+    for case in CASES[1:]:
+        times[case], results[case] = best_of(getattr(analytics, case), repeat)
+    return times, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    has_numpy = load_numpy() is not None
+    if not has_numpy:
+        print("未安装 NumPy，只运行纯 Python 实现")
+    print(f"{'size':>9} {'case':<14} {'python':>12} {'numpy':>12} {'speedup':>8}")
+    for n in (int(x) for x in args.sizes.split(",")):
+        table = ColumnTable.from_records(make_records(n))
+        py_times, py_results = bench(table, False, args.repeat)
+        if has_numpy:
+            np_times, np_results = bench(table, True, args.repeat)
+            assert np_results == py_results
+        for case in CASES:
+            line = f"{n:>9} {case:<14} {py_times[case] * 1000:>10.2f}ms"
+            if has_numpy:
+                line += f" {np_times[case] * 1000:>10.2f}ms {py_times[case] / np_times[case]:>7.1f}x"
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
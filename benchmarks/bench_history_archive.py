@@ -0,0 +1,108 @@
+"""二进制归档（mmap）与 JSON 快照的统计扫描对比基准
+
+用法: python benchmarks/bench_history_archive.py [--sizes 10000,100000,1000000]
+
+每种规模分别计时：重建归档、打开归档、按事件名汇总全部时长、按开始时间取一个月的记录，
+以及同样的汇总在“解析 JSON 快照”和“已加载的列式内存表”上的耗时。
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from history_archive import HistoryArchive
+from history_records import parse_wall
+from storage import JsonHistoryStore
+from synthetic import make_records
+
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - t0, result
+
+
+def totals_from_archive(archive):
+    by_name = {}
+    for r in archive.scan():
+        by_name[r.name] = by_name.get(r.name, 0) + r.duration_ms
+    return {archive.name(nid): ms for nid, ms in by_name.items()}
+
+
+def totals_from_json(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        records = json.load(f)["records"]
+    by_name = {}
+    for rec in records:
+        by_name[rec["event"]] = by_name.get(rec["event"], 0) + rec["duration_ms"]
+    return by_name
+
+
+def totals_from_table(table):
+    by_name = {}
+    names, durations = table.name, table.duration_ms
+    for row in table.rows():
+        by_name[names[row]] = by_name.get(names[row], 0) + durations[row]
+    return {table.names[nid]: ms for nid, ms in by_name.items()}
+
+
+def bench(n, workdir):
+    records = make_records(n)
+    data_file = os.path.join(workdir, f"history_{n}.json")
+    store = JsonHistoryStore(data_file)
+    store.replace_all(records)
+    store.close()
+    store = JsonHistoryStore(data_file)
+    store.load()
+
+    archive = HistoryArchive(os.path.join(workdir, f"history_{n}.archive"))
+    t_rebuild, _ = timed(archive.rebuild, store.records)
+    archive.close()
+    t_open, _ = timed(archive.open)
+    t_scan, by_archive = timed(totals_from_archive, archive)
+    t_json, by_json = timed(totals_from_json, data_file)
+    t_table, by_table = timed(totals_from_table, store.records)
+    assert by_archive == by_json == by_table
+
+    mid = records[len(records) // 2]["start_time"][:8] + "01 00:00:00"
+    first = parse_wall(mid)
+    t_month, month = timed(lambda: sum(1 for _ in archive.scan(first, first + 31 * 86400)))
+    archive.close()
+    store.close()
+    return {
+        "rebuild": t_rebuild,
+        "open": t_open,
+        "totals_archive": t_scan,
+        "totals_json": t_json,
+        "totals_table": t_table,
+        "month_range": t_month,
+        "month_hits": month,
+        "archive_bytes": os.path.getsize(archive.path) + os.path.getsize(archive.str_path),
+        "json_bytes": os.path.getsize(data_file),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    args = parser.parse_args()
+
+    cols = ["rebuild", "open", "totals_archive", "totals_json", "totals_table", "month_range"]
+    print(f"{'size':>9} " + " ".join(f"{c:>14}" for c in cols) + f" {'archive/json':>13}")
+    workdir = tempfile.mkdtemp(prefix="event_timer_archive_")
+    try:
+        for n in (int(x) for x in args.sizes.split(",")):
+            r = bench(n, workdir)
+            ratio = r["archive_bytes"] / r["json_bytes"]
+            print(f"{n:>9} " + " ".join(f"{r[c] * 1000:>12.2f}ms" for c in cols) + f" {ratio:>12.0%}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
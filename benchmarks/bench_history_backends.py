@@ -0,0 +1,75 @@
+"""JSON（快照 + 日志）与 SQLite 历史存储后端的对比基准
+
+用法: python benchmarks/bench_history_backends.py [--sizes 10000,100000,1000000]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import JsonHistoryStore, SqliteHistoryStore, TIME_FORMAT
+from synthetic import make_records
+
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - t0, result
+
+
+def bench_backend(name, make_store, records):
+    store = make_store()
+    t_import, _ = timed(store.replace_all, records)
+    store.close()
+
+    store = make_store()
+    t_load, loaded = timed(store.load)
+    day = datetime.strptime(records[len(records) // 2]["start_time"], TIME_FORMAT).date()
+    t_tag, by_tag = timed(store.query, {"会议"}, None)
+    t_day, by_day = timed(store.query, None, (day, day))
+    t_both, _ = timed(store.query, {"会议", "阅读"}, (day, day))
+    extra = dict(records[0], event="基准追加")
+    t_append, _ = timed(store.append, extra)
+    t_delete, _ = timed(store.delete, by_day[0])
+    store.close()
+    return {
+        "backend": name,
+        "import": t_import,
+        "load": t_load,
+        "query_tag": t_tag,
+        "query_day": t_day,
+        "query_tag_day": t_both,
+        "append": t_append,
+        "delete": t_delete,
+        "tag_hits": len(by_tag),
+        "day_hits": len(by_day),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    args = parser.parse_args()
+
+    cols = ["import", "load", "query_tag", "query_day", "query_tag_day", "append", "delete"]
+    print(f"{'size':>9} {'backend':>7} " + " ".join(f"{c:>13}" for c in cols))
+    for n in [int(x) for x in args.sizes.split(",")]:
+        records = make_records(n)
+        workdir = tempfile.mkdtemp(prefix="event_timer_bench_")
+        try:
+            data_file = os.path.join(workdir, "events_history.json")
+            db_file = os.path.join(workdir, "events_history.db")
+            for row in (bench_backend("json", lambda: JsonHistoryStore(data_file), records),
+                        bench_backend("sqlite", lambda: SqliteHistoryStore(db_file), records)):
+                print(f"{n:>9} {row['backend']:>7} " + " ".join(f"{row[c] * 1000:>11.2f}ms" for c in cols))
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""历史记录内存表示对比：字典列表 vs 列式表（ColumnTable）
+
+用法: python benchmarks/bench_history_columns.py [--sizes 10000,100000,1000000]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic import make_records
+from history_records import ColumnTable, parse_tags, parse_wall
+
+
+def measure(build):
+    """返回 (构建结果, 常驻字节数)"""
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def scan_dicts(records, tag, lo, hi):
+    n = 0
+    for rec in records:
+        if lo <= rec["start_time"] < hi and tag in parse_tags(rec.get("tags", "")):
+            n += 1
+    return n
+
+
+def scan_columns(table, tag, lo, hi):
+    tid = table.tag_ids.get(tag)
+    wanted = {sid for sid, tids in enumerate(table.tagset_tags) if tid in tids}
+    start, tagset, live = table.start, table.tagset, table.live
+    n = 0
+    for row in range(len(live)):
+        if live[row] and lo <= start[row] < hi and tagset[row] in wanted:
+            n += 1
+    return n
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    args = parser.parse_args()
+
+    print(f"{'size':>9} {'dict MB':>9} {'column MB':>10} {'ratio':>6} {'dict scan':>11} {'column scan':>12}")
+    for n in [int(x) for x in args.sizes.split(",")]:
+        text = json.dumps(make_records(n), ensure_ascii=False)
+        # 两种表示都从 JSON 文本构建，与实际加载路径一致
+        records, dict_bytes = measure(lambda: json.loads(text))
+        table, col_bytes = measure(lambda: ColumnTable.from_records(records))
+        lo_s, hi_s = records[n // 4]["start_time"], records[n // 2]["start_time"]
+
+        t0 = time.perf_counter()
+        hits_d = scan_dicts(records, "会议", lo_s, hi_s)
+        t_dict = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        hits_c = scan_columns(table, "会议", parse_wall(lo_s), parse_wall(hi_s))
+        t_col = time.perf_counter() - t0
+        assert hits_d == hits_c
+        print(f"{n:>9} {dict_bytes / 1e6:>9.1f} {col_bytes / 1e6:>10.1f} {dict_bytes / col_bytes:>5.1f}x "
+              f"{t_dict * 1000:>9.1f}ms {t_col * 1000:>10.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""热点路径的合成负载基准：结果输出为 JSON，可与保存的基线对比并标出性能回退
+
+用法:
+    python benchmarks/bench_suite.py [--sizes 1000,10000,100000] [--repeat 5] [--output result.json]
+                                     [--baseline baseline.json] [--threshold 0.25] [--display auto|tk|fake]
+    python benchmarks/bench_suite.py --compare result.json baseline.json
+
+需要界面的用例（update_history_display、update_dropdown_list）在有显示时使用真实 Tk 控件，
+无显示时使用 headless.py 中的假控件；在 Linux 上也可以用 xvfb-run 提供虚拟显示。
+导入 event_timer 失败（缺少依赖）时这些用例记为 skipped。有回退时退出码为 1。
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from headless import background_load, close_app, load_app, make_app, open_display
+from history_records import parse_tags
+from synthetic import write_config
+
+
+# 模拟逐字输入一个事件名，再加上空输入、拼音首字母和不存在的名称
+KEYSTROKES = ["", "写", "写代", "写代码", "写代码1", "写代码12", "kh", "xdm", "不存在的事件"]
+
+
+def timed_runs(fn, repeat, setup=None):
+    """运行 repeat 次，返回每次的秒数；setup 在每次计时前调用，不计入时间"""
+    runs = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        gc.collect()
+        t0 = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - t0)
+    return runs
+
+
+class Suite:
+    def __init__(self, repeat, display, seed=42):
+        self.repeat = repeat
+        self.display = display
+        self.seed = seed
+        self.root = None
+        self.results = []
+        self.skipped = []
+
+    def record(self, case, size, runs, commands=None):
+        """commands: 每次运行的命令等待时间统计（CommandQueue.stats()），随结果一起保存"""
+        result = {
+            "case": case,
+            "size": size,
+            "median_s": statistics.median(runs),
+            "min_s": min(runs),
+            "runs": runs,
+        }
+        note = ""
+        if commands is not None:
+            result["commands"] = commands
+            note = f"  命令等待 p95 {max(c['p95_ms'] for c in commands):.3f}ms" \
+                   f" / 最长 {max(c['max_ms'] for c in commands):.3f}ms"
+        self.results.append(result)
+        print(f"{size:>9} {case:<36} {statistics.median(runs) * 1000:>10.3f}ms{note}")
+
+    def skip(self, case, size, reason):
+        self.skipped.append({"case": case, "size": size, "reason": reason})
+        print(f"{size:>9} {case:<36} {'skipped':>12}  ({reason})")
+
+    def app(self, config_dir, backend='json'):
+        return make_app(config_dir, backend, self.root)
+
+    def run_size(self, n, workdir):
+        config_dir = os.path.join(workdir, f"config_{n}")
+        records = write_config(config_dir, n, self.seed, sqlite=True)
+
+        tag_strings = [r["tags"] for r in records]
+        self.record("parse_tags", n, timed_runs(lambda: [parse_tags(t) for t in tag_strings], self.repeat))
+
+        try:
+            import event_timer
+        except ImportError as e:
+            for case in ("load_history[json]", "load_history[sqlite]", "load_history[background]", "save_history", "update_history_display",
+                         "update_dropdown_list", "load_tags_rebuild"):
+                self.skip(case, n, f"event_timer 无法导入: {e}")
+            return
+
+        for backend in ("json", "sqlite"):
+            apps = []
+
+            def setup():
+                apps.append(self.app(config_dir, backend))
+
+            runs = timed_runs(lambda: load_app(apps[-1]), self.repeat, setup)
+            for app in apps:
+                close_app(app)
+            self.record(f"load_history[{backend}]", n, runs)
+
+        # 正常启动的路径：后台线程加载，结果经命令队列接入，再分批填充历史表
+        apps, commands = [], []
+
+        def setup():
+            apps.append(self.app(config_dir))
+
+        runs = timed_runs(lambda: commands.append(background_load(apps[-1])), self.repeat, setup)
+        for app in apps:
+            close_app(app)
+        self.record("load_history[background]", n, runs, commands)
+
+        app = self.app(config_dir)
+        try:
+            load_app(app)
+            self.record("save_history", n, timed_runs(app.save_history, self.repeat))
+            self.bench_display(app, records, n)
+            self.bench_dropdown(app, n)
+            self.bench_tags(app, n)
+        finally:
+            close_app(app)
+
+    def bench_display(self, app, records, n):
+        mid = records[len(records) // 2]["start_time"][:10]
+        last = records[min(len(records) - 1, len(records) // 2 + 1500)]["start_time"][:10]
+        filters = {
+            "none": (set(), ""),
+            "tag": ({"会议"}, ""),
+            "date": (set(), mid),
+            "range": (set(), f"{mid}~{last}"),
+            "tag+range": ({"会议", "阅读"}, f"{mid}~{last}"),
+        }
+        for label, (tags, day_text) in filters.items():
+            def setup():
+                app.selected_tags_filter = set(tags)
+                app.specific_date_var.set(day_text)
+            self.record(f"update_history_display[{label}]", n,
+                        timed_runs(app.update_history_display, self.repeat, setup))
+
+    def bench_dropdown(self, app, n):
+        def type_all():
+            for text in KEYSTROKES:
+                app.event_entry.delete(0, "end")
+                app.event_entry.insert(0, text)
+                app.update_dropdown_list()
+        # 记录的是平均每次按键的耗时
+        runs = timed_runs(type_all, self.repeat)
+        self.record("update_dropdown_list", n, [r / len(KEYSTROKES) for r in runs])
+
+    def bench_tags(self, app, n):
+        def setup():
+            app.writer.flush()
+            if os.path.exists(app.tags_file):
+                os.remove(app.tags_file)
+        # 标签文件缺失时由历史记录重新统计（加载线程中的同一个方法）
+        self.record("load_tags_rebuild", n, timed_runs(lambda: app.read_tags(app.events_history), self.repeat, setup))
+
+    def run(self, sizes):
+        if self.display in ("auto", "tk"):
+            self.root = open_display()
+            if self.root is None and self.display == "tk":
+                raise SystemExit("没有可用的显示（可在 Linux 上使用 xvfb-run）")
+        workdir = tempfile.mkdtemp(prefix="event_timer_suite_")
+        try:
+            for n in sizes:
+                self.run_size(n, workdir)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+            if self.root is not None:
+                self.root.destroy()
+        return {
+            "meta": {
+                "created": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "display": "tk" if self.root is not None else "fake",
+                "repeat": self.repeat,
+                "seed": self.seed,
+                "sizes": sizes,
+            },
+            "results": self.results,
+            "skipped": self.skipped,
+        }
+
+
+def compare(current, baseline, threshold, min_delta):
+    """对比两份结果，返回回退的用例列表；中位数变慢超过 threshold 且超过 min_delta 秒才算回退"""
+    base = {(r["case"], r["size"]): r for r in baseline["results"]}
+    regressions = []
+    print(f"\n{'size':>9} {'case':<36} {'baseline':>12} {'current':>12} {'ratio':>7}")
+    for r in current["results"]:
+        b = base.get((r["case"], r["size"]))
+        if b is None:
+            continue
+        ratio = r["median_s"] / b["median_s"] if b["median_s"] > 0 else float("inf")
+        flag = ""
+        if ratio > 1 + threshold and r["median_s"] - b["median_s"] > min_delta:
+            flag = "  REGRESSION"
+            regressions.append({"case": r["case"], "size": r["size"], "baseline_s": b["median_s"],
+                                "current_s": r["median_s"], "ratio": ratio})
+        elif ratio < 1 / (1 + threshold):
+            flag = "  faster"
+        print(f"{r['size']:>9} {r['case']:<36} {b['median_s'] * 1000:>10.3f}ms "
+              f"{r['median_s'] * 1000:>10.3f}ms {ratio:>6.2f}x{flag}")
+    return regressions
+
+
+def load_json(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="结果 JSON 的保存路径")
+    parser.add_argument("--baseline", help="与之对比的基线 JSON")
+    parser.add_argument("--threshold", type=float, default=0.25, help="中位数变慢超过此比例视为回退")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="变慢的绝对值低于此值时忽略")
+    parser.add_argument("--display", choices=("auto", "tk", "fake"), default="auto")
+    parser.add_argument("--compare", nargs=2, metavar=("CURRENT", "BASELINE"), help="只对比两份已有结果")
+    args = parser.parse_args()
+
+    if args.compare:
+        current, baseline = (load_json(p) for p in args.compare)
+    else:
+        sizes = [int(x) for x in args.sizes.split(",")]
+        current = Suite(args.repeat, args.display, args.seed).run(sizes)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(current, f, ensure_ascii=False, indent=1)
+        baseline = load_json(args.baseline) if args.baseline else None
+    if baseline is None:
+        return 0
+    regressions = compare(current, baseline, args.threshold, args.min_delta_ms / 1000)
+    if regressions:
+        print(f"\n{len(regressions)} 项回退")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""启动导入预算检查：用 python -X importtime 测量冷启动导入 event_timer 的耗时
+
+用法:
+    python benchmarks/check_import_time.py [--budget-ms 50] [--runs 5] [--module event_timer]
+
+先导入一次写好字节码缓存（与安装后的正常启动一致），之后每次都启动新的解释器，
+取多次中累计耗时最少的一次与预算比较；
+同时检查托盘、提醒音、日历、拼音、NumPy 等按需导入的模块没有在启动时被导入。
+超出预算或提前导入了这些模块时退出码为 1。tests/test_import_time.py 在测试中做同样的检查。
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 只在首次使用时才导入的模块（顶层包名）
+DEFERRED = ("PIL", "pystray", "winsound", "ctypes", "calendar", "pypinyin", "numpy")
+BUDGET_MS = 50.0
+
+
+def run_import(module, *options):
+    # 允许写字节码缓存，否则每次都要重新编译，测到的是编译时间
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    return subprocess.run([sys.executable, *options, "-c", f"import {module}"],
+                          cwd=ROOT, env=env, capture_output=True, text=True)
+
+
+def import_profile(module):
+    """在新解释器中导入 module，返回 {模块名: (自身微秒, 累计微秒)}"""
+    res = run_import(module, "-X", "importtime")
+    if res.returncode != 0:
+        raise SystemExit(f"导入 {module} 失败:\n{res.stderr.strip().splitlines()[-1]}")
+    profile = {}
+    for line in res.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        try:
+            self_us, total_us = int(parts[0]), int(parts[1])
+        except ValueError:
+            continue    # 表头
+        profile[parts[2].strip()] = (self_us, total_us)
+    return profile
+
+
+def best_profile(module, runs):
+    """先导入一次写好字节码缓存，再取 runs 次中 module 累计耗时最少的一次"""
+    run_import(module)
+    best = None
+    for _ in range(runs):
+        profile = import_profile(module)
+        if best is None or profile[module][1] < best[module][1]:
+            best = profile
+    return best
+
+
+def deferred_imported(profile):
+    """profile 中属于按需导入的模块"""
+    return sorted({name for name in profile if name.split(".")[0] in DEFERRED})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="event_timer")
+    parser.add_argument("--budget-ms", type=float, default=BUDGET_MS, help="累计导入耗时上限（毫秒）")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="列出自身耗时最多的模块数")
+    args = parser.parse_args()
+
+    best = best_profile(args.module, args.runs)
+    total_ms = best[args.module][1] / 1000
+    print(f"{args.module} 累计导入耗时 {total_ms:.1f}ms（预算 {args.budget_ms:.0f}ms，{args.runs} 次取最小）")
+    for name, (self_us, _) in sorted(best.items(), key=lambda x: -x[1][0])[:args.top]:
+        print(f"  {self_us / 1000:>8.2f}ms  {name}")
+
+    failed = False
+    early = deferred_imported(best)
+    if early:
+        print(f"启动时导入了应按需导入的模块: {', '.join(early)}")
+        failed = True
+    if total_ms > args.budget_ms:
+        print(f"超出导入预算 {total_ms - args.budget_ms:.1f}ms")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
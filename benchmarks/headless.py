@@ -0,0 +1,241 @@
+"""在没有窗口的情况下驱动 EventTimerApp 的方法
+
+有可用显示（Windows/macOS，或 Linux 下 xvfb-run 提供的虚拟显示）时使用真实的 Tk 控件，
+否则用只记录调用的假控件代替 Treeview/Entry/Listbox。两种情况下被计时的都是应用自身的
+read_startup_data、update_history_display、update_dropdown_list 等方法，而不是它们的复制品。
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# ---------- 假控件 ----------
+class FakeRoot:
+    """代替 Tk 根窗口的 after()/after_cancel()：登记的回调由 pump() 执行"""
+
+    def __init__(self):
+        self.jobs = {}
+        self._next = 0
+
+    def after(self, ms, fn, *args):
+        self._next += 1
+        self.jobs[self._next] = (fn, args)
+        return self._next
+
+    def after_cancel(self, job):
+        self.jobs.pop(job, None)
+
+    def update(self):
+        """按登记顺序执行已登记的回调（不等待延时）"""
+        jobs, self.jobs = self.jobs, {}
+        for fn, args in jobs.values():
+            fn(*args)
+
+
+class FakeVar:
+    def __init__(self, value=""):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+    def set(self, value):
+        self.value = value
+
+
+class FakeTree:
+    """VirtualHistoryView 用到的 Treeview 接口"""
+    ROW_HEIGHT = 20
+
+    def __init__(self, height=600):
+        self.height = height
+        self.order = []
+        self.values = {}
+        self._focus = ""
+        self._selection = ()
+
+    def insert(self, parent, index, iid=None, values=()):
+        if index == "end":
+            self.order.append(iid)
+        else:
+            self.order.insert(index, iid)
+        self.values[iid] = values
+        return iid
+
+    def delete(self, *iids):
+        gone = set(iids)
+        self.order = [i for i in self.order if i not in gone]
+        for iid in iids:
+            self.values.pop(iid, None)
+
+    def get_children(self, item=""):
+        return tuple(self.order)
+
+    def item(self, iid, values=None):
+        if values is not None:
+            self.values[iid] = values
+        return {"values": self.values.get(iid)}
+
+    def bbox(self, iid):
+        return (0, self.ROW_HEIGHT + self.order.index(iid) * self.ROW_HEIGHT, 600, self.ROW_HEIGHT)
+
+    def winfo_height(self):
+        return self.height
+
+    def yview_moveto(self, fraction):
+        pass
+
+    def focus(self, iid=None):
+        if iid is None:
+            return self._focus
+        self._focus = iid
+
+    def selection(self):
+        return self._selection
+
+    def selection_set(self, iid):
+        self._selection = (iid,)
+
+
+class FakeScrollbar:
+    def set(self, lo, hi):
+        self.position = (lo, hi)
+
+
+class FakeEntry:
+    def __init__(self, text=""):
+        self.text = text
+
+    def get(self):
+        return self.text
+
+    def delete(self, first, last=None):
+        self.text = ""
+
+    def insert(self, index, text):
+        self.text += text
+
+
+class FakeFrame:
+    """历史记录区的 LabelFrame 或状态栏，只记录文字"""
+    def __init__(self):
+        self.text = ""
+
+    def config(self, text=""):
+        self.text = text
+
+
+class FakeListbox:
+    def __init__(self):
+        self.items = []
+
+    def delete(self, first, last=None):
+        self.items = []
+
+    def insert(self, index, item):
+        self.items.append(item)
+
+    def size(self):
+        return len(self.items)
+
+
+# ---------- 无界面的应用实例 ----------
+def open_display():
+    """有可用显示时返回隐藏的 Tk 根窗口，否则返回 None"""
+    import tkinter as tk
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        return None
+    root.withdraw()
+    return root
+
+
+def make_app(config_dir, backend='json', root=None):
+    """构造不带主窗口、托盘和定时器的 EventTimerApp
+
+    数据状态与正常启动一样由 init_state() 建立，只有历史表、输入框等控件换成隐藏窗口中的控件或假控件。
+    没有显示时根窗口换成 FakeRoot，after() 登记的回调由 pump() 执行。
+
+    导入 event_timer 只需要 tkinter（托盘等可选依赖按需导入），缺失时抛出 ImportError。
+    """
+    import event_timer
+
+    app = event_timer.EventTimerApp.__new__(event_timer.EventTimerApp)
+    app.root = root if root is not None else FakeRoot()
+    app.init_state(config_dir)
+    # 其他线程提交的命令由 pump() 代替 Tk 主循环执行
+    app.init_commands(lambda ms, fn: None, lambda: None)
+    app.writer.window = 0
+    app.history_backend = backend
+    app.show_dropdown = lambda: None
+    app.hide_dropdown = lambda: None
+
+    columns = ("event", "tags", "start", "end", "duration")
+    if root is not None:
+        import tkinter as tk
+        frame = tk.Frame(root, width=800, height=600)
+        frame.pack()
+        app.history_view = event_timer.VirtualHistoryView(
+            frame, columns, app.history_row_values, event_timer.history_sort_key)
+        app.specific_date_var = tk.StringVar(value="")
+        app.event_entry = tk.Entry(root)
+        app.dropdown_listbox = tk.Listbox(root)
+        app.hist_frame = tk.LabelFrame(root)
+        app.status_bar = tk.Label(root)
+        root.update_idletasks()
+    else:
+        view = event_timer.VirtualHistoryView.__new__(event_timer.VirtualHistoryView)
+        view.format_row = app.history_row_values
+        view.sort_key = event_timer.history_sort_key
+        view.rows = []
+        view.keys = []
+        view.offset = 0
+        view.window = (0, 0)
+        view.by_iid = {}
+        view.tree = FakeTree()
+        view.scrollbar = FakeScrollbar()
+        app.history_view = view
+        app.specific_date_var = FakeVar("")
+        app.event_entry = FakeEntry()
+        app.dropdown_listbox = FakeListbox()
+        app.hist_frame = FakeFrame()
+        app.status_bar = FakeFrame()
+    app.history_tree = app.history_view.tree
+    return app
+
+
+def load_app(app):
+    """走与后台加载相同的路径读取并接入历史、名称和标签（在当前线程中同步进行）"""
+    app.loaded_data = app.read_startup_data()
+    app.attach_loaded_data()
+
+
+def background_load(app, timeout=60.0):
+    """走正常启动的路径加载：加载线程读取数据，经命令队列交给当前线程接入，再分批填充历史表
+
+    返回命令队列的等待时间统计（CommandQueue.stats()）。这里每毫秒 pump() 一次，
+    统计的是命令从提交到被取出的时间，相当于真实主循环的响应延迟。
+    """
+    app.start_background_load()
+    deadline = time.monotonic() + timeout
+    while app.loading or app.fill_job is not None:
+        if time.monotonic() > deadline:
+            raise TimeoutError("后台加载超时")
+        time.sleep(0.001)
+        pump(app)
+    return app.commands.stats()
+
+
+def pump(app):
+    """执行其他线程已提交的命令和 after() 登记的回调（代替 Tk 主循环）"""
+    app.commands.drain()
+    app.root.update()
+
+
+def close_app(app):
+    if app.history_store is not None:
+        app.history_store.close()
+    app.writer.close()
@@ -0,0 +1,101 @@
+"""基准测试用的确定性合成数据：历史记录、事件名热度、标签计数、模板
+
+同一个 (n, seed) 总是生成完全相同的数据，不同机器、不同次运行的结果可以直接对比。
+"""
+import json
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from autocomplete import HALF_LIFE
+from history_records import TIME_FORMAT, format_duration, parse_tags
+from storage import JsonHistoryStore, SqliteHistoryStore
+
+
+TAGS = ["工作", "学习", "运动", "会议", "阅读", "编程", "家务", "娱乐"]
+EVENTS = ["开会", "写代码", "跑步", "看书", "整理文档", "回复邮件", "午休", "做饭"]
+BASE_TIME = datetime(2020, 1, 1, 8, 0, 0)
+
+
+def make_records(n, seed=42):
+    """n 条历史记录，开始时间大约每 7 分钟一条，事件名约 2400 种"""
+    rnd = random.Random(seed)
+    records = []
+    for i in range(n):
+        start = BASE_TIME + timedelta(minutes=i * 7 + rnd.randint(0, 5))
+        ms = rnd.randint(60, 3 * 3600) * 1000 + rnd.randint(0, 999)
+        tags = ", ".join(f"#{t}" for t in rnd.sample(TAGS, rnd.randint(0, 3)))
+        records.append({
+            "event": f"{rnd.choice(EVENTS)}{rnd.randint(0, 300)}",
+            "tags": tags,
+            "start_time": start.strftime(TIME_FORMAT),
+            "end_time": (start + timedelta(milliseconds=ms)).strftime(TIME_FORMAT),
+            "duration": format_duration(ms // 1000),
+            "duration_seconds": ms // 1000,
+            "duration_ms": ms
+        })
+    return records
+
+
+def make_names(records, seed=42):
+    """由历史记录推出事件名热度（与应用中 event_names.json 的格式相同）"""
+    rnd = random.Random(seed)
+    names = {}
+    for rec in records:
+        ts = datetime.strptime(rec["start_time"], TIME_FORMAT).timestamp()
+        data = names.get(rec["event"])
+        if data is None:
+            names[rec["event"]] = {"frecency": 1.0, "updated": ts}
+        else:
+            data["frecency"] = data["frecency"] * 2 ** ((data["updated"] - ts) / HALF_LIFE) + 1
+            data["updated"] = ts
+    # 再加一些只有热度、没有历史的名称
+    for i in range(len(names) // 10):
+        names[f"临时事件{i}"] = {"frecency": rnd.random() * 5, "updated": BASE_TIME.timestamp()}
+    return names
+
+
+def make_tags(records):
+    counts = {}
+    for rec in records:
+        for t in parse_tags(rec["tags"]):
+            counts[t] = counts.get(t, 0) + 1
+    return counts
+
+
+def make_templates(k=20, seed=42):
+    rnd = random.Random(seed)
+    return [{
+        "name": f"模板{i}",
+        "events": [{"name": rnd.choice(EVENTS), "tags": f"#{rnd.choice(TAGS)}"}
+                   for _ in range(rnd.randint(1, 6))]
+    } for i in range(k)]
+
+
+def write_json(path, data):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+
+
+def write_config(config_dir, n, seed=42, sqlite=False):
+    """在 config_dir 中写出与应用相同布局的全部配置文件，返回生成的历史记录"""
+    os.makedirs(config_dir, exist_ok=True)
+    records = make_records(n, seed)
+    store = JsonHistoryStore(os.path.join(config_dir, "events_history.json"))
+    try:
+        store.replace_all(records)
+    finally:
+        store.close()
+    if sqlite:
+        store = SqliteHistoryStore(os.path.join(config_dir, "events_history.db"))
+        try:
+            store.replace_all(records)
+        finally:
+            store.close()
+    write_json(os.path.join(config_dir, "event_names.json"), make_names(records, seed))
+    write_json(os.path.join(config_dir, "event_tags.json"), make_tags(records))
+    write_json(os.path.join(config_dir, "event_templates.json"), make_templates(seed=seed))
+    return records
@@ -0,0 +1,106 @@
+import queue
+import threading
+import time
+from collections import deque, namedtuple
+
+
+# ---------- 跨线程命令 ----------
+# 托盘菜单回调、写入线程的错误回报、后台加载、存储后端切换、分析和导出的进度通知都不在 Tk 线程中执行，不能直接操作界面或计时状态。
+# 它们只把命令放进队列并唤醒 Tk 线程，由 Tk 线程取出后调用对应的处理函数；队列为空时没有任何定时唤醒。
+SHOW_MAIN_WINDOW = "show_main_window"
+SHOW_SIMPLE_WINDOW = "show_simple_window"
+QUIT_APP = "quit_app"
+REPORT_SAVE_ERROR = "report_save_error"
+DATA_LOADED = "data_loaded"
+ANALYSIS_READY = "analysis_ready"
+EXPORT_PROGRESS = "export_progress"
+HISTORY_RANGE_LOADED = "history_range_loaded"
+HISTORY_SWITCHED = "history_switched"
+
+Command = namedtuple("Command", "kind args posted")
+
+
+class CommandQueue:
+    """线程安全的命令队列，在 Tk 主循环中按提交顺序执行
+
+    post() 可在任何线程调用；命令类型须先用 register() 登记处理函数（在 Tk 线程中执行）。
+    一批命令中的第一条调用 wake() 请 Tk 线程执行 drain()，之后到 drain() 开始取命令之前提交的命令不再唤醒。
+    start() 在主循环启动后执行一次 drain()，处理主循环启动前提交的命令。
+    记录每条命令从提交到执行的等待时间。
+    """
+    RECENT = 200     # 统计百分位用的最近命令数
+
+    def __init__(self, after, wake):
+        self.after = after
+        self.wake = wake
+        self.handlers = {}
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._woken = False      # 已请求 drain()、尚未开始执行
+        self.count = 0
+        self.max_latency = 0.0
+        self.total_latency = 0.0
+        self.recent = deque(maxlen=self.RECENT)
+
+    def register(self, kind, handler):
+        self.handlers[kind] = handler
+
+    def post(self, kind, *args):
+        if kind not in self.handlers:
+            raise ValueError(f"未登记的命令: {kind}")
+        self._queue.put(Command(kind, args, time.perf_counter()))
+        with self._lock:
+            if self._woken:
+                return
+            self._woken = True
+        self.wake()
+
+    def start(self):
+        self.after(0, self.drain)
+
+    def drain(self):
+        """执行队列中已有的全部命令（只能在 Tk 线程中调用）"""
+        with self._lock:
+            self._woken = False
+        while True:
+            try:
+                cmd = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            latency = time.perf_counter() - cmd.posted
+            self.count += 1
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+            self.recent.append(latency)
+            try:
+                self.handlers[cmd.kind](*cmd.args)
+            except:
+                import traceback    # 只在出错时导入（traceback 会带入 linecache、tokenize 等，拖慢启动）
+                traceback.print_exc()
+
+    def stats(self):
+        """命令等待时间统计（毫秒）"""
+        recent = sorted(self.recent)
+        p95 = recent[int(len(recent) * 0.95)] if recent else 0.0
+        return {
+            "count": self.count,
+            "mean_ms": self.total_latency / self.count * 1000 if self.count else 0.0,
+            "p95_ms": p95 * 1000,
+            "max_ms": self.max_latency * 1000,
+        }
+
+
+# ---------- 状态快照 ----------
+# 其他线程需要读取计时状态时（如托盘菜单文字）只读 Tk 线程发布的快照，
+# 快照由元组组成、不可修改，发布是一次属性赋值，读取方不会看到修改到一半的状态。
+EventSnapshot = namedtuple("EventSnapshot", "name status tags start_time accumulated_ns mono_start")
+AppSnapshot = namedtuple("AppSnapshot", "events hidden_to_tray")
+
+EMPTY_SNAPSHOT = AppSnapshot((), False)
+
+
+def snapshot_events(current_events, hidden_to_tray):
+    return AppSnapshot(tuple(
+        EventSnapshot(name, d["status"], d["tags"], d["start_time"], d["accumulated_ns"], d["mono_start"])
+        for name, d in current_events.items()
+    ), hidden_to_tray)
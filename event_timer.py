@@ -1,18 +1,33 @@
-import calendar
 import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog
 import json
 import os
 import sys
-from datetime import datetime, timedelta
+from datetime import date, datetime
 import threading
 import time
-from PIL import Image, ImageDraw
-import pystray
 import platform
-import ctypes
-import re
-import winsound
+import sqlite3
+from bisect import bisect_left
+import heapq
+
+from autocomplete import NameIndex, migrate_names
+from commands import (ANALYSIS_READY, DATA_LOADED, EMPTY_SNAPSHOT, EXPORT_PROGRESS, HISTORY_RANGE_LOADED,
+                      HISTORY_SWITCHED, QUIT_APP, REPORT_SAVE_ERROR, SHOW_MAIN_WINDOW, SHOW_SIMPLE_WINDOW, CommandQueue,
+                      snapshot_events)
+from history_analytics import HistoryAnalytics, load_numpy
+from history_export import EXPORT_FORMATS, export_history
+from history_index import format_day_range, month_range, parse_day_range, week_range
+from history_records import format_duration, parse_tags
+from history_shards import ShardedHistoryStore, import_json_shards
+from history_stats import UNTAGGED, StatsRollup, history_stamp
+from history_view import (offset_at_fraction, offset_showing, render_window, scrollbar_span, visible_rows,
+                          window_after_insert, window_after_remove, window_changes)
+from scheduling import DeadlineScheduler, TickScheduler, seconds_to_next_minute
+from timer_engine import (NAMES_CHANGED, PAUSED, RESUMED, SAVE_FAILED, STARTED, STOPPED,
+                          TAGS_CHANGED, TimerEngine)
+from storage import (JsonHistoryStore, SqliteHistoryStore, WriteBehindWriter,
+                     import_json_history, record_matches)
 
 class SimpleTimerWindow:
     """简易计时窗口（支持置顶、关闭、按钮状态）"""
@@ -20,6 +35,7 @@ class SimpleTimerWindow:
         self.main_app = main_app
         self.window = None
         self.topmost_var = tk.BooleanVar(value=True)
+        self.time_labels = {}    # 事件名 -> [时长标签, 当前文字]
 
     def create_window(self):
         if self.window is not None:
@@ -62,7 +78,7 @@ class SimpleTimerWindow:
         tk.Button(btn_frame, text="停止所有", command=self.stop_all_events,
                   bg=self.main_app.stop_color, fg="white", width=12, relief="flat").pack(side=tk.LEFT, padx=2)
 
-        self.update_timer()
+        self.main_app.ticker.kick()
         return self.window
 
     def toggle_topmost(self):
@@ -72,6 +88,7 @@ class SimpleTimerWindow:
     def update_events_list(self):
         for widget in self.events_frame.winfo_children():
             widget.destroy()
+        self.time_labels = {}
 
         if not self.main_app.current_events:
             tk.Label(self.events_frame, text="当前没有正在计时的事件",
@@ -99,7 +116,7 @@ class SimpleTimerWindow:
             time_label = tk.Label(frame, text=dur, bg=self.main_app.bg_color,
                                   fg=self.main_app.fg_color, width=8)
             time_label.pack(side=tk.LEFT, padx=(0,5))
-            data["simple_time_label"] = time_label
+            self.time_labels[name] = [time_label, dur]
 
             # 暂停/恢复按钮（统一根据主程序模式）
             if data["status"] == "running":
@@ -124,18 +141,10 @@ class SimpleTimerWindow:
                                  bg=self.main_app.stop_color, fg="white", width=4, relief="flat")
             stop_btn.pack(side=tk.RIGHT, padx=2)
 
-    def update_timer(self):
-        if self.window and self.window.winfo_exists():
-            for name, data in self.main_app.current_events.items():
-                if "simple_time_label" in data:
-                    dur = self.main_app.get_event_display_duration(name)
-                    data["simple_time_label"].config(text=dur)
-            self.window.after(1000, self.update_timer)
-
     def stop_all_events(self):
-        for name in list(self.main_app.current_events.keys()):
-            self.main_app.stop_single_timing(name)
-        self.update_events_list()
+        self.main_app.engine.stop_all()
+        if self.window:
+            self.update_events_list()
 
     def show_main_window(self):
         if self.window:
@@ -149,7 +158,205 @@ class SimpleTimerWindow:
             self.window = None
 
 
+def history_sort_key(ev):
+    """历史表排序：时长升序，时长相同时开始时间较新的在前（直接读取列，不格式化字符串）"""
+    return (ev.duration_seconds, -ev.start_wall)
+
+
+class VirtualHistoryView:
+    """虚拟化的历史记录表格
+
+    Treeview 中只保留视口内的行和少量预渲染行，滚动时按需换入换出，
+    因此重绘耗时和控件占用的内存与历史记录条数无关。
+    单条记录的新增/修改/删除只在排序位置上插入、更新或删除一行。
+    区间和偏移的计算在 history_view 中，这里只负责操作控件。
+    """
+    OVERSCAN = 10
+    DEFAULT_ROW_HEIGHT = 20
+
+    def __init__(self, parent, columns, format_row, sort_key):
+        self.format_row = format_row
+        self.sort_key = sort_key
+        self.rows = []           # 排好序的全部匹配记录
+        self.keys = []           # 与 rows 对应的排序键
+        self.offset = 0          # 视口第一行在 rows 中的位置
+        self.window = (0, 0)     # Treeview 中已渲染的区间 [lo, hi)
+        self.by_iid = {}         # 已渲染行的 iid -> 记录
+
+        self.tree = ttk.Treeview(parent, columns=columns, show="headings", style="Treeview")
+        self.scrollbar = ttk.Scrollbar(parent, orient=tk.VERTICAL, command=self.on_scrollbar)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        self.tree.bind("<Configure>", lambda e: self.render())
+        self.tree.bind("<MouseWheel>", self.on_mousewheel)
+        self.tree.bind("<Button-4>", lambda e: self.scroll_by(-3))
+        self.tree.bind("<Button-5>", lambda e: self.scroll_by(3))
+        self.tree.bind("<Up>", lambda e: self.move_selection(-1))
+        self.tree.bind("<Down>", lambda e: self.move_selection(1))
+        self.tree.bind("<Prior>", lambda e: self.move_selection(-self.visible_count()))
+        self.tree.bind("<Next>", lambda e: self.move_selection(self.visible_count()))
+        self.tree.bind("<Home>", lambda e: self.move_selection(-len(self.rows)))
+        self.tree.bind("<End>", lambda e: self.move_selection(len(self.rows)))
+
+    def set_rows(self, records):
+        keyed = sorted(((self.sort_key(r), r) for r in records), key=lambda x: x[0])
+        self.keys = [k for k, _ in keyed]
+        self.rows = [r for _, r in keyed]
+        self.render(rebuild=True)
+
+    def add_rows(self, records):
+        """把一批记录并入已排好序的行（分批填充时使用），只重绘视口内的行"""
+        keyed = sorted(((self.sort_key(r), r) for r in records), key=lambda x: x[0])
+        merged = list(heapq.merge(zip(self.keys, self.rows), keyed, key=lambda x: x[0]))
+        self.keys = [k for k, _ in merged]
+        self.rows = [r for _, r in merged]
+        self.render(rebuild=True)
+
+    def redraw(self):
+        """行不变，仅重新格式化已渲染的行（例如切换时间显示格式）"""
+        self.render(rebuild=True)
+
+    def record(self, iid):
+        return self.by_iid.get(iid)
+
+    def iid(self, rec):
+        """Treeview 行 id 即记录 id"""
+        return str(rec.id)
+
+    def index_of(self, rec):
+        key = self.sort_key(rec)
+        i = bisect_left(self.keys, key)
+        while i < len(self.rows) and self.keys[i] == key:
+            if self.rows[i] == rec:
+                return i
+            i += 1
+        return -1
+
+    # ---------- 增量更新 ----------
+    def insert_row(self, rec):
+        key = self.sort_key(rec)
+        i = bisect_left(self.keys, key)
+        self.rows.insert(i, rec)
+        self.keys.insert(i, key)
+        shift, window, shown = window_after_insert(self.window, i, self.visible_count() + self.OVERSCAN)
+        if shown:
+            self._insert_item(i - self.window[0], rec)
+        self.offset += shift
+        self.window = window
+        self.update_scrollbar()
+
+    def remove_row(self, rec):
+        i = self.index_of(rec)
+        if i < 0:
+            return
+        del self.rows[i]
+        del self.keys[i]
+        shift, window, shown = window_after_remove(self.window, i)
+        self.offset += shift
+        self.window = window
+        if shown:
+            iid = self.iid(rec)
+            self.tree.delete(iid)
+            self.by_iid.pop(iid, None)
+            lo, hi = window
+            if hi - lo < self.visible_count() and hi < len(self.rows):
+                # 区间内的行不够填满视口，从下方补齐
+                self.render()
+                return
+        self.update_scrollbar()
+
+    def update_row(self, rec):
+        iid = self.iid(rec)
+        if iid in self.by_iid:
+            self.tree.item(iid, values=self.format_row(rec))
+
+    def _insert_item(self, index, rec):
+        iid = self.iid(rec)
+        self.tree.insert("", index, iid=iid, values=self.format_row(rec))
+        self.by_iid[iid] = rec
+
+    def visible_count(self):
+        children = self.tree.get_children()
+        bbox = self.tree.bbox(children[0]) if children else None
+        if bbox:
+            top, row_h = bbox[1], bbox[3]
+        else:
+            row_h = self.DEFAULT_ROW_HEIGHT
+            top = row_h
+        return visible_rows(self.tree.winfo_height(), top, row_h)
+
+    def render(self, rebuild=False):
+        visible = self.visible_count()
+        self.offset, window = render_window(self.offset, len(self.rows), visible, self.OVERSCAN)
+        changes = None if rebuild else window_changes(self.window, window)
+        if changes is None:
+            self.tree.delete(*self.tree.get_children())
+            self.by_iid = {}
+            for i in range(*window):
+                self._insert_item(tk.END, self.rows[i])
+        else:
+            # 与上次渲染区间有重叠：只换入换出两端的差异行
+            removed, above, below = changes
+            for i in removed:
+                iid = self.iid(self.rows[i])
+                self.tree.delete(iid)
+                del self.by_iid[iid]
+            for i in above:
+                self._insert_item(0, self.rows[i])
+            for i in below:
+                self._insert_item(tk.END, self.rows[i])
+        self.window = window
+        self.tree.yview_moveto(0)
+        self.update_scrollbar(visible)
+
+    def update_scrollbar(self, visible=None):
+        if visible is None:
+            visible = self.visible_count()
+        self.scrollbar.set(*scrollbar_span(self.offset, len(self.rows), visible))
+
+    # ---------- 滚动 ----------
+    def scroll_to(self, offset):
+        self.offset = offset
+        self.render()
+        return "break"
+
+    def scroll_by(self, rows):
+        return self.scroll_to(self.offset + rows)
+
+    def on_scrollbar(self, action, value, unit=None):
+        if action == "moveto":
+            self.scroll_to(offset_at_fraction(value, len(self.rows)))
+        elif action == "scroll":
+            step = int(value)
+            if unit == "pages":
+                step *= self.visible_count()
+            self.scroll_by(step)
+
+    def on_mousewheel(self, event):
+        if platform.system() == "Darwin":
+            step = -event.delta
+        else:
+            step = -int(event.delta / 120) * 3
+        return self.scroll_by(step)
+
+    def move_selection(self, step):
+        if not self.rows:
+            return "break"
+        cur = self.record(self.tree.focus() or next(iter(self.tree.selection()), ""))
+        idx = self.index_of(cur) + step if cur is not None else self.offset
+        idx = max(0, min(len(self.rows) - 1, idx))
+        self.offset = offset_showing(self.offset, idx, self.visible_count())
+        self.render()
+        iid = self.iid(self.rows[idx])
+        self.tree.selection_set(iid)
+        self.tree.focus(iid)
+        return "break"
+
+
 class EventTimerApp:
+    HISTORY_FIRST_CHUNK = 2000    # 后台加载完成后第一批填充的记录数，之后每批翻倍
+
     def __init__(self, root):
         self.root = root
         self.is_dark_mode = self.detect_system_theme()
@@ -166,11 +373,52 @@ class EventTimerApp:
         self.setup_theme()
 
         # ---------- 数据变量 ----------
-        self.current_events = {}
+        self.init_state(config_dir)
+        self.engine.subscribe(self.on_timer_event)
+
+        # 其他线程（托盘、写入线程）的请求都经命令队列交给 Tk 线程执行
+        self.init_commands(self.root.after, self.wake_commands)
+        self.root.bind("<<Commands>>", lambda e: self.commands.drain())
+        self.snapshot = EMPTY_SNAPSHOT    # 供其他线程读取的计时状态快照
+        self.writer.on_error = lambda path, e: self.commands.post(REPORT_SAVE_ERROR, path)
+
+        self.simple_window = SimpleTimerWindow(self)
+
+        # 加载数据（设置决定历史存储后端，需最先读取）
+        self.load_settings()
+        self.writer.window = self.save_delay_ms / 1000
+        self.load_templates()
+        # 历史记录和由它派生的名称热度、标签计数在后台线程加载，窗口不必等它们；
+        # 加载期间照常计时，完成的记录由计时引擎暂存，加载完成后补写
+        self.start_background_load()
+
+        # 创建UI（所有周期性刷新都挂在同一个节拍上）
+        self.ticker = TickScheduler(self.root.after, self.root.after_cancel)
+        # 计时提醒：每个运行中事件一个截止时间，只在最近的截止时间唤醒
+        self.notifier = DeadlineScheduler(self.root.after, self.root.after_cancel, clock=time.monotonic)
+        self.title_text = None
+        self.create_widgets()
+        self.ticker.add("title", self.update_time_display)
+        self.ticker.add("timers", self.refresh_timer_labels)
+        self.ticker.add("snapshot", self.publish_snapshot)
+        self.commands.start()
+        self.root.protocol('WM_DELETE_WINDOW', self.hide_to_tray)
+        self.create_system_tray()
+        self.root.after(100, self.ensure_window_visibility)
+        self.bind_events()
+
+    def init_state(self, config_dir):
+        """与界面无关的数据状态：文件路径、计时引擎、写入线程和默认设置
+
+        不创建任何 Tk 对象，基准测试和测试可以在没有窗口的情况下调用。
+        """
+        self.data_lock = threading.RLock()
+        # 计时状态机：进行中的事件、历史追加、名称热度和标签计数都由它负责，界面订阅它的变更事件
+        self.engine = TimerEngine(lock=self.data_lock)
+        self.current_events = self.engine.current_events
         self.events_history = []
         self.event_names_data = {}
         self.event_templates = []
-        self.tags_data = {}
 
         self.config_dir = config_dir
         self.data_file = os.path.join(config_dir, "events_history.json")
@@ -178,11 +426,21 @@ class EventTimerApp:
         self.templates_file = os.path.join(config_dir, "event_templates.json")
         self.tags_file = os.path.join(config_dir, "event_tags.json")
         self.settings_file = os.path.join(config_dir, "settings.json")
+        self.db_file = os.path.join(config_dir, "events_history.db")
+        self.archive_file = os.path.join(config_dir, "events_history.archive")
+        self.shard_dir = os.path.join(config_dir, "history")
+        self.stats_file = os.path.join(config_dir, "event_stats.json")
+        self.history_archive = None    # 可选的二进制归档（供统计扫描），随历史存储增量维护
+        self.stats = None              # 按日/标签/事件的统计汇总，随历史存储增量维护
+
+        # 后台合并写入：名称/标签/模板/设置/历史日志都由写入线程落盘
+        self.save_delay_ms = 1000
+        self.writer = WriteBehindWriter(self.save_delay_ms / 1000, lock=self.data_lock)
 
         self.tray_icon = None
+        self.tray_error = None         # 托盘不可用的原因，显示在状态栏
         self.is_hidden_to_tray = False
         self.dropdown_visible = False
-        self.notification_thread = None
         self.notification_active = False
         self.notification_interval = 30
         self.auto_stop_on_notification = False
@@ -190,36 +448,53 @@ class EventTimerApp:
         # 暂停模式（A 或 B）
         self.pause_mode = 'A'
 
+        # 历史存储后端（json、sqlite 或 sharded）
+        self.history_backend = 'json'
+        self.use_history_archive = False
+
+        # 输入补全最多保留的事件名数量
+        self.max_event_names = 1000
+
         # 模板执行状态
         self.current_template = None
         self.template_event_index = 0
         self.template_events_queue = []
 
-        self.simple_window = SimpleTimerWindow(self)
-
         # 历史记录显示设置
         self.show_full_datetime = False
         self.selected_tags_filter = set()   # 标签多选筛选
-
-        # 加载数据
-        self.load_history()
-        self.load_event_names()
-        self.load_templates()
-        self.load_tags()
-        self.load_settings()
-
-        # 创建UI
-        self.create_widgets()
-        self.update_time_display()
-        self.root.protocol('WM_DELETE_WINDOW', self.hide_to_tray)
-        self.create_system_tray()
-        self.root.after(100, self.ensure_window_visibility)
-        self.bind_events()
-        self.start_notification_checker()
+        self.tag_filter_match_all = False   # True: 需包含全部所选标签；False: 任一即可
+        self.active_filter = (set(), None, False)  # 当前历史表使用的 (标签, 日期, 全部匹配) 筛选
+
+        # 后台加载状态
+        self.loading = False
+        self.loaded_data = None
+        self.fill_job = None
+        self.range_loads = set()    # 正在后台读取的日期范围
+
+        # 存储后端切换状态
+        self.switching_backend = None   # 正在切换到的后端
+        self.switch_result = None
+        self.switch_changes = []        # 导入期间旧存储的变更 (类型, 记录 id, 记录内容)
+        self.backend_buttons = []       # 设置窗口中的后端选项，切换期间停用
+
+    def init_commands(self, after, wake):
+        """建立命令队列并登记各命令的处理函数"""
+        self.commands = CommandQueue(after, wake)
+        self.commands.register(SHOW_MAIN_WINDOW, self.show_main_window)
+        self.commands.register(SHOW_SIMPLE_WINDOW, self.show_simple_window)
+        self.commands.register(QUIT_APP, self.quit_app)
+        self.commands.register(REPORT_SAVE_ERROR, self.report_save_error)
+        self.commands.register(DATA_LOADED, self.on_data_loaded)
+        self.commands.register(ANALYSIS_READY, self.on_analysis_ready)
+        self.commands.register(EXPORT_PROGRESS, self.on_export_progress)
+        self.commands.register(HISTORY_RANGE_LOADED, self.on_history_range_loaded)
+        self.commands.register(HISTORY_SWITCHED, self.on_history_switched)
 
     # ---------- 工具方法 ----------
     def ensure_window_visibility(self):
         if platform.system() == "Windows":
+            import ctypes
             hwnd = self.root.winfo_id()
             ctypes.windll.user32.ShowWindow(hwnd, 1)
 
@@ -302,6 +577,7 @@ class EventTimerApp:
 
     def create_default_icon(self):
         try:
+            from PIL import Image, ImageDraw
             img = Image.new('RGB', (32, 32), color=self.accent_color)
             draw = ImageDraw.Draw(img)
             draw.ellipse([4, 4, 28, 28], outline='white', width=2)
@@ -395,6 +671,7 @@ class EventTimerApp:
         # ---------- 历史记录区域 ----------
         hist_frame = tk.LabelFrame(main, text="历史记录", bg=self.bg_color, fg=self.fg_color)
         hist_frame.pack(fill=tk.BOTH, expand=True)
+        self.hist_frame = hist_frame
 
         # ---------- 历史记录筛选栏（修复日期输入框 + 日历按钮）----------
         filter_bar = tk.Frame(hist_frame, bg=self.bg_color)
@@ -422,7 +699,7 @@ class EventTimerApp:
         self.specific_date_entry = tk.Entry(
             date_frame,
             textvariable=self.specific_date_var,
-            width=12,
+            width=21,
             bg=self.entry_bg,
             fg=self.entry_fg,
             relief="sunken",
@@ -453,6 +730,9 @@ class EventTimerApp:
         # 重置按钮
         tk.Button(filter_bar, text="重置", command=self.reset_filters,
                   bg=self.button_bg, fg=self.button_fg, relief="flat", width=5).pack(side=tk.LEFT, padx=2)
+        # 导出按钮：按当前筛选条件导出
+        tk.Button(filter_bar, text="导出", command=self.export_filtered_history,
+                  bg=self.accent_color, fg="white", relief="flat", width=5).pack(side=tk.LEFT, padx=2)
 
         # Treeview
         style = ttk.Style()
@@ -463,7 +743,8 @@ class EventTimerApp:
         style.map('Treeview', background=[('selected', self.tree_sel_bg)])
 
         cols = ("事件名称", "标签", "开始时间", "结束时间", "持续时间")
-        self.history_tree = ttk.Treeview(hist_frame, columns=cols, show="headings", style="Treeview")
+        self.history_view = VirtualHistoryView(hist_frame, cols, self.history_row_values, history_sort_key)
+        self.history_tree = self.history_view.tree
         for col in cols:
             self.history_tree.heading(col, text=col, anchor="center")
             if col == "事件名称":
@@ -476,11 +757,6 @@ class EventTimerApp:
         self.history_tree.heading("开始时间", command=lambda: self.toggle_datetime_format("start"))
         self.history_tree.heading("结束时间", command=lambda: self.toggle_datetime_format("end"))
 
-        hist_scroll = ttk.Scrollbar(hist_frame, orient=tk.VERTICAL, command=self.history_tree.yview)
-        self.history_tree.configure(yscrollcommand=hist_scroll.set)
-        self.history_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        hist_scroll.pack(side=tk.RIGHT, fill=tk.Y)
-
         self.create_history_context_menu()
 
         # 底部状态栏
@@ -489,6 +765,10 @@ class EventTimerApp:
 
         tk.Button(bottom, text="清空历史", command=self.clear_history,
                   bg=self.clear_color, fg="white", width=15, relief="flat").pack(side=tk.LEFT, padx=(0,10))
+        tk.Button(bottom, text="统计", command=self.show_stats_window,
+                  bg=self.accent_color, fg="white", width=15, relief="flat").pack(side=tk.LEFT, padx=(0,10))
+        tk.Button(bottom, text="分析", command=self.show_analysis_window,
+                  bg=self.accent_color, fg="white", width=15, relief="flat").pack(side=tk.LEFT, padx=(0,10))
         tk.Button(bottom, text="设置", command=self.show_settings_window,
                   bg=self.accent_color, fg="white", width=15, relief="flat").pack(side=tk.LEFT, padx=(0,10))
         tk.Button(bottom, text="打开配置文件夹", command=self.open_config_folder,
@@ -498,6 +778,9 @@ class EventTimerApp:
                                    bg=self.button_bg, fg=self.fg_color)
         self.status_bar.pack(side=tk.LEFT, fill=tk.X, expand=True)
 
+        if self.loading:
+            self.status_bar.config(text="正在加载历史记录…")
+        self.show_history_progress()
         self.update_history_display()
 
     # ---------- 标签一键清空 ----------
@@ -507,7 +790,7 @@ class EventTimerApp:
     # ---------- 日期格式切换 ----------
     def toggle_datetime_format(self, col_type):
         self.show_full_datetime = not self.show_full_datetime
-        self.update_history_display()
+        self.history_view.redraw()
 
     # ---------- 特定日期筛选 ----------
     def apply_specific_date_filter(self):
@@ -517,7 +800,7 @@ class EventTimerApp:
     def show_tag_filter_dialog(self):
         win = tk.Toplevel(self.root)
         win.title("标签筛选")
-        win.geometry("300x400")
+        win.geometry("300x430")
         win.configure(bg=self.bg_color)
         win.transient(self.root)
         win.grab_set()
@@ -537,6 +820,16 @@ class EventTimerApp:
             if tag in self.selected_tags_filter:
                 lb.selection_set(i)
 
+        match_var = tk.BooleanVar(value=self.tag_filter_match_all)
+        mode_frame = tk.Frame(win, bg=self.bg_color)
+        mode_frame.pack(fill=tk.X, padx=10)
+        tk.Radiobutton(mode_frame, text="包含任一标签", variable=match_var, value=False,
+                       bg=self.bg_color, fg=self.fg_color, selectcolor=self.bg_color,
+                       activebackground=self.bg_color).pack(side=tk.LEFT)
+        tk.Radiobutton(mode_frame, text="包含全部标签", variable=match_var, value=True,
+                       bg=self.bg_color, fg=self.fg_color, selectcolor=self.bg_color,
+                       activebackground=self.bg_color).pack(side=tk.LEFT, padx=(10, 0))
+
         btnf = tk.Frame(win, bg=self.bg_color)
         btnf.pack(fill=tk.X, pady=10)
 
@@ -551,17 +844,19 @@ class EventTimerApp:
         tk.Button(btnf, text="全不选", command=clear_all,
                   bg=self.button_bg, fg=self.button_fg).pack(side=tk.LEFT, padx=5)
         tk.Button(btnf, text="确定",
-                  command=lambda: self.apply_tag_filter(lb, win),
+                  command=lambda: self.apply_tag_filter(lb, win, match_var.get()),
                   bg=self.accent_color, fg="white").pack(side=tk.RIGHT, padx=5)
         tk.Button(btnf, text="取消", command=win.destroy,
                   bg=self.button_bg, fg=self.button_fg).pack(side=tk.RIGHT, padx=5)
 
-    def apply_tag_filter(self, listbox, win):
+    def apply_tag_filter(self, listbox, win, match_all=False):
         sel = listbox.curselection()
         self.selected_tags_filter = {listbox.get(i) for i in sel}
+        self.tag_filter_match_all = match_all
         win.destroy()
         if self.selected_tags_filter:
-            self.filter_tags_label.config(text=f"筛选标签: {', '.join(sorted(self.selected_tags_filter))}")
+            joiner = " + " if match_all else ", "
+            self.filter_tags_label.config(text=f"筛选标签: {joiner.join(sorted(self.selected_tags_filter))}")
         else:
             self.filter_tags_label.config(text="")
         self.update_history_display()
@@ -570,7 +865,7 @@ class EventTimerApp:
     def show_settings_window(self):
         win = tk.Toplevel(self.root)
         win.title("设置")
-        win.geometry("450x450")
+        win.geometry("450x690")
         win.configure(bg=self.bg_color)
         win.transient(self.root)
         win.grab_set()
@@ -630,11 +925,49 @@ class EventTimerApp:
         full_dt_var = tk.BooleanVar(value=self.show_full_datetime)
         def on_full_dt():
             self.show_full_datetime = full_dt_var.get()
-            self.update_history_display()
+            self.history_view.redraw()
         tk.Checkbutton(hist_frame, text="默认显示完整日期时间", variable=full_dt_var,
                        command=on_full_dt,
                        bg=self.bg_color, fg=self.fg_color, selectcolor=self.bg_color).pack(anchor="w", padx=10)
 
+        # --- 输入补全 ---
+        names_frame = tk.LabelFrame(win, text="输入补全", bg=self.bg_color, fg=self.fg_color)
+        names_frame.pack(fill=tk.X, padx=10, pady=5)
+
+        cap_frame = tk.Frame(names_frame, bg=self.bg_color)
+        cap_frame.pack(fill=tk.X, padx=10, pady=5)
+        tk.Label(cap_frame, text="最多保留事件名:", bg=self.bg_color, fg=self.fg_color).pack(side=tk.LEFT)
+        cap_var = tk.StringVar(value=str(self.max_event_names))
+        tk.Entry(cap_frame, textvariable=cap_var, width=10,
+                 bg=self.entry_bg, fg=self.entry_fg).pack(side=tk.LEFT, padx=5)
+
+        # --- 历史存储 ---
+        store_frame = tk.LabelFrame(win, text="历史存储", bg=self.bg_color, fg=self.fg_color)
+        store_frame.pack(fill=tk.X, padx=10, pady=5)
+
+        backend_var = tk.StringVar(value=self.switching_backend or self.history_backend)
+        self.backend_buttons = []
+        for value, text in (('json', "JSON（快照 + 追加日志）"),
+                            ('sqlite', "SQLite（索引查询，适合大量历史）"),
+                            ('sharded', "按月分片（启动只加载最近两个月，旧月份压缩）")):
+            button = tk.Radiobutton(store_frame, text=text, variable=backend_var,
+                                    value=value, bg=self.bg_color, fg=self.fg_color, selectcolor=self.bg_color,
+                                    activebackground=self.bg_color)
+            button.pack(anchor="w", padx=10, pady=2)
+            self.backend_buttons.append(button)
+        self.update_backend_buttons()
+
+        archive_var = tk.BooleanVar(value=self.use_history_archive)
+        tk.Checkbutton(store_frame, text="维护二进制归档（加快多年历史的分析）", variable=archive_var,
+                       bg=self.bg_color, fg=self.fg_color, selectcolor=self.bg_color).pack(anchor="w", padx=10)
+
+        delay_frame = tk.Frame(store_frame, bg=self.bg_color)
+        delay_frame.pack(fill=tk.X, padx=10, pady=5)
+        tk.Label(delay_frame, text="合并写入间隔(毫秒):", bg=self.bg_color, fg=self.fg_color).pack(side=tk.LEFT)
+        delay_var = tk.StringVar(value=str(self.save_delay_ms))
+        tk.Entry(delay_frame, textvariable=delay_var, width=10,
+                 bg=self.entry_bg, fg=self.entry_fg).pack(side=tk.LEFT, padx=5)
+
         # --- 保存按钮 ---
         def save_all():
             try:
@@ -644,16 +977,26 @@ class EventTimerApp:
                 self.notification_interval = iv
             except:
                 self.notification_interval = 30
+            try:
+                self.save_delay_ms = max(0, min(60000, int(delay_var.get())))
+            except:
+                self.save_delay_ms = 1000
+            self.writer.window = self.save_delay_ms / 1000
+            try:
+                self.max_event_names = max(50, min(100000, int(cap_var.get())))
+            except:
+                self.max_event_names = 1000
+            with self.data_lock:
+                if self.name_index is not None and self.name_index.trim(self.max_event_names):
+                    self.save_event_names()
 
-            was_active = self.notification_active
             self.notification_active = notify_enable_var.get()
             self.auto_stop_on_notification = auto_stop_var.get()
             self.pause_mode = self.pause_mode_var.get()
-
-            if self.notification_active and not was_active:
-                self.start_notification_checker()
-            elif not self.notification_active and was_active:
-                self.notification_active = False
+            self.switch_history_backend(backend_var.get())
+            self.set_history_archive(archive_var.get())
+            # 提醒间隔或开关变了：按新设置重新计算所有事件的提醒时间
+            self.rearm_notifications()
 
             self.save_settings()
             win.destroy()
@@ -707,35 +1050,8 @@ class EventTimerApp:
 
     def update_dropdown_list(self):
         text = self.event_entry.get().strip()
-        items = []
-        if text:
-            matches = []
-            for name, data in self.event_names_data.items():
-                score = 0
-                if name == text:
-                    score += 1000
-                elif name.startswith(text):
-                    score += 500
-                elif text in name:
-                    score += 100
-                score += data.get("count", 0) * 10
-                last = data.get("last_used", "1970-01-01 00:00:00")
-                try:
-                    days = (datetime.now() - datetime.strptime(last, "%Y-%m-%d %H:%M:%S")).days
-                    if days < 30:
-                        score += (30 - days) * 5
-                except:
-                    pass
-                if score > 0:
-                    matches.append((name, score))
-            matches.sort(key=lambda x: x[1], reverse=True)
-            items = [m[0] for m in matches[:20]]
-        else:
-            if self.event_names_data:
-                items = sorted(self.event_names_data.items(),
-                               key=lambda x: (x[1].get("count", 0), x[1].get("last_used", "")),
-                               reverse=True)[:20]
-                items = [i[0] for i in items]
+        # 名称索引随历史一起在后台加载，加载完成前没有补全
+        items = self.name_index.search(text) if self.name_index is not None else []
 
         self.dropdown_listbox.delete(0, tk.END)
         if items:
@@ -806,17 +1122,7 @@ class EventTimerApp:
 
     # ---------- 标签系统 ----------
     def parse_tags(self, tag_str):
-        if not tag_str:
-            return []
-        tags = set()
-        for part in tag_str.split(','):
-            for sub in part.split():
-                t = sub.strip()
-                if t:
-                    if t.startswith('#'):
-                        t = t[1:]
-                    tags.add(t)
-        return list(tags)
+        return parse_tags(tag_str)
 
     def show_tag_manager(self):
         """标签管理器（多选、批量添加）"""
@@ -905,10 +1211,11 @@ class EventTimerApp:
         def add_tag():
             t = new_entry.get().strip()
             if t:
-                if t not in self.tags_data:
-                    self.tags_data[t] = 0
-                else:
-                    self.tags_data[t] += 1
+                with self.data_lock:
+                    if t not in self.tags_data:
+                        self.tags_data[t] = 0
+                    else:
+                        self.tags_data[t] += 1
                 self.save_tags()
                 lb.delete(0, tk.END)
                 for tag, cnt in sorted(self.tags_data.items(), key=lambda x: x[1], reverse=True):
@@ -930,9 +1237,10 @@ class EventTimerApp:
                 tag = full.split(' (')[0]
                 to_del.append(tag)
             if messagebox.askyesno("确认", f"删除选中的 {len(to_del)} 个标签？"):
-                for tag in to_del:
-                    if tag in self.tags_data:
-                        del self.tags_data[tag]
+                with self.data_lock:
+                    for tag in to_del:
+                        if tag in self.tags_data:
+                            del self.tags_data[tag]
                 self.save_tags()
                 lb.delete(0, tk.END)
                 for tag, cnt in sorted(self.tags_data.items(), key=lambda x: x[1], reverse=True):
@@ -950,6 +1258,39 @@ class EventTimerApp:
         pass
 
     # ---------- 核心计时逻辑 ----------
+    # 状态机在 TimerEngine 中，这些属性直接读写计时引擎持有的数据
+    @property
+    def history_store(self):
+        return self.engine.history_store
+
+    @history_store.setter
+    def history_store(self, store):
+        self.engine.history_store = store
+
+    @property
+    def tags_data(self):
+        return self.engine.tags_data
+
+    @tags_data.setter
+    def tags_data(self, data):
+        self.engine.tags_data = data
+
+    @property
+    def name_index(self):
+        return self.engine.name_index
+
+    @name_index.setter
+    def name_index(self, index):
+        self.engine.name_index = index
+
+    @property
+    def max_event_names(self):
+        return self.engine.max_names
+
+    @max_event_names.setter
+    def max_event_names(self, cap):
+        self.engine.max_names = cap
+
     def start_timing(self):
         name = self.event_entry.get().strip()
         if not name:
@@ -960,71 +1301,38 @@ class EventTimerApp:
             self.event_entry.delete(0, tk.END)
             return
 
-        start = datetime.now()
-        tags = self.tag_entry.get().strip()
-
-        self.current_events[name] = {
-            "start_time": start,
-            "original_start_time": start,
-            "tags": tags,
-            "from_template": False,
-            "status": "running",
-            "accumulated_seconds": 0,
-            "paused_time": None
-        }
-
-        if name in self.event_names_data:
-            self.event_names_data[name]["count"] += 1
-        else:
-            self.event_names_data[name] = {"count": 1}
-        self.event_names_data[name]["last_used"] = start.strftime("%Y-%m-%d %H:%M:%S")
-        self.save_event_names()
-
-        parsed = self.parse_tags(tags)
-        for t in parsed:
-            self.tags_data[t] = self.tags_data.get(t, 0) + 1
-        self.save_tags()
-
+        self.engine.start(name, self.tag_entry.get().strip())
         self.event_entry.delete(0, tk.END)
         self.hide_dropdown()
         self.status_bar.config(text=f"开始计时: {name}")
-        self.update_tray_tooltip()
-        self.add_timer_display(name, start, parsed)
 
         if self.current_template and self.template_event_index >= len(self.template_events_queue):
             self.current_template = None
             self.template_event_index = 0
             self.template_events_queue = []
 
-    def start_timing_from_template(self):
-        name = self.event_entry.get().strip()
-        if not name or name in self.current_events:
-            return
-        start = datetime.now()
-        tags = self.tag_entry.get().strip()
-        self.current_events[name] = {
-            "start_time": start,
-            "original_start_time": start,
-            "tags": tags,
-            "from_template": True,
-            "status": "running",
-            "accumulated_seconds": 0,
-            "paused_time": None
-        }
-        if name in self.event_names_data:
-            self.event_names_data[name]["count"] += 1
-        else:
-            self.event_names_data[name] = {"count": 1}
-        self.event_names_data[name]["last_used"] = start.strftime("%Y-%m-%d %H:%M:%S")
-        self.save_event_names()
-        parsed = self.parse_tags(tags)
-        for t in parsed:
-            self.tags_data[t] = self.tags_data.get(t, 0) + 1
-        self.save_tags()
-        self.event_entry.delete(0, tk.END)
-        self.hide_dropdown()
-        self.add_timer_display(name, start, parsed)
-        self.update_tray_tooltip()
+    def on_timer_event(self, kind, name, info):
+        """计时引擎变更事件 -> 刷新界面、保存数据"""
+        if kind == STARTED:
+            self.add_timer_display(name, info["start"], self.parse_tags(info["tags"]))
+            self.update_tray_tooltip()
+        elif kind == PAUSED or kind == RESUMED:
+            self.update_single_timer_display(name)
+            if kind == PAUSED:
+                text = f"事件已暂停(A): {name}" if info["mode"] == 'A' else f"事件已暂停(B): {name} (段已记录)"
+            else:
+                text = f"事件已恢复: {name}" if info["mode"] == 'A' else f"事件已恢复(分段): {name}"
+            self.status_bar.config(text=text)
+            if self.simple_window.window:
+                self.simple_window.update_events_list()
+        elif kind == STOPPED:
+            self.on_timer_stopped(name, info)
+        elif kind == NAMES_CHANGED:
+            self.save_event_names()
+        elif kind == TAGS_CHANGED:
+            self.save_tags()
+        elif kind == SAVE_FAILED:
+            messagebox.showerror("保存错误", "无法保存历史记录")
 
     def add_timer_display(self, name, start, tags):
         frame = tk.Frame(self.scrollable_frame, bg=self.bg_color)
@@ -1058,6 +1366,7 @@ class EventTimerApp:
         self.timer_widgets[name] = {
             "frame": frame,
             "label": timer_label,
+            "text": "0h00m",
             "pause_btn": pause_btn,
             "stop": stop_btn,
             "start_time": start
@@ -1065,13 +1374,19 @@ class EventTimerApp:
         self.update_single_timer_display(name)
 
     def update_single_timer_display(self, name):
+        """状态变化时立即刷新一个事件的时长和按钮（周期刷新由 refresh_timer_labels 负责）"""
+        # 事件数或运行状态变了：标题、下一次节拍和提醒时间都要重新计算
+        self.ticker.kick()
+        self.arm_notification(name)
         if name not in self.timer_widgets or name not in self.current_events:
             return
         w = self.timer_widgets[name]
         d = self.current_events[name]
 
         dur = self.get_event_display_duration(name)
-        w["label"].config(text=dur)
+        if w["text"] != dur:
+            w["label"].config(text=dur)
+            w["text"] = dur
 
         if d["status"] == "running":
             w["pause_btn"].config(text="暂停", command=lambda n=name: self.pause_event_by_mode(n),
@@ -1082,156 +1397,65 @@ class EventTimerApp:
                                   bg=self.start_color, state=tk.NORMAL)
             w["stop"].config(state=tk.NORMAL)
 
-        self.root.after(1000, lambda: self.update_single_timer_display(name))
+    def refresh_timer_labels(self):
+        """节拍回调：一次遍历刷新主窗口和简易窗口中的全部计时标签
+
+        只有格式化后的文字变化时才调用 config；返回到最近一个运行中事件跨过整分钟的秒数。
+        """
+        now = self.engine.monotonic()
+        simple_visible = self.simple_window.window is not None
+        delay = None
+        for name, d in self.current_events.items():
+            total = self.get_event_elapsed_seconds(name, now)
+            text = self.format_duration(total)
+            w = self.timer_widgets.get(name)
+            if w is not None and w["text"] != text:
+                w["label"].config(text=text)
+                w["text"] = text
+            sw = self.simple_window.time_labels.get(name) if simple_visible else None
+            if sw is not None and sw[1] != text:
+                try:
+                    sw[0].config(text=text)
+                    sw[1] = text
+                except tk.TclError:
+                    pass
+            if d["status"] == "running":
+                wait = seconds_to_next_minute(total)
+                if delay is None or wait < delay:
+                    delay = wait
+        return delay
+
+    def get_event_elapsed_seconds(self, name, now=None):
+        return self.engine.elapsed_seconds(name, now)
 
     def get_event_display_duration(self, name):
         if name not in self.current_events:
             return "0h00m"
-        d = self.current_events[name]
-        if d["status"] == "running":
-            now = datetime.now()
-            el = (now - d["start_time"]).total_seconds()
-            total = d["accumulated_seconds"] + el
-        else:
-            total = d["accumulated_seconds"]
-        return self.format_duration(total)
+        return self.format_duration(self.get_event_elapsed_seconds(name))
 
     # ---------- 暂停模式统一接口 ----------
     def pause_event_by_mode(self, name):
-        if self.pause_mode == 'A':
-            self.pause_event_a(name)
-        else:
-            self.pause_event_b(name)
+        self.engine.pause(name, self.pause_mode)
 
     def resume_event_by_mode(self, name):
-        if self.pause_mode == 'A':
-            self.resume_event_a(name)
-        else:
-            self.resume_event_b(name)
-
-    def pause_event_a(self, name):
-        if name not in self.current_events:
-            return
-        d = self.current_events[name]
-        if d["status"] != "running":
-            return
-        now = datetime.now()
-        el = (now - d["start_time"]).total_seconds()
-        d["accumulated_seconds"] += el
-        d["status"] = "paused_a"
-        d["paused_time"] = now
-        self.status_bar.config(text=f"事件已暂停(A): {name}")
-        if self.simple_window.window:
-            self.simple_window.update_events_list()
-
-    def resume_event_a(self, name):
-        if name not in self.current_events:
-            return
-        d = self.current_events[name]
-        if d["status"] != "paused_a":
-            return
-        d["start_time"] = datetime.now()
-        d["status"] = "running"
-        d["paused_time"] = None
-        self.status_bar.config(text=f"事件已恢复: {name}")
-        if self.simple_window.window:
-            self.simple_window.update_events_list()
+        self.engine.resume(name)
 
-    def pause_event_b(self, name):
-        if name not in self.current_events:
-            return
-        d = self.current_events[name]
-        if d["status"] != "running":
-            return
-        now = datetime.now()
-        el = (now - d["start_time"]).total_seconds()
-        d["accumulated_seconds"] += el
-        dur_str = self.format_duration(el)
-        rec = {
-            "event": name,
-            "tags": d["tags"],
-            "start_time": d["start_time"].strftime("%Y-%m-%d %H:%M:%S"),
-            "end_time": now.strftime("%Y-%m-%d %H:%M:%S"),
-            "duration": dur_str,
-            "duration_seconds": int(el)
-        }
-        self.events_history.append(rec)
-        self.save_history()
-        d["status"] = "paused_b"
-        d["start_time"] = None
-        self.status_bar.config(text=f"事件已暂停(B): {name} (段已记录)")
-        self.update_history_display()
-        if self.simple_window.window:
-            self.simple_window.update_events_list()
-
-    def resume_event_b(self, name):
-        if name not in self.current_events:
-            return
-        old = self.current_events[name]
-        if old["status"] != "paused_b":
-            return
-        start = datetime.now()
-        tags = old["tags"]
-        self.current_events[name] = {
-            "start_time": start,
-            "original_start_time": old["original_start_time"],
-            "tags": tags,
-            "from_template": old.get("from_template", False),
-            "status": "running",
-            "accumulated_seconds": old["accumulated_seconds"],
-            "paused_time": None
-        }
-        if name in self.event_names_data:
-            self.event_names_data[name]["count"] += 1
-        else:
-            self.event_names_data[name] = {"count": 1}
-        self.event_names_data[name]["last_used"] = start.strftime("%Y-%m-%d %H:%M:%S")
-        self.save_event_names()
-        self.status_bar.config(text=f"事件已恢复(分段): {name}")
-        if name in self.timer_widgets:
-            self.update_single_timer_display(name)
-        if self.simple_window.window:
-            self.simple_window.update_events_list()
     # ---------- 停止事件 ----------
-    def stop_single_timing(self, name):
-        if name not in self.current_events:
-            return
-        d = self.current_events[name]
-        if d["status"] == "running":
-            end = datetime.now()
-            el = (end - d["start_time"]).total_seconds()
-            total = d["accumulated_seconds"] + el
-        elif d["status"] == "paused_a":
-            end = d["paused_time"] or datetime.now()
-            total = d["accumulated_seconds"]
-        else:  # paused_b
-            end = datetime.now()
-            total = d["accumulated_seconds"]
-
-        dur_str = self.format_duration(total)
-        start_dt = d.get("original_start_time", d["start_time"] or d["paused_time"] or datetime.now())
-
-        rec = {
-            "event": name,
-            "tags": d["tags"],
-            "start_time": start_dt.strftime("%Y-%m-%d %H:%M:%S"),
-            "end_time": end.strftime("%Y-%m-%d %H:%M:%S"),
-            "duration": dur_str,
-            "duration_seconds": int(total)
-        }
-        self.events_history.append(rec)
-        self.save_history()
+    def stop_single_timing(self, name, elapsed=None):
+        """停止事件并写入历史；elapsed 为指定的总时长（秒，默认按现在停止）"""
+        self.engine.stop(name, elapsed)
 
-        del self.current_events[name]
+    def on_timer_stopped(self, name, info):
+        self.notifier.cancel(name)
         if name in self.timer_widgets:
             self.timer_widgets[name]["frame"].destroy()
             del self.timer_widgets[name]
+        self.ticker.kick()
 
-        self.update_history_display()
-        self.status_bar.config(text=f"事件完成: {name} - {dur_str}")
+        self.status_bar.config(text=f"事件完成: {name} - {info['duration']}")
         self.update_tray_tooltip()
 
-        if d.get("from_template") and self.current_template:
+        if info["from_template"] and self.current_template:
             self.root.after(500, self.start_next_template_event)
 
         if self.simple_window.window and not self.current_events:
@@ -1239,9 +1463,7 @@ class EventTimerApp:
             self.simple_window.window = None
 
     def format_duration(self, sec):
-        h = int(sec // 3600)
-        m = int((sec % 3600) // 60)
-        return f"{h}h{m:02d}m"
+        return format_duration(sec)
 
     def format_time_for_display(self, dt_str):
         try:
@@ -1254,35 +1476,125 @@ class EventTimerApp:
             return dt_str
 
     def update_history_display(self):
-        for item in self.history_tree.get_children():
-            self.history_tree.delete(item)
-
-        filtered = []
-        for ev in self.events_history:
-            if self.selected_tags_filter:
-                ev_tags = set(self.parse_tags(ev.get("tags", "")))
-                if not ev_tags & self.selected_tags_filter:
-                    continue
-            date_str = self.specific_date_var.get().strip()
-            if date_str:
-                try:
-                    fd = datetime.strptime(date_str, "%Y-%m-%d").date()
-                    evd = datetime.strptime(ev["start_time"], "%Y-%m-%d %H:%M:%S").date()
-                    if evd != fd:
-                        continue
-                except:
-                    pass
-            filtered.append(ev)
-
-        sorted_ev = sorted(filtered, key=lambda x: x.get("duration_seconds", 0), reverse=True)
-        for ev in sorted_ev:
-            self.history_tree.insert("", 0, values=(
-                ev["event"],
-                ev.get("tags", ""),
-                self.format_time_for_display(ev["start_time"]),
-                self.format_time_for_display(ev["end_time"]),
-                ev["duration"]
-            ))
+        self.cancel_history_fill()
+        if self.history_store is None:
+            # 历史仍在后台加载，加载完成后会分批填充
+            return
+        # 日期筛选：单日、"起~止" 范围、"本周"、"本月"；无法解析时不按日期筛选
+        days = parse_day_range(self.specific_date_var.get())
+        self.active_filter = (set(self.selected_tags_filter), days, self.tag_filter_match_all)
+        self.history_view.set_rows(self.history_store.query(*self.active_filter))
+        self.show_history_progress()
+        if days is not None:
+            # 日期范围涉及尚未加载的分片时先显示已加载的部分，读完后再刷新
+            self.load_history_range(days, self.update_history_display)
+
+    def fill_history_display(self):
+        """分批把筛选结果放进历史表，每批之间把控制权交还主循环
+
+        每批的大小翻倍：第一批很快就能显示出来，而每批归并的总代价仍与一次排序同阶。
+        """
+        self.cancel_history_fill()
+        days = parse_day_range(self.specific_date_var.get())
+        self.active_filter = (set(self.selected_tags_filter), days, self.tag_filter_match_all)
+        self.history_view.set_rows([])
+        self.fill_history_step(self.history_store.query(*self.active_filter), 0, self.HISTORY_FIRST_CHUNK)
+        if days is not None:
+            self.load_history_range(days, self.update_history_display)
+
+    def fill_history_step(self, pending, done, size):
+        self.fill_job = None
+        chunk = pending[done:done + size]
+        self.history_view.add_rows(chunk)
+        done += len(chunk)
+        if done < len(pending):
+            self.show_history_progress(done, len(pending))
+            self.fill_job = self.root.after(1, self.fill_history_step, pending, done, size * 2)
+        else:
+            self.show_history_progress()
+
+    def cancel_history_fill(self):
+        if self.fill_job is not None:
+            self.root.after_cancel(self.fill_job)
+            self.fill_job = None
+            self.show_history_progress()
+
+    def show_history_progress(self, done=None, total=None):
+        """在历史记录标题上显示加载进度；不带参数时恢复原标题"""
+        if self.loading:
+            text = "历史记录（加载中…）"
+        elif done is not None:
+            text = f"历史记录（加载中… {done}/{total}）"
+        elif self.range_loads:
+            text = "历史记录（正在加载较早的记录…）"
+        elif self.history_store is not None and self.history_store.unloaded():
+            text = f"历史记录（另有 {self.history_store.unloaded()} 条较早的记录，按日期筛选时加载）"
+        else:
+            text = "历史记录"
+        self.hist_frame.config(text=text)
+
+    def load_history_range(self, days, then):
+        """日期范围涉及尚未加载的分片时在后台线程中读取，读完后在 Tk 线程中并入存储并调用 then()
+
+        同一范围正在读取时不重复读取。读取失败时在状态栏提示，不调用 then()。
+        """
+        store = self.history_store
+        load = store.read_range(*days)
+        if load is None or days in self.range_loads:
+            return
+        self.range_loads.add(days)
+
+        def work():
+            try:
+                result = load()
+            except Exception as e:
+                result = e
+            self.commands.post(HISTORY_RANGE_LOADED, store, days, result, then)
+
+        threading.Thread(target=work, daemon=True).start()
+        self.show_history_progress()
+
+    def on_history_range_loaded(self, store, days, result, then):
+        self.range_loads.discard(days)
+        if store is not self.history_store:
+            return    # 读取期间切换了存储后端
+        if isinstance(result, Exception):
+            self.status_bar.config(text=f"加载较早的历史记录失败: {result}")
+            self.show_history_progress()
+            return
+        store.merge_range(result)
+        self.show_history_progress()
+        then()
+
+    def on_history_change(self, kind, rec, old):
+        """历史存储变更回调：单条记录只增量更新表格中的一行"""
+        if kind == "reset" or (self.fill_job is not None and kind != "add"):
+            # 分批填充中尚未放进表格的记录可能被修改或删除，直接整体刷新
+            self.update_history_display()
+            return
+        view = self.history_view
+        visible = kind != "delete" and record_matches(rec, *self.active_filter)
+        if kind == "add":
+            if visible:
+                view.insert_row(rec)
+        elif kind == "delete":
+            view.remove_row(rec)
+        elif view.index_of(rec) >= 0:
+            if visible:
+                view.update_row(rec)
+            else:
+                view.remove_row(rec)
+        elif visible:
+            view.insert_row(rec)
+
+    def history_row_values(self, ev):
+        return (
+            ev["event"],
+            ev.get("tags", ""),
+            self.format_time_for_display(ev["start_time"]),
+            self.format_time_for_display(ev["end_time"]),
+            ev["duration"]
+        )
 
     # ---------- 历史记录右键菜单 ----------
     def create_history_context_menu(self):
@@ -1302,18 +1614,10 @@ class EventTimerApp:
             messagebox.showwarning("提示", "请先选择要删除的历史记录")
             return
         if messagebox.askyesno("确认", f"删除选中的 {len(sel)} 条记录？"):
-            for item in sel:
-                vals = self.history_tree.item(item, 'values')
-                if vals:
-                    name = vals[0]
-                    start_disp = vals[2]
-                    for i, ev in enumerate(self.events_history):
-                        if ev["event"] == name and self.format_time_for_display(ev["start_time"]) == start_disp:
-                            del self.events_history[i]
-                            break
-            self.update_history_display()
-            self.save_history()
-            self.status_bar.config(text=f"已删除 {len(sel)} 条历史记录")
+            recs = [self.history_store.get(int(item)) for item in sel]
+            recs = [ev for ev in recs if ev is not None]
+            self.save_history_change(self.history_store.delete_many, recs)
+            self.status_bar.config(text=f"已删除 {len(recs)} 条历史记录")
 
     def edit_selected_tag(self):
         sel = self.history_tree.selection()
@@ -1323,59 +1627,292 @@ class EventTimerApp:
         if len(sel) > 1:
             messagebox.showwarning("提示", "只能编辑单条记录")
             return
-        item = sel[0]
-        vals = self.history_tree.item(item, 'values')
-        if not vals:
+        ev = self.history_store.get(int(sel[0]))
+        if ev is None:
             return
-        name, old_tags, start_disp = vals[0], vals[1], vals[2]
-        for i, ev in enumerate(self.events_history):
-            if ev["event"] == name and self.format_time_for_display(ev["start_time"]) == start_disp:
-                new = simpledialog.askstring("编辑标签", f"事件: {name}\n当前标签: {old_tags}\n新标签:",
-                                             initialvalue=old_tags)
-                if new is not None:
-                    ev["tags"] = new
-                    for t in self.parse_tags(new):
-                        self.tags_data[t] = self.tags_data.get(t, 0) + 1
-                    self.save_history()
-                    self.save_tags()
-                    self.update_history_display()
-                    self.status_bar.config(text=f"已更新标签: {name}")
-                break
+        name, old_tags = ev["event"], ev.get("tags", "")
+        new = simpledialog.askstring("编辑标签", f"事件: {name}\n当前标签: {old_tags}\n新标签:",
+                                     initialvalue=old_tags)
+        if new is not None:
+            self.save_history_change(self.history_store.update, ev, {"tags": new})
+            self.engine.note_tags_used(self.parse_tags(new))
+            self.status_bar.config(text=f"已更新标签: {name}")
 
     # ---------- 数据持久化 ----------
-    def load_history(self):
-        if os.path.exists(self.data_file):
+    def open_history_store(self):
+        """打开并读取历史存储，返回 (存储, 实际使用的后端, 是否从所选后端退回 JSON)
+
+        只构造新对象、不碰界面，可以在加载线程中调用。
+        """
+        if self.history_backend == 'sqlite':
             try:
-                with open(self.data_file, 'r', encoding='utf-8') as f:
-                    self.events_history = json.load(f)
-            except:
-                self.events_history = []
+                store = SqliteHistoryStore(self.db_file, self.writer)
+                if not store.exists():
+                    # 首次启用 SQLite：一次性导入现有 JSON 历史
+                    import_json_history(self.data_file, self.db_file)
+                store.load()
+                return store, 'sqlite', False
+            except sqlite3.Error:
+                pass
+        elif self.history_backend == 'sharded':
+            try:
+                store = ShardedHistoryStore(self.shard_dir, self.writer)
+                if not store.exists():
+                    # 首次启用分片：一次性把现有 JSON 历史按月拆分
+                    import_json_shards(self.data_file, self.shard_dir)
+                store.load()
+                return store, 'sharded', False
+            except (OSError, ValueError):
+                pass
+        # 读取快照并回放追加日志；旧版 events_history.json 会自动迁移
+        store = JsonHistoryStore(self.data_file, self.writer)
+        store.load()
+        return store, 'json', self.history_backend != 'json'
+
+    def open_history_archive(self, records):
+        """打开二进制归档，与历史记录不一致或损坏时重建；失败返回 None。在加载线程中调用"""
+        from history_archive import HistoryArchive    # 只在启用归档时才需要（带入 mmap、struct）
+        archive = HistoryArchive(self.archive_file)
+        return archive if archive.sync(records) else None
+
+    def open_stats(self, store):
+        """读取统计汇总，与历史不一致时重建；返回 (汇总, 是否需要回写)。可在加载线程中调用"""
+        stats = StatsRollup(self.stats_file)
+        return stats, stats.load(store)
+
+    def save_stats(self):
+        """整体写出统计汇总：只在加载或重建后、历史压缩时和退出时调用，不随每次变更写"""
+        if self.stats is not None:
+            self.writer.mark_dirty(self.stats_file, self.stats.to_json)
+
+    def set_history_archive(self, enabled):
+        """启用或停用二进制归档；停用时删除归档文件。文件操作都在写入线程中进行"""
+        self.use_history_archive = enabled
+        if not enabled and self.history_archive is not None:
+            self.writer.run_task(self.history_archive.remove)
+            self.history_archive = None
+        elif enabled and self.history_archive is None and self.history_store is not None:
+            # 先订阅再排队打开：之后的变更都排在打开（或重建）之后执行
+            from history_archive import HistoryArchive
+            archive = HistoryArchive(self.archive_file)
+            load = self.history_store.snapshot()
+            archive.follow(self.history_store, self.writer)
+            self.writer.run_task(lambda: archive.sync(load()))
+            self.history_archive = archive
+
+    # ---------- 后台加载 ----------
+    def start_background_load(self):
+        self.loading = True
+        self.loader = threading.Thread(target=self.load_in_background, daemon=True)
+        self.loader.start()
+
+    def load_in_background(self):
+        """加载线程：读取历史、名称热度和标签计数，结果经命令队列交给 Tk 线程"""
+        try:
+            self.loaded_data = self.read_startup_data()
+        except Exception as e:
+            self.loaded_data = e
+        self.commands.post(DATA_LOADED)
+
+    def read_startup_data(self):
+        """读取启动时需要的全部数据，返回交给 attach_loaded_data() 接入的元组
+
+        只构造新对象、不碰界面和已接入的状态，在加载线程中调用（基准测试也直接调用它）。
+        """
+        store, backend, fell_back = self.open_history_store()
+        names, index, names_dirty = self.read_event_names()
+        tags, tags_dirty = self.read_tags(store.records)
+        archive = self.open_history_archive(store.snapshot()()) if self.use_history_archive else None
+        stats, stats_dirty = self.open_stats(store)
+        return (store, backend, fell_back, names, index, names_dirty, tags, archive,
+                stats, stats_dirty)
+
+    def attach_loaded_data(self):
+        """Tk 线程：接入后台加载的数据（只生效一次），返回是否成功"""
+        data, self.loaded_data = self.loaded_data, None
+        if data is None:
+            return False
+        self.loading = False
+        if isinstance(data, Exception):
+            messagebox.showerror("加载错误", f"无法加载历史记录: {data}")
+            return False
+        (store, self.history_backend, fell_back, names, index, names_dirty, tags, archive,
+         self.stats, stats_dirty) = data
+        self.event_names_data = names
+        self.events_history = store.records
+        if archive is not None:
+            # 归档在补写暂存记录之前订阅，不会漏掉加载期间完成的记录
+            archive.follow(store, self.writer)
+            self.history_archive = archive
+        self.stats.follow(store, self.data_lock, self.writer)
+        store.add_compact_listener(self.save_stats)
+        stamp = self.stats.stamp
+        # 先补写加载期间完成的记录，再订阅变更，这些记录随后随分批填充一起显示
+        self.engine.attach(store, index, tags)
+        store.add_listener(self.on_history_change)
+        if names_dirty:
+            self.save_event_names()
+        if stats_dirty or self.stats.stamp != stamp:
+            self.save_stats()
+        if fell_back:
+            messagebox.showerror("加载错误", "无法打开所选的历史存储，已改用 JSON 存储")
+        return True
+
+    def on_data_loaded(self):
+        if self.attach_loaded_data():
+            text = f"已加载 {len(self.events_history)} 条历史记录"
+            self.status_bar.config(text=f"{text}；{self.tray_error}" if self.tray_error else text)
+            self.fill_history_display()
         else:
-            self.events_history = []
+            self.show_history_progress()
+
+    def finish_loading(self):
+        """等待后台加载结束并接入结果（退出前调用，保证暂存的记录能写入历史）"""
+        if self.loading:
+            self.loader.join()
+            self.attach_loaded_data()
+
+    def switch_history_backend(self, backend):
+        """切换历史存储后端，并把当前全部记录导入新后端
+
+        读取全部记录、导入新后端和重建统计汇总在后台线程中进行，完成后经命令队列回到 Tk 线程换上新存储。
+        导入期间照常计时和编辑历史，旧存储的变更记在 switch_changes 中，换上新存储后按顺序补上。
+        """
+        if backend == self.history_backend or self.switching_backend is not None:
+            return
+        if self.history_store is None:
+            messagebox.showinfo("提示", "历史记录仍在加载，请稍后再切换存储方式")
+            return
+        self.switching_backend = backend
+        self.switch_changes = []
+        self.history_store.add_listener(self.record_switch_change)
+        load = self.history_store.snapshot()
+        self.switcher = threading.Thread(target=self.import_history, args=(backend, load), daemon=True)
+        self.switcher.start()
+        self.update_backend_buttons()
+        self.status_bar.config(text="正在切换历史存储…")
+
+    def record_switch_change(self, kind, rec, old):
+        self.switch_changes.append((kind, rec.id if rec is not None else None,
+                                    rec.to_dict() if kind in ("add", "update") else None))
+
+    def import_history(self, backend, load):
+        """切换线程：把快照导入新后端并重建统计汇总，结果经命令队列交给 Tk 线程"""
+        store = None
+        try:
+            if backend == 'sqlite':
+                store = SqliteHistoryStore(self.db_file, self.writer)
+            elif backend == 'sharded':
+                store = ShardedHistoryStore(self.shard_dir, self.writer)
+            else:
+                store = JsonHistoryStore(self.data_file, self.writer)
+            records = store.replace_all(load())
+            stats = StatsRollup(self.stats_file)
+            stats.rebuild(records)
+            stats.stamp = history_stamp(store)
+            # 新存储换上之前只有本线程使用，这里复制的快照供归档重建
+            self.switch_result = (store, stats, store.snapshot())
+        except Exception as e:
+            if store is not None:
+                store.close()
+            self.switch_result = e
+        self.commands.post(HISTORY_SWITCHED)
+
+    def on_history_switched(self):
+        """Tk 线程：换上导入完成的新存储（只生效一次），补上导入期间旧存储的变更"""
+        result, self.switch_result = self.switch_result, None
+        if result is None:
+            return
+        backend, self.switching_backend = self.switching_backend, None
+        old, changes = self.history_store, self.switch_changes
+        old.remove_listener(self.record_switch_change)
+        self.switch_changes = []
+        self.update_backend_buttons()
+        if isinstance(result, Exception):
+            self.status_bar.config(text="切换历史存储失败")
+            messagebox.showerror("保存错误", f"无法切换历史存储: {result}")
+            return
+        store, stats, load = result
+        old.close()
+        self.history_store = store
+        self.events_history = store.records
+        self.history_backend = backend
+        store.add_listener(self.on_history_change)
+        if self.history_archive is not None:
+            # 导入新后端后记录 id 可能变化，归档在写入线程中整体重建
+            archive = self.history_archive
+            self.writer.run_task(lambda: archive.apply(lambda: archive.rebuild(load())))
+            archive.follow(store, self.writer)
+        with self.data_lock:
+            self.stats = stats
+        stats.follow(store, self.data_lock, self.writer)
+        store.add_compact_listener(self.save_stats)
+        # 导入时 id 不变，导入期间的修改和删除按 id 找到新存储中的记录
+        for kind, rid, fields in changes:
+            if kind == "reset":
+                store.clear()
+            elif kind == "add":
+                store.append(fields)
+            else:
+                rec = store.get(rid)
+                if rec is None:
+                    continue
+                if kind == "update":
+                    store.update(rec, fields)
+                else:
+                    store.delete(rec)
+        self.save_stats()
+        self.save_settings()
+        self.update_history_display()
+        self.status_bar.config(text="已切换历史存储")
+
+    def finish_backend_switch(self):
+        """等待切换线程结束并换上新存储（退出前调用，保证设置与实际使用的后端一致）"""
+        if self.switching_backend is not None:
+            self.switcher.join()
+            self.on_history_switched()
+
+    def update_backend_buttons(self):
+        """切换存储后端期间停用设置窗口中的后端选项"""
+        state = tk.DISABLED if self.switching_backend is not None else tk.NORMAL
+        for button in self.backend_buttons:
+            if button.winfo_exists():
+                button.config(state=state)
 
     def save_history(self):
+        """立即把全部历史写成快照（压缩追加日志）"""
+        if self.history_store is None:
+            return
         try:
-            with open(self.data_file, 'w', encoding='utf-8') as f:
-                json.dump(self.events_history, f, ensure_ascii=False, indent=2)
+            self.history_store.compact(wait=True)
         except:
             messagebox.showerror("保存错误", "无法保存历史记录")
 
-    def load_event_names(self):
+    def save_history_change(self, change, *args):
+        """执行一次历史变更（新增/修改/删除），只追加一行日志"""
+        try:
+            change(*args)
+        except:
+            messagebox.showerror("保存错误", "无法保存历史记录")
+
+    def read_event_names(self):
+        """读取事件名热度并建立补全索引，返回 (热度数据, 索引, 是否需要回写)；可在加载线程中调用"""
+        names = {}
         if os.path.exists(self.names_file):
             try:
                 with open(self.names_file, 'r', encoding='utf-8') as f:
-                    self.event_names_data = json.load(f)
+                    names = json.load(f)
             except:
-                self.event_names_data = {}
-        else:
-            self.event_names_data = {}
+                names = {}
+        migrated = migrate_names(names)
+        index = NameIndex(names)
+        return names, index, index.trim(self.max_event_names) or migrated
 
     def save_event_names(self):
-        try:
-            with open(self.names_file, 'w', encoding='utf-8') as f:
-                json.dump(self.event_names_data, f, ensure_ascii=False, indent=2)
-        except:
-            pass
+        if self.loading:
+            # 加载完成前内存中没有完整数据，不能覆盖文件；接入时会再保存
+            return
+        self.writer.mark_dirty(self.names_file, lambda: self.event_names_data)
 
     def load_templates(self):
         if os.path.exists(self.templates_file):
@@ -1388,33 +1925,28 @@ class EventTimerApp:
             self.event_templates = []
 
     def save_templates(self):
-        try:
-            with open(self.templates_file, 'w', encoding='utf-8') as f:
-                json.dump(self.event_templates, f, ensure_ascii=False, indent=2)
-        except:
-            messagebox.showerror("保存错误", "无法保存模板")
+        self.writer.mark_dirty(self.templates_file, lambda: self.event_templates)
 
-    def load_tags(self):
+    def read_tags(self, records):
+        """读取标签计数，文件缺失或为空时由历史记录重新统计；返回 (计数, 是否需要回写)"""
+        tags = {}
         if os.path.exists(self.tags_file):
             try:
                 with open(self.tags_file, 'r', encoding='utf-8') as f:
-                    self.tags_data = json.load(f)
+                    tags = json.load(f)
             except:
-                self.tags_data = {}
-        else:
-            self.tags_data = {}
-        if not self.tags_data and self.events_history:
-            for ev in self.events_history:
-                for t in self.parse_tags(ev.get("tags", "")):
-                    self.tags_data[t] = self.tags_data.get(t, 0) + 1
-            self.save_tags()
+                tags = {}
+        if tags or not records:
+            return tags, False
+        for ev in records:
+            for t in self.parse_tags(ev.get("tags", "")):
+                tags[t] = tags.get(t, 0) + 1
+        return tags, True
 
     def save_tags(self):
-        try:
-            with open(self.tags_file, 'w', encoding='utf-8') as f:
-                json.dump(self.tags_data, f, ensure_ascii=False, indent=2)
-        except:
-            pass
+        if self.loading:
+            return
+        self.writer.mark_dirty(self.tags_file, lambda: self.tags_data)
 
     def load_settings(self):
         if os.path.exists(self.settings_file):
@@ -1425,6 +1957,10 @@ class EventTimerApp:
                     self.auto_stop_on_notification = s.get("auto_stop_on_notification", False)
                     self.notification_active = s.get("notification_active", True)
                     self.pause_mode = s.get("pause_mode", 'A')
+                    self.history_backend = s.get("history_backend", 'json')
+                    self.use_history_archive = s.get("history_archive", False)
+                    self.save_delay_ms = s.get("save_delay_ms", 1000)
+                    self.max_event_names = s.get("max_event_names", 1000)
             except:
                 pass
         else:
@@ -1432,18 +1968,25 @@ class EventTimerApp:
             self.auto_stop_on_notification = False
             self.notification_active = True
             self.pause_mode = 'A'
+            self.history_backend = 'json'
+            self.use_history_archive = False
+            self.save_delay_ms = 1000
+            self.max_event_names = 1000
 
     def save_settings(self):
-        try:
-            with open(self.settings_file, 'w', encoding='utf-8') as f:
-                json.dump({
-                    "notification_interval": self.notification_interval,
-                    "auto_stop_on_notification": self.auto_stop_on_notification,
-                    "notification_active": self.notification_active,
-                    "pause_mode": self.pause_mode
-                }, f, ensure_ascii=False, indent=2)
-        except:
-            pass
+        self.writer.mark_dirty(self.settings_file, lambda: {
+            "notification_interval": self.notification_interval,
+            "auto_stop_on_notification": self.auto_stop_on_notification,
+            "notification_active": self.notification_active,
+            "pause_mode": self.pause_mode,
+            "history_backend": self.history_backend,
+            "history_archive": self.use_history_archive,
+            "save_delay_ms": self.save_delay_ms,
+            "max_event_names": self.max_event_names
+        })
+
+    def report_save_error(self, path):
+        self.status_bar.config(text=f"保存失败: {os.path.basename(path) if path else '历史记录'}")
 
     # ---------- 模板管理 ----------
     def show_template_manager(self):
@@ -1508,7 +2051,8 @@ class EventTimerApp:
                     line = line.strip()
                     if line:
                         events.append({"name": line, "tags": default_tags})
-                self.event_templates.append({"name": name, "events": events})
+                with self.data_lock:
+                    self.event_templates.append({"name": name, "events": events})
                 self.save_templates()
                 self.template_combo['values'] = [t["name"] for t in self.event_templates]
                 lb.delete(0, tk.END)
@@ -1547,7 +2091,8 @@ class EventTimerApp:
             idx = sel[0]
             name = self.event_templates[idx]["name"]
             if messagebox.askyesno("确认", f"删除模板 '{name}' 吗？"):
-                del self.event_templates[idx]
+                with self.data_lock:
+                    del self.event_templates[idx]
                 self.save_templates()
                 self.template_combo['values'] = [t["name"] for t in self.event_templates]
                 lb.delete(0, tk.END)
@@ -1599,12 +2144,7 @@ class EventTimerApp:
             self.root.after(100, self.start_next_template_event)
             return
 
-        self.event_entry.delete(0, tk.END)
-        self.event_entry.insert(0, ev_name)
-        self.tag_entry.delete(0, tk.END)
-        self.tag_entry.insert(0, ev_tags)
-
-        self.start_timing_from_template()
+        self.engine.start(ev_name, ev_tags, from_template=True)
 
         self.template_event_index += 1
         remain = len(self.template_events_queue) - self.template_event_index
@@ -1631,20 +2171,29 @@ class EventTimerApp:
 
     # ---------- 系统托盘 ----------
     def create_system_tray(self):
+        # pystray 和 Pillow 是可选依赖，只在创建托盘时导入；缺失时没有托盘，隐藏窗口改为最小化
         try:
+            import pystray
             img = self.load_tray_icon()
+            # 菜单回调在托盘线程中执行：只投递命令，菜单文字只读快照
             menu = (
-                pystray.MenuItem('显示主窗口', self.show_main_window),
-                pystray.MenuItem('显示简易窗口', self.show_simple_window),
+                pystray.MenuItem('显示主窗口', lambda icon, item: self.commands.post(SHOW_MAIN_WINDOW)),
+                pystray.MenuItem(self.simple_window_menu_text,
+                                 lambda icon, item: self.commands.post(SHOW_SIMPLE_WINDOW)),
                 pystray.MenuItem('---', None, enabled=False),
-                pystray.MenuItem('退出', self.quit_app)
+                pystray.MenuItem('退出', lambda icon, item: self.commands.post(QUIT_APP))
             )
             self.tray_icon = pystray.Icon("event_timer", img, "事件计时器", menu)
             threading.Thread(target=self.tray_icon.run, daemon=True).start()
+        except ImportError:
+            self.tray_error = "未安装托盘依赖（pystray、Pillow），托盘不可用"
         except Exception as e:
-            print("托盘创建失败:", e)
+            self.tray_error = f"托盘创建失败: {e}"
+        if self.tray_error:
+            self.status_bar.config(text=self.tray_error)
 
     def load_tray_icon(self):
+        from PIL import Image
         paths = ["timer_icon.ico", "icon.ico", "resources/timer_icon.ico", "resources/icon.ico"]
         for p in paths:
             if os.path.exists(p):
@@ -1655,6 +2204,7 @@ class EventTimerApp:
         return self.create_tray_image()
 
     def create_tray_image(self):
+        from PIL import Image, ImageDraw
         img = Image.new('RGBA', (64,64), (0,0,0,0))
         draw = ImageDraw.Draw(img)
         color = "#ffffff" if self.is_dark_mode else "#2196F3"
@@ -1663,6 +2213,10 @@ class EventTimerApp:
         draw.line([32,32,44,32], fill=color, width=3)
         return img
 
+    def simple_window_menu_text(self, item):
+        count = len(self.snapshot.events)
+        return f"显示简易窗口（{count}个进行中）" if count else "显示简易窗口"
+
     def show_main_window(self, icon=None, item=None):
         if self.is_hidden_to_tray:
             self.show_from_tray()
@@ -1678,6 +2232,10 @@ class EventTimerApp:
 
     def hide_to_tray(self):
         self.hide_dropdown()
+        if self.tray_icon is None:
+            # 没有托盘就无处恢复窗口，只最小化
+            self.root.iconify()
+            return
         self.is_hidden_to_tray = True
         self.root.withdraw()
         if self.current_events:
@@ -1696,22 +2254,54 @@ class EventTimerApp:
         self.update_tray_tooltip()
         self.status_bar.config(text=f"正在计时 {len(self.current_events)} 个事件" if self.current_events else "就绪")
 
-    def update_tray_tooltip(self):
-        if self.tray_icon:
+    def publish_snapshot(self):
+        """发布计时状态快照；进行中的事件数或托盘状态变了就更新托盘提示和菜单"""
+        old = self.snapshot
+        snap = snapshot_events(self.current_events, self.is_hidden_to_tray)
+        if snap == old:
+            return None
+        self.snapshot = snap
+        if self.tray_icon and (len(snap.events) != len(old.events)
+                               or snap.hidden_to_tray != old.hidden_to_tray):
             tip = "事件计时器"
-            if self.current_events:
-                tip += f" - {len(self.current_events)}个事件进行中"
-            if self.is_hidden_to_tray:
+            if snap.events:
+                tip += f" - {len(snap.events)}个事件进行中"
+            if snap.hidden_to_tray:
                 tip += " (最小化)"
             self.tray_icon.title = tip
+            try:
+                self.tray_icon.update_menu()
+            except:
+                pass
+        return None
+
+    def update_tray_tooltip(self):
+        self.publish_snapshot()
+
+    def wake_commands(self):
+        """请 Tk 线程执行命令队列（在提交命令的线程中调用）：虚拟事件排在 Tk 事件队列末尾"""
+        try:
+            self.root.event_generate("<<Commands>>", when="tail")
+        except (tk.TclError, RuntimeError):
+            # 主循环尚未启动（启动时的 drain 会处理）或窗口已销毁
+            pass
 
     def quit_app(self, icon=None, item=None):
-        self.save_history()
+        self.finish_loading()
+        self.finish_backend_switch()
         self.save_event_names()
         self.save_templates()
         self.save_tags()
         self.save_settings()
+        self.save_stats()
+        # 强制写出所有待写内容
+        if self.history_store is not None:
+            self.history_store.close()
+        if self.history_archive is not None:
+            self.writer.run_task(self.history_archive.close)
+        self.writer.close()
         self.notification_active = False
+        self.notifier.clear()
         if self.tray_icon:
             self.tray_icon.stop()
         self.root.quit()
@@ -1719,44 +2309,52 @@ class EventTimerApp:
         os._exit(0)
 
     # ---------- 通知系统 ----------
-    def start_notification_checker(self):
+    def arm_notification(self, name):
+        """为事件安排下一次提醒：已计时长度达到提醒间隔的下一个整数倍时触发"""
+        d = self.current_events.get(name)
+        if not self.notification_active or d is None or d["status"] != "running":
+            self.notifier.cancel(name)
+            return
+        interval = self.notification_interval * 60
+        elapsed = self.get_event_elapsed_seconds(name)
+        threshold = (int(elapsed // interval) + 1) * interval
+        # 提醒调度器使用单调时钟，系统时间被修改也不会提前或推迟提醒
+        due = time.monotonic() + threshold - elapsed
+        self.notifier.schedule(name, due, lambda key, when: self.on_notification_due(name, threshold))
+
+    def rearm_notifications(self):
         if not self.notification_active:
+            self.notifier.clear()
             return
-        if self.notification_thread and self.notification_thread.is_alive():
-            self.notification_active = False
-            time.sleep(0.1)
-        self.notification_active = True
-
-        def loop():
-            last = {}
-            while self.notification_active:
-                now = time.time()
-                for name, data in self.current_events.items():
-                    if data["status"] != "running":
-                        continue
-                    elapsed = data["accumulated_seconds"] + (datetime.now() - data["start_time"]).total_seconds()
-                    mins = elapsed / 60
-                    if mins >= self.notification_interval:
-                        if name not in last or now - last[name] >= self.notification_interval * 60:
-                            last[name] = now
-                            self.root.after(0, lambda n=name, m=mins: self.show_single_event_notification(n, m))
-                for n in list(last.keys()):
-                    if n not in self.current_events:
-                        del last[n]
-                time.sleep(30)
-        self.notification_thread = threading.Thread(target=loop, daemon=True)
-        self.notification_thread.start()
+        for name in self.current_events:
+            self.arm_notification(name)
 
-    def show_single_event_notification(self, name, mins):
-        if name not in self.current_events:
+    def on_notification_due(self, name, threshold):
+        d = self.current_events.get(name)
+        if d is None or d["status"] != "running":
             return
         if self.auto_stop_on_notification:
-            self.stop_single_timing(name)
+            # 时长记为恰好等于提醒阈值，结束时间相应提前
+            self.stop_single_timing(name, threshold)
             return
+        self.arm_notification(name)
+        self.show_single_event_notification(name, threshold / 60)
+
+    def beep(self):
+        """提醒音：Windows 用 winsound 蜂鸣，其他平台用 Tk 的系统提示音"""
         try:
-            winsound.Beep(1000, 500)
+            if platform.system() == "Windows":
+                import winsound
+                winsound.Beep(1000, 500)
+            else:
+                self.root.bell()
         except:
             pass
+
+    def show_single_event_notification(self, name, mins):
+        if name not in self.current_events:
+            return
+        self.beep()
         win = tk.Toplevel(self.root)
         win.title("事件计时提醒")
         win.geometry("400x200")
@@ -1783,15 +2381,360 @@ class EventTimerApp:
     def reset_filters(self):
         self.specific_date_var.set("")
         self.selected_tags_filter = set()
+        self.tag_filter_match_all = False
         self.filter_tags_label.config(text="")
         self.update_history_display()
         self.status_bar.config(text="已重置所有筛选")
+    # ---------- 统计窗口 ----------
+    STATS_PERIODS = ("今天", "本周", "本月", "全部")
+
+    def stats_period(self, label, today):
+        """统计时段 -> (起, 止)；“全部”为 (None, None)"""
+        if label == "今天":
+            return today, today
+        if label == "本周":
+            return week_range(today)
+        if label == "本月":
+            return month_range(today)
+        return None, None
+
+    def live_stats(self):
+        """进行中（含模式 A 暂停）事件的 (开始日期, 事件名, 标签, 已计时毫秒)
+
+        模式 B 暂停的事件没有本段开始时间，已计时的各段都已记入历史，不再重复计入。
+        """
+        with self.data_lock:
+            return [(d["start_time"].date(), name, self.parse_tags(d["tags"]), self.engine.elapsed_ns(name) // 1000000)
+                    for name, d in self.current_events.items() if d["start_time"] is not None]
+
+    def show_stats_window(self):
+        """统计窗口：直接读取统计汇总，加上进行中事件的已计时时长，每秒刷新"""
+        if self.stats is None:
+            messagebox.showinfo("提示", "历史记录仍在加载，请稍后再试")
+            return
+        win = tk.Toplevel(self.root)
+        win.title("统计")
+        win.geometry("560x560")
+        win.configure(bg=self.bg_color)
+        win.transient(self.root)
+        self.center_window(win)
+
+        period_var = tk.StringVar(value="本周")
+        bar = tk.Frame(win, bg=self.bg_color)
+        bar.pack(fill=tk.X, padx=10, pady=5)
+        for label in self.STATS_PERIODS:
+            tk.Radiobutton(bar, text=label, variable=period_var, value=label, command=lambda: refresh(),
+                           bg=self.bg_color, fg=self.fg_color, selectcolor=self.bg_color,
+                           activebackground=self.bg_color).pack(side=tk.LEFT, padx=5)
+
+        total_label = tk.Label(win, anchor="w", justify=tk.LEFT, bg=self.bg_color, fg=self.fg_color)
+        total_label.pack(fill=tk.X, padx=10)
+
+        trees = {}
+        for key, title in (("tags", "按标签"), ("events", "按事件")):
+            frame = tk.LabelFrame(win, text=title, bg=self.bg_color, fg=self.fg_color)
+            frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+            cols = ("名称", "时长", "条数", "占比")
+            tree = ttk.Treeview(frame, columns=cols, show="headings", height=8)
+            for col in cols:
+                tree.heading(col, text=col, anchor="center")
+                tree.column(col, width=220 if col == "名称" else 90, anchor="center")
+            sb = ttk.Scrollbar(frame, orient="vertical", command=tree.yview)
+            tree.configure(yscrollcommand=sb.set)
+            tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+            sb.pack(side=tk.RIGHT, fill=tk.Y)
+            trees[key] = tree
+
+        job = [None]
+
+        def add_live(table, key, ms):
+            cell = table.get(key)
+            if cell is None:
+                table[key] = [ms, 0]
+            else:
+                cell[0] += ms
+
+        def refresh():
+            if job[0] is not None:
+                win.after_cancel(job[0])
+                job[0] = None
+            if not win.winfo_exists():
+                return
+            today = date.today()
+            first, last = self.stats_period(period_var.get(), today)
+            with self.data_lock:
+                total, tags, events = self.stats.summary(first, last)
+                week_ms = self.stats.week_total(today)
+                month_ms = self.stats.month_total(today)
+            week_first, week_last = week_range(today)
+            live_ms = 0
+            for day, name, tag_list, ms in self.live_stats():
+                if week_first <= day <= week_last:
+                    week_ms += ms
+                if (day.year, day.month) == (today.year, today.month):
+                    month_ms += ms
+                if (first is None or day >= first) and (last is None or day <= last):
+                    live_ms += ms
+                    for tag in tag_list or [UNTAGGED]:
+                        add_live(tags, tag, ms)
+                    add_live(events, name, ms)
+            all_ms = total[0] + live_ms
+            text = f"合计 {format_duration(all_ms // 1000)}（{total[1]} 条记录"
+            if live_ms:
+                text += f"，另有进行中 {format_duration(live_ms // 1000)}"
+            text += f"）\n本周 {format_duration(week_ms // 1000)}    本月 {format_duration(month_ms // 1000)}"
+            total_label.config(text=text)
+            for key, table in (("tags", tags), ("events", events)):
+                tree = trees[key]
+                tree.delete(*tree.get_children())
+                for name, (ms, n) in sorted(table.items(), key=lambda x: -x[1][0])[:200]:
+                    share = f"{ms / all_ms:.0%}" if all_ms else "-"
+                    label = "（无标签）" if key == "tags" and name == UNTAGGED else name
+                    tree.insert("", "end", values=(label, format_duration(ms // 1000), n, share))
+            job[0] = win.after(1000, refresh)
+
+        def close():
+            if job[0] is not None:
+                win.after_cancel(job[0])
+            win.destroy()
+
+        tk.Button(win, text="关闭", command=close,
+                  bg=self.button_bg, fg=self.button_fg, width=10, relief="flat").pack(pady=5)
+        win.protocol("WM_DELETE_WINDOW", close)
+        refresh()
+
+    # ---------- 导出 ----------
+    def export_filtered_history(self):
+        """把当前标签/日期筛选下的历史流式导出为 CSV、JSONL 或 iCalendar，在后台线程中进行，可取消"""
+        if self.history_store is None:
+            messagebox.showinfo("提示", "历史记录仍在加载，请稍后再试")
+            return
+        from tkinter import filedialog
+        path = filedialog.asksaveasfilename(
+            parent=self.root, title="导出历史记录", defaultextension=".csv",
+            filetypes=[("CSV", "*.csv"), ("JSON Lines", "*.jsonl"), ("iCalendar", "*.ics")])
+        if not path:
+            return
+        fmt = os.path.splitext(path)[1].lower().lstrip(".")
+        if fmt not in EXPORT_FORMATS:
+            fmt = "csv"
+        tags, days, match_all = self.active_filter
+        # 导出线程只读快照，不受导出期间新增/修改的记录影响；按需加载的后端只在导出线程中读取日期范围内的分片
+        load = self.history_store.snapshot(days)
+        cancel = threading.Event()
+
+        win = tk.Toplevel(self.root)
+        win.title("导出历史记录")
+        win.geometry("420x140")
+        win.configure(bg=self.bg_color)
+        win.transient(self.root)
+        self.center_window(win)
+        label = tk.Label(win, text=f"正在导出到 {os.path.basename(path)}…", anchor="w",
+                         bg=self.bg_color, fg=self.fg_color)
+        label.pack(fill=tk.X, padx=10, pady=(15, 5))
+        bar = ttk.Progressbar(win, mode="determinate", maximum=1)
+        bar.pack(fill=tk.X, padx=10, pady=5)
+        button = tk.Button(win, text="取消", command=cancel.set,
+                           bg=self.button_bg, fg=self.button_fg, width=10, relief="flat")
+        button.pack(pady=5)
+
+        def close():
+            cancel.set()
+            win.destroy()
+        win.protocol("WM_DELETE_WINDOW", close)
+
+        def update(scanned, total, written, result):
+            if result is None:
+                text = f"已导出 {written} 条（{scanned}/{total}）"
+            elif isinstance(result, Exception):
+                text = f"导出失败: {result}"
+            elif result == "cancelled":
+                text = "导出已取消"
+            else:
+                text = f"已导出 {written} 条到 {path}"
+            if result is not None:
+                self.status_bar.config(text=text)
+            if not win.winfo_exists():
+                return
+            bar.config(maximum=max(total, 1), value=scanned)
+            label.config(text=text)
+            if result is not None:
+                button.config(text="关闭", command=win.destroy)
+
+        def work():
+            progress = lambda scanned, total, written: self.commands.post(
+                EXPORT_PROGRESS, update, scanned, total, written, None)
+            total = 0
+            try:
+                table = load()
+                total = len(table.live)
+                written = export_history(table, path, fmt, tags, days, match_all, progress, cancel)
+                result = "cancelled" if written is None else "done"
+            except Exception as e:
+                written, result = 0, e
+            self.commands.post(EXPORT_PROGRESS, update, total, total, written or 0, result)
+
+        threading.Thread(target=work, daemon=True).start()
+
+    def on_export_progress(self, update, *args):
+        update(*args)
+
+    # ---------- 分析窗口 ----------
+    WEEKDAY_NAMES = ("一", "二", "三", "四", "五", "六", "日")
+
+    def show_analysis_window(self):
+        """分析窗口：在后台线程中对全部历史做分布、热力图、趋势和长尾分析（有 NumPy 时向量化）"""
+        if self.history_store is None:
+            messagebox.showinfo("提示", "历史记录仍在加载，请稍后再试")
+            return
+        win = tk.Toplevel(self.root)
+        win.title("分析")
+        win.geometry("760x600")
+        win.configure(bg=self.bg_color)
+        win.transient(self.root)
+        self.center_window(win)
+
+        # 这里只复制内存中的列数组；按需加载的后端在分析线程中才读取未加载的分片（有归档时不读）
+        load = self.history_store.snapshot()
+        status = tk.Label(win, text="正在分析历史记录…", anchor="w",
+                          bg=self.bg_color, fg=self.fg_color)
+        status.pack(fill=tk.X, padx=10, pady=5)
+
+        notebook = ttk.Notebook(win)
+        notebook.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+
+        def make_tree(title, cols, widths):
+            frame = tk.Frame(notebook, bg=self.bg_color)
+            notebook.add(frame, text=title)
+            tree = ttk.Treeview(frame, columns=cols, show="headings")
+            for col, width in zip(cols, widths):
+                tree.heading(col, text=col, anchor="center")
+                tree.column(col, width=width, anchor="center")
+            sb = ttk.Scrollbar(frame, orient="vertical", command=tree.yview)
+            tree.configure(yscrollcommand=sb.set)
+            tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+            sb.pack(side=tk.RIGHT, fill=tk.Y)
+            return frame, tree
+
+        _, dist_tree = make_tree("时长分布", ("事件名称", "次数", "总时长", "P50", "P90", "P99"),
+                                 (220, 70, 100, 100, 100, 100))
+        heat_canvas = tk.Canvas(notebook, bg=self.tree_bg, highlightthickness=0)
+        notebook.add(heat_canvas, text="星期 × 小时")
+        trend_canvas = tk.Canvas(notebook, bg=self.tree_bg, highlightthickness=0)
+        notebook.add(trend_canvas, text="每日趋势")
+        tail_frame, tail_tree = make_tree("长尾事件", ("事件名称", "次数", "总时长"), (300, 100, 150))
+        tail_label = tk.Label(tail_frame, anchor="w", bg=self.bg_color, fg=self.fg_color)
+        tail_label.pack(side=tk.BOTTOM, fill=tk.X)
+
+        def fmt(ms):
+            return format_duration(int(ms) // 1000)
+
+        def render(result):
+            if not win.winfo_exists():
+                return
+            if isinstance(result, Exception):
+                status.config(text=f"分析失败: {result}")
+                return
+            status.config(text=f"{result['count']} 条记录，使用 {result['backend']} 计算，"
+                               f"耗时 {result['seconds'] * 1000:.0f} 毫秒")
+            rows = sorted(result["percentiles"].items(), key=lambda x: -x[1][1])[:500]
+            for name, (n, total, points) in rows:
+                dist_tree.insert("", "end", values=(name, n, fmt(total), *(fmt(p) for p in points)))
+            self.draw_heatmap(heat_canvas, result["hour_of_week"])
+            self.draw_trend(trend_canvas, result["daily"], result["rolling"])
+            head, tail = result["long_tail"]
+            tail_ms = sum(ms for _, ms, _ in tail)
+            all_ms = tail_ms + sum(ms for _, ms, _ in head)
+            share = f"{tail_ms / all_ms:.0%}" if all_ms else "-"
+            tail_label.config(text=f"{len(head)} 个事件占了 80% 的时间；其余 {len(tail)} 个事件合计 "
+                                   f"{fmt(tail_ms)}，占 {share}")
+            for name, ms, n in tail[:1000]:
+                tail_tree.insert("", "end", values=(name, n, fmt(ms)))
+
+        def work():
+            t0 = time.perf_counter()
+            try:
+                # 有二进制归档时直接从映射内存取列，否则分析列式表的快照
+                np = load_numpy()
+                columns = self.archive_columns(np)
+                if columns is not None:
+                    analytics = HistoryAnalytics.from_columns(*columns, np=np)
+                else:
+                    analytics = HistoryAnalytics(load(), np=np, use_numpy=np is not None)
+                result = analytics.run()
+                result["seconds"] = time.perf_counter() - t0
+            except Exception as e:
+                result = e
+            self.commands.post(ANALYSIS_READY, render, result)
+
+        threading.Thread(target=work, daemon=True).start()
+
+    def on_analysis_ready(self, render, result):
+        render(result)
+
+    def archive_columns(self, np):
+        """从二进制归档取出分析用的列，没有可用的归档时返回 None（在后台线程中调用）
+
+        取列排在写入线程中已提交的归档修改之后执行，读到的是最新且不会被同时修改的内容。
+        """
+        archive = self.history_archive
+        if archive is None:
+            return None
+        columns = []
+        self.writer.run_task(lambda: columns.append(archive.columns(np)))
+        self.writer.flush()
+        return columns[0] if columns else None
+
+    def blend_color(self, low, high, t):
+        """两个 #rrggbb 颜色之间按 t（0–1）插值"""
+        a = [int(low[i:i + 2], 16) for i in (1, 3, 5)]
+        b = [int(high[i:i + 2], 16) for i in (1, 3, 5)]
+        return "#" + "".join(f"{round(x + (y - x) * t):02x}" for x, y in zip(a, b))
+
+    def draw_heatmap(self, canvas, grid, cell=26, left=30, top=24):
+        """星期 × 小时热力图：颜色越深，该时段累计的时长越多"""
+        canvas.delete("all")
+        peak = max(max(row) for row in grid) or 1
+        for hour in range(0, 24, 3):
+            canvas.create_text(left + hour * cell + cell // 2, top // 2, text=str(hour), fill=self.fg_color)
+        for day, row in enumerate(grid):
+            y = top + day * cell
+            canvas.create_text(left // 2, y + cell // 2, text=self.WEEKDAY_NAMES[day], fill=self.fg_color)
+            for hour, ms in enumerate(row):
+                x = left + hour * cell
+                canvas.create_rectangle(x, y, x + cell - 2, y + cell - 2, outline="",
+                                        fill=self.blend_color(self.tree_bg, self.accent_color, ms / peak))
+        canvas.create_text(left, top + 7 * cell + 12, anchor="w", fill=self.fg_color,
+                           text=f"最深的格子累计 {format_duration(peak // 1000)}")
+
+    def draw_trend(self, canvas, daily, rolling, days=120, width=700, height=360, pad=30):
+        """最近 days 天每天的时长（柱）和 7 天滑动平均（折线）"""
+        canvas.delete("all")
+        daily, rolling = daily[-days:], rolling[-days:]
+        if not daily:
+            canvas.create_text(pad, pad, anchor="w", text="没有记录", fill=self.fg_color)
+            return
+        peak = max(max(ms for _, ms in daily), max(rolling)) or 1
+        step = (width - 2 * pad) / len(daily)
+        base = height - pad
+        points = []
+        for i, ((day, ms), avg) in enumerate(zip(daily, rolling)):
+            x = pad + i * step
+            canvas.create_rectangle(x, base - ms / peak * (height - 2 * pad), x + max(step - 1, 1), base,
+                                    outline="", fill=self.blend_color(self.tree_bg, self.accent_color, 0.5))
+            points += [x + step / 2, base - avg / peak * (height - 2 * pad)]
+        if len(points) >= 4:
+            canvas.create_line(*points, fill=self.accent_color, width=2)
+        canvas.create_text(pad, pad // 2, anchor="w", fill=self.fg_color,
+                           text=f"{daily[0][0]} ~ {daily[-1][0]}，最多一天 {format_duration(int(peak) // 1000)}（折线为 7 天平均）")
+
     # ---------- 日历选择对话框 ----------
     def show_calendar(self):
-        """弹出简易日历选择窗口"""
+        """弹出简易日历选择窗口（有记录的日期高亮，可选择日期范围）"""
+        import calendar
         win = tk.Toplevel(self.root)
         win.title("选择日期")
-        win.geometry("300x250")
+        win.geometry("320x300")
         win.configure(bg=self.bg_color)
         win.transient(self.root)
         win.grab_set()
@@ -1808,6 +2751,8 @@ class EventTimerApp:
         # 年月选择
         year_var = tk.IntVar(value=year)
         month_var = tk.IntVar(value=month)
+        range_var = tk.BooleanVar(value=False)
+        range_start = [None]   # 范围选择时已点选的起始日期
 
         tk.Label(top_frame, text="年:", bg=self.bg_color, fg=self.fg_color).pack(side=tk.LEFT)
         year_spin = tk.Spinbox(top_frame, from_=1900, to=2100, textvariable=year_var,
@@ -1819,10 +2764,18 @@ class EventTimerApp:
                                 width=4, bg=self.entry_bg, fg=self.entry_fg, relief="flat")
         month_spin.pack(side=tk.LEFT, padx=2)
 
+        tk.Checkbutton(top_frame, text="范围", variable=range_var,
+                       command=lambda: (range_start.__setitem__(0, None), refresh_calendar()),
+                       bg=self.bg_color, fg=self.fg_color, selectcolor=self.bg_color,
+                       activebackground=self.bg_color).pack(side=tk.LEFT, padx=(10, 0))
+
         # 日历显示区域
         cal_frame = tk.Frame(win, bg=self.bg_color)
         cal_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
 
+        hint_label = tk.Label(win, text="", bg=self.bg_color, fg=self.tag_color, font=("Arial", 9))
+        hint_label.pack(fill=tk.X, padx=10)
+
         def refresh_calendar(*args):
             # 清除现有日历
             for widget in cal_frame.winfo_children():
@@ -1832,31 +2785,62 @@ class EventTimerApp:
             m = month_var.get()
             cal = calendar.monthcalendar(y, m)
             days = ['一', '二', '三', '四', '五', '六', '日']
+            # 本月每天的记录数，直接取自按日分桶的索引；本月的分片尚未加载时读完再刷新一次
+            counts = {}
+            if self.history_store:
+                month = month_range(date(y, m, 1))
+                counts = self.history_store.day_counts(*month)
+                self.load_history_range(month, lambda: cal_frame.winfo_exists() and refresh_calendar())
 
             # 星期标题
             for i, day in enumerate(days):
                 tk.Label(cal_frame, text=day, bg=self.button_bg, fg=self.fg_color,
                          width=3, relief="flat", font=("Arial", 9, "bold")).grid(row=0, column=i, padx=1, pady=1)
 
-            # 日期按钮
+            # 日期按钮（有记录的日期高亮）
             for r, week in enumerate(cal, start=1):
                 for c, day in enumerate(week):
                     if day == 0:
                         tk.Label(cal_frame, text="", bg=self.bg_color, width=3).grid(row=r, column=c)
                     else:
+                        d = date(y, m, day)
+                        if d == range_start[0]:
+                            bg, fg = self.accent_color, "white"
+                        elif counts.get(d):
+                            bg, fg = self.tag_color, "white"
+                        else:
+                            bg, fg = self.entry_bg, self.entry_fg
                         btn = tk.Button(cal_frame, text=str(day), width=3, relief="flat",
-                                        bg=self.entry_bg, fg=self.entry_fg,
+                                        bg=bg, fg=fg,
                                         command=lambda d=day: select_date(d))
                         btn.grid(row=r, column=c, padx=1, pady=1)
 
-        def select_date(day):
-            y = year_var.get()
-            m = month_var.get()
-            date_str = f"{y:04d}-{m:02d}-{day:02d}"
-            self.specific_date_var.set(date_str)
+            if range_var.get():
+                if range_start[0] is None:
+                    hint_label.config(text="请点选起始日期")
+                else:
+                    hint_label.config(text=f"起始 {range_start[0].isoformat()}，请点选结束日期")
+            else:
+                total = sum(counts.values())
+                hint_label.config(text=f"本月共 {total} 条记录" if total else "")
+
+        def apply_range(days):
+            self.specific_date_var.set(format_day_range(days))
             win.destroy()
             self.apply_specific_date_filter()  # 自动应用筛选
 
+        def select_date(day):
+            d = date(year_var.get(), month_var.get(), day)
+            if range_var.get():
+                if range_start[0] is None:
+                    range_start[0] = d
+                    refresh_calendar()
+                    return
+                first = range_start[0]
+                apply_range((first, d) if first <= d else (d, first))
+                return
+            apply_range((d, d))
+
         refresh_calendar()
         # 绑定年月变化刷新日历
         year_spin.config(command=refresh_calendar)
@@ -1866,24 +2850,36 @@ class EventTimerApp:
         btn_frame = tk.Frame(win, bg=self.bg_color)
         btn_frame.pack(fill=tk.X, padx=10, pady=5)
 
-        tk.Button(btn_frame, text="今天", command=lambda: select_date(now.day),
-                  bg=self.accent_color, fg="white", width=8, relief="flat").pack(side=tk.LEFT, padx=5)
+        today = now.date()
+        tk.Button(btn_frame, text="今天", command=lambda: apply_range((today, today)),
+                  bg=self.accent_color, fg="white", width=6, relief="flat").pack(side=tk.LEFT, padx=2)
+        tk.Button(btn_frame, text="本周", command=lambda: apply_range(week_range(today)),
+                  bg=self.accent_color, fg="white", width=6, relief="flat").pack(side=tk.LEFT, padx=2)
+        tk.Button(btn_frame, text="本月", command=lambda: apply_range(month_range(today)),
+                  bg=self.accent_color, fg="white", width=6, relief="flat").pack(side=tk.LEFT, padx=2)
         tk.Button(btn_frame, text="取消", command=win.destroy,
-                  bg=self.button_bg, fg=self.button_fg, width=8, relief="flat").pack(side=tk.RIGHT, padx=5)
+                  bg=self.button_bg, fg=self.button_fg, width=6, relief="flat").pack(side=tk.RIGHT, padx=2)
     # ---------- 时间显示更新 ----------
     def update_time_display(self):
+        """节拍回调：标题只显示到分钟，返回到下一个整分钟的秒数"""
         now = datetime.now()
-        self.root.title(f"事件计时器 - {now.strftime('%H:%M')} - 进行中: {len(self.current_events)}")
-        self.root.after(1000, self.update_time_display)
+        title = f"事件计时器 - {now.strftime('%H:%M')} - 进行中: {len(self.current_events)}"
+        if title != self.title_text:
+            self.root.title(title)
+            self.title_text = title
+        return seconds_to_next_minute(now.second + now.microsecond / 1e6)
 
     # ---------- 清空历史 ----------
     def clear_history(self):
-        if not self.events_history:
+        if self.history_store is None:
+            messagebox.showinfo("提示", "历史记录仍在加载，请稍后再试")
+            return
+        if not self.events_history and not self.history_store.unloaded():
             messagebox.showinfo("提示", "历史记录已是空的")
             return
         if messagebox.askyesno("确认", "清空所有历史记录？此操作不可撤销。"):
-            self.events_history = []
-            self.update_history_display()
+            self.save_history_change(self.history_store.clear)
+            # 清空后直接写空快照，丢弃已有日志
             self.save_history()
             self.status_bar.config(text="历史记录已清空")
 
@@ -0,0 +1,225 @@
+from datetime import date, timedelta
+
+from history_records import MAX_MS, NO_TIME
+
+_EPOCH = date(1970, 1, 1)
+_EPOCH_WEEKDAY = _EPOCH.weekday()   # 挂钟秒数 0 所在日是星期四
+HOUR_MS = 3600 * 1000
+PERCENTILES = (50, 90, 99)
+DURATION_BITS = 43       # 2 * MAX_MS < 2**43
+
+
+def load_numpy():
+    """NumPy 为可选依赖：按需导入，未安装时返回 None"""
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+class HistoryAnalytics:
+    """多年历史的分析：每个事件的时长百分位、按“星期 × 小时”的时长热力图、每日趋势和长尾事件
+
+    输入为 ColumnTable 的快照（copy()），或由 from_columns() 接收二进制归档取出的列，可以在后台线程中计算。
+    安装了 NumPy 时把列数组直接转成 ndarray 做向量化计算，否则逐条计算；两种方式结果相同。
+    时长都以毫秒计，记录按开始时间所在的本地日期/小时统计，跨小时的记录按实际时间拆到各小时。
+    """
+
+    def __init__(self, table, np=None, use_numpy=True):
+        self.np = (np or load_numpy()) if use_numpy else None
+        self.names = table.names
+        if self.np is not None:
+            self._columns_numpy(table)
+        else:
+            self._columns_python(table)
+
+    @classmethod
+    def from_columns(cls, names, start, duration, name, np=None):
+        """由已取出的列构造（如 HistoryArchive.columns(np) 的结果）；np 须与取列时一致"""
+        self = cls.__new__(cls)
+        self.np = np
+        self.names = names
+        self.start, self.duration, self.name = start, duration, name
+        self.count = len(start)
+        return self
+
+    @property
+    def backend(self):
+        return "NumPy" if self.np is not None else "Python"
+
+    def _columns_numpy(self, table):
+        np = self.np
+        live = np.frombuffer(bytes(table.live), dtype=np.uint8).astype(bool)
+        self.start = np.frombuffer(table.start, dtype=np.int64)[live]
+        self.duration = np.frombuffer(table.duration_ms, dtype=np.int64)[live]
+        self.name = np.frombuffer(table.name, dtype=np.int32)[live].astype(np.int64)
+        self.count = int(live.sum())
+
+    def _columns_python(self, table):
+        rows = list(table.rows())
+        self.start = [table.start[row] for row in rows]
+        self.duration = [table.duration_ms[row] for row in rows]
+        self.name = [table.name[row] for row in rows]
+        self.count = len(rows)
+
+    # ---------- 时长百分位 ----------
+    def percentiles(self, qs=PERCENTILES):
+        """事件名 -> (次数, 总时长, [各百分位的时长])；百分位按线性插值（与 numpy.percentile 默认一致）"""
+        if self.np is not None:
+            return self._percentiles_numpy(qs)
+        groups = {}
+        for nid, ms in zip(self.name, self.duration):
+            groups.setdefault(nid, []).append(ms)
+        result = {}
+        for nid, values in groups.items():
+            values.sort()
+            n = len(values)
+            points = []
+            for q in qs:
+                pos = (n - 1) * q / 100
+                lo = int(pos)
+                hi = min(lo + 1, n - 1)
+                points.append(values[lo] + (values[hi] - values[lo]) * (pos - lo))
+            result[self.names[nid]] = (n, sum(values), points)
+        return result
+
+    def _percentiles_numpy(self, qs):
+        np = self.np
+        if not self.count:
+            return {}
+        if len(self.names) < 1 << (63 - DURATION_BITS):
+            # 时长在 ±MAX_MS 内，平移后放在低 DURATION_BITS 位、事件名 id 放在高位，
+            # 一次整数排序同时按事件名、时长有序，比 lexsort 快一个数量级
+            key = np.sort((self.name << DURATION_BITS) | (self.duration + MAX_MS))
+            name = key >> DURATION_BITS
+            duration = (key & ((1 << DURATION_BITS) - 1)) - MAX_MS
+        else:
+            order = np.lexsort((self.duration, self.name))
+            name, duration = self.name[order], self.duration[order]
+        starts = np.flatnonzero(np.r_[True, name[1:] != name[:-1]])
+        counts = np.diff(np.r_[starts, len(name)])
+        totals = np.add.reduceat(duration, starts)
+        columns = []
+        for q in qs:
+            pos = (counts - 1) * q / 100
+            lo = pos.astype(np.int64)
+            hi = np.minimum(lo + 1, counts - 1)
+            low, high = duration[starts + lo], duration[starts + hi]
+            columns.append(low + (high - low) * (pos - lo))
+        points = np.column_stack(columns).tolist()
+        return {self.names[nid]: (n, total, p)
+                for nid, n, total, p in zip(name[starts].tolist(), counts.tolist(), totals.tolist(), points)}
+
+    # ---------- 星期 × 小时热力图 ----------
+    def hour_of_week(self):
+        """7 × 24 的毫秒数（行为星期一到星期日，列为 0–23 点）"""
+        if self.np is not None:
+            return self._hour_of_week_numpy()
+        grid = [[0] * 24 for _ in range(7)]
+        for start, ms in zip(self.start, self.duration):
+            if start == NO_TIME:
+                continue
+            begin = start * 1000
+            end = begin + ms
+            hour = begin // HOUR_MS
+            while True:
+                seg_end = min(end, (hour + 1) * HOUR_MS)
+                day, hod = divmod(hour, 24)
+                grid[(day + _EPOCH_WEEKDAY) % 7][hod] += max(0, seg_end - max(begin, hour * HOUR_MS))
+                if seg_end >= end:
+                    break
+                hour += 1
+        return grid
+
+    def _hour_of_week_numpy(self):
+        np = self.np
+        valid = self.start != NO_TIME
+        begin = self.start[valid] * 1000
+        end = begin + self.duration[valid]
+        first = begin // HOUR_MS
+        # 每条记录覆盖的小时数（时长为 0 的记录也占它所在的一个小时）
+        spans = np.maximum((end - 1) // HOUR_MS - first + 1, 1)
+        idx = np.repeat(np.arange(len(first)), spans)
+        hour = first[idx] + np.arange(len(idx)) - np.repeat(np.cumsum(spans) - spans, spans)
+        seg = np.minimum(end[idx], (hour + 1) * HOUR_MS) - np.maximum(begin[idx], hour * HOUR_MS)
+        slot = ((hour // 24 + _EPOCH_WEEKDAY) % 7) * 24 + hour % 24
+        grid = np.bincount(slot, weights=np.maximum(seg, 0), minlength=7 * 24)
+        return grid.astype(np.int64).reshape(7, 24).tolist()
+
+    # ---------- 每日趋势 ----------
+    def daily(self):
+        """从第一条到最后一条记录的每一天的 (日期, 毫秒)，没有记录的日期为 0"""
+        if self.np is not None:
+            np = self.np
+            days = self.start[self.start != NO_TIME] // 86400
+            if not len(days):
+                return []
+            first = int(days.min())
+            weights = self.duration[self.start != NO_TIME]
+            totals = np.bincount(days - first, weights=weights).astype(np.int64).tolist()
+        else:
+            by_day = {}
+            for start, ms in zip(self.start, self.duration):
+                if start != NO_TIME:
+                    by_day[start // 86400] = by_day.get(start // 86400, 0) + ms
+            if not by_day:
+                return []
+            first = min(by_day)
+            totals = [by_day.get(day, 0) for day in range(first, max(by_day) + 1)]
+        return [(_EPOCH + timedelta(days=first + i), ms) for i, ms in enumerate(totals)]
+
+    @staticmethod
+    def rolling(series, window=7):
+        """daily() 的滑动平均（毫秒），前 window - 1 天按已有天数平均"""
+        result = []
+        total = 0
+        for i, (_, ms) in enumerate(series):
+            total += ms
+            if i >= window:
+                total -= series[i - window][1]
+            result.append(total / min(i + 1, window))
+        return result
+
+    # ---------- 长尾 ----------
+    def long_tail(self, head_share=0.8):
+        """按总时长从多到少排列事件，返回 (头部, 长尾)，元素为 (事件名, 总时长, 次数)
+
+        头部是累计时长刚达到 head_share 的那些事件，其余为长尾。
+        """
+        if self.np is not None:
+            np = self.np
+            size = len(self.names)
+            totals = np.bincount(self.name, weights=self.duration, minlength=size).astype(np.int64)
+            counts = np.bincount(self.name, minlength=size)
+            used = np.flatnonzero(counts)
+            order = used[np.argsort(-totals[used], kind="stable")]
+            ranked = list(zip(order.tolist(), totals[order].tolist(), counts[order].tolist()))
+        else:
+            totals, counts = {}, {}
+            for nid, ms in zip(self.name, self.duration):
+                totals[nid] = totals.get(nid, 0) + ms
+                counts[nid] = counts.get(nid, 0) + 1
+            ranked = sorted(((nid, totals[nid], counts[nid]) for nid in sorted(totals)), key=lambda x: -x[1])
+        grand = sum(ms for _, ms, _ in ranked)
+        head, acc = [], 0
+        for nid, ms, n in ranked:
+            if grand and acc >= grand * head_share:
+                break
+            head.append((self.names[nid], ms, n))
+            acc += ms
+        tail = [(self.names[nid], ms, n) for nid, ms, n in ranked[len(head):]]
+        return head, tail
+
+    def run(self):
+        """一次算出分析窗口需要的全部结果"""
+        daily = self.daily()
+        return {
+            "backend": self.backend,
+            "count": self.count,
+            "percentiles": self.percentiles(),
+            "hour_of_week": self.hour_of_week(),
+            "daily": daily,
+            "rolling": self.rolling(daily),
+            "long_tail": self.long_tail(),
+        }
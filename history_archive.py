@@ -0,0 +1,413 @@
+import json
+import mmap
+import os
+import struct
+import time
+from bisect import bisect_left
+from collections import namedtuple
+from functools import partial
+
+from history_records import NO_TIME, MAX_MS, RecordView, format_wall, parse_wall
+
+
+# ---------- 二进制归档格式 ----------
+# 数据文件：32 字节文件头 + 定长记录（按开始时间升序），通过 mmap 读取
+#   文件头  魔数 "ETHA"、版本、记录长度、已用槽数、墓碑数、批次戳
+#   记录    记录 id、开始挂钟秒数、结束挂钟秒数、时长毫秒、事件名 id、标签串 id（均为小端整数）
+# 字符串表：同名 .str 文件，每行一个 JSON 数组；第一行是 ["stamp", 批次戳]，
+#   之后每行 ["n", 事件名] 或 ["t", 标签串]，行序即 id。只追加，先于引用它的记录写入。
+# 两个文件的批次戳不一致（例如重建到一半崩溃）时视为损坏，需要重建。
+MAGIC = b"ETHA"
+VERSION = 1
+HEADER = struct.Struct("<4sHHqqq")
+RECORD = struct.Struct("<qqqqii")
+DELETED = -1             # 事件名 id 为 -1 的记录是墓碑
+CHECKSUM_MASK = (1 << 64) - 1
+
+ArchiveRow = namedtuple("ArchiveRow", "id start end duration_ms name tagset")
+RECORD_FIELDS = (("id", "<i8"), ("start", "<i8"), ("end", "<i8"),
+                 ("duration_ms", "<i8"), ("name", "<i4"), ("tagset", "<i4"))   # 与 RECORD 一致的 NumPy 结构
+
+
+def record_fields(rec):
+    """记录（RecordView 或字典）-> 写入归档的值 (记录 id, 开始, 结束, 时长毫秒, 事件名, 标签串)"""
+    if isinstance(rec, RecordView):
+        t, row = rec.table, rec.row
+        start, end, ms = t.start[row], t.end[row], t.duration_ms[row]
+    else:
+        start = parse_wall(rec.get("start_time"))
+        end = parse_wall(rec.get("end_time"))
+        start = NO_TIME if start is None else start
+        end = NO_TIME if end is None else end
+        ms = rec.get("duration_ms")
+        if not isinstance(ms, int):
+            ms = (rec.get("duration_seconds") or 0) * 1000
+        ms = max(-MAX_MS, min(ms, MAX_MS))
+    event = rec.get("event", "")
+    tags = rec.get("tags", "") or ""
+    return (rec["id"], start, end, ms, event if isinstance(event, str) else str(event),
+            tags if isinstance(tags, str) else str(tags))
+
+
+def _checksum(total, fields):
+    # hash() 只在同一进程内稳定：校验和不保存，只用于同一次比较
+    return (total + hash(fields)) & CHECKSUM_MASK
+
+
+class StartColumn:
+    """开始时间列的只读序列视图，供 bisect 直接在映射内存上二分查找"""
+    __slots__ = ("archive",)
+
+    def __init__(self, archive):
+        self.archive = archive
+
+    def __len__(self):
+        return self.archive.slots
+
+    def __getitem__(self, i):
+        return struct.unpack_from("<q", self.archive.buf, HEADER.size + i * RECORD.size + 8)[0]
+
+
+class HistoryArchive:
+    """紧凑的二进制历史归档（可选，与 events_history.json 放在一起）
+
+    每条记录定长，按开始时间排序，读取全部经 mmap：按下标随机访问、按开始时间二分定位、
+    区间扫描都直接在映射内存上解包，不复制、不解析 JSON。
+    事件名和标签串按 id 存在字符串表中，统计时可以先按 id 聚合，最后才换成字符串。
+
+    follow(store, writer) 之后随历史存储的变更增量维护：新增记录按开始时间插入（通常就在末尾），
+    修改在原位改写，删除只打墓碑，墓碑过多时原地压实；清空或整体替换时重建。
+    这些修改都由写入线程按顺序执行，历史存储所在的 Tk 线程不做任何归档文件的读写。
+    扫描得到的迭代器持有映射内存的引用，不要在遍历过程中修改归档。
+    """
+    MIN_CAPACITY = 1024
+
+    def __init__(self, path):
+        self.path = path
+        self.str_path = path + ".str"
+        self.file = None
+        self.mm = None
+        self.buf = None          # mmap 上的 memoryview
+        self.slots = 0           # 已用槽数（含墓碑）
+        self.deleted = 0
+        self.stamp = 0
+        self.names = []
+        self.name_ids = {}
+        self.tagsets = []
+        self.tagset_ids = {}
+        self.starts = StartColumn(self)
+
+    # ---------- 打开与关闭 ----------
+    def open(self):
+        """打开已有归档；文件不存在或格式不对返回 False（此时应调用 rebuild）"""
+        self.close()
+        if not (os.path.exists(self.path) and os.path.exists(self.str_path)):
+            return False
+        try:
+            stamp, names, tagsets = self._read_strings()
+            self._map()
+            magic, version, size, slots, deleted, head_stamp = HEADER.unpack_from(self.buf, 0)
+            if (magic != MAGIC or version != VERSION or size != RECORD.size or head_stamp != stamp
+                    or HEADER.size + slots * RECORD.size > len(self.mm)):
+                self.close()
+                return False
+        except (OSError, ValueError, struct.error):
+            self.close()
+            return False
+        self.slots, self.deleted, self.stamp = slots, deleted, stamp
+        self.names, self.tagsets = names, tagsets
+        self.name_ids = {s: i for i, s in enumerate(names)}
+        self.tagset_ids = {s: i for i, s in enumerate(tagsets)}
+        return True
+
+    def sync(self, records):
+        """打开归档，文件不存在、损坏或与 records 不一致时重建；失败返回 False"""
+        try:
+            if not (self.open() and self.matches(records)):
+                self.rebuild(records)
+        except OSError:
+            self.close()
+            return False
+        return True
+
+    def _read_strings(self):
+        names, tagsets = [], []
+        with open(self.str_path, 'r', encoding='utf-8') as f:
+            kind, stamp = json.loads(f.readline())
+            if kind != "stamp":
+                raise ValueError("字符串表缺少批次戳")
+            for line in f:
+                if not line.endswith("\n"):
+                    break    # 崩溃时留下的半行：它引用的记录不可能已写入
+                kind, text = json.loads(line)
+                (names if kind == "n" else tagsets).append(text)
+        return stamp, names, tagsets
+
+    def _map(self):
+        self.file = open(self.path, 'r+b')
+        self.mm = mmap.mmap(self.file.fileno(), 0)
+        self.buf = memoryview(self.mm)
+
+    def _unmap(self):
+        if self.buf is not None:
+            self.buf.release()
+            self.buf = None
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.flush()
+        self._unmap()
+
+    def remove(self):
+        """关闭并删除归档文件（停用归档时调用）"""
+        self.close()
+        for path in (self.path, self.str_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    # ---------- 读取 ----------
+    def __len__(self):
+        return self.slots - self.deleted
+
+    def row(self, i):
+        """第 i 个槽的原始记录（可能是墓碑）"""
+        return ArchiveRow._make(RECORD.unpack_from(self.buf, HEADER.size + i * RECORD.size))
+
+    def record(self, i):
+        """第 i 个槽 -> 记录字典（字段名与历史存储一致；无法解析的时间为空字符串）"""
+        r = self.row(i)
+        return {
+            "id": r.id,
+            "event": self.names[r.name],
+            "tags": self.tagsets[r.tagset],
+            "start_time": "" if r.start == NO_TIME else format_wall(r.start),
+            "end_time": "" if r.end == NO_TIME else format_wall(r.end),
+            "duration_ms": r.duration_ms,
+        }
+
+    def bisect(self, start):
+        """第一个开始时间 >= start（挂钟秒数）的槽位"""
+        return bisect_left(self.starts, start)
+
+    def scan(self, first=None, last=None):
+        """开始时间在 [first, last) 内的存活记录（挂钟秒数，None 表示不限），按开始时间升序"""
+        lo = 0 if first is None else self.bisect(first)
+        hi = self.slots if last is None else self.bisect(last)
+        if lo >= hi:
+            return
+        for r in RECORD.iter_unpack(self.buf[HEADER.size + lo * RECORD.size:HEADER.size + hi * RECORD.size]):
+            if r[4] != DELETED:
+                yield ArchiveRow._make(r)
+
+    def columns(self, np=None):
+        """分析用的列：(事件名表, 开始挂钟秒数, 时长毫秒, 事件名 id)，只含存活记录，都是副本
+
+        np 为 NumPy 模块时用 np.frombuffer 直接按记录结构读取映射内存，三列为 int64 数组；否则为列表。
+        读取期间归档不能被修改，应在写入线程中调用。归档不可用时返回 None。
+        """
+        if self.mm is None:
+            return None
+        if np is None:
+            rows = list(self.scan())
+            return (list(self.names), [r.start for r in rows],
+                    [r.duration_ms for r in rows], [r.name for r in rows])
+        view = np.frombuffer(self.mm, dtype=np.dtype(list(RECORD_FIELDS)), count=self.slots, offset=HEADER.size)
+        try:
+            live = view["name"] != DELETED
+            # 布尔下标得到的是副本；映射内存的引用在返回前释放，之后归档才能扩容或关闭
+            return (list(self.names), view["start"][live], view["duration_ms"][live],
+                    view["name"][live].astype(np.int64))
+        finally:
+            del view
+
+    def name(self, nid):
+        return self.names[nid]
+
+    def tags(self, sid):
+        return self.tagsets[sid]
+
+    def summary(self):
+        """(存活记录数, 最大记录 id, 时长总和, 校验和)，用于判断归档是否与历史存储一致
+
+        校验和覆盖每条记录的全部字段（含事件名和标签串），改名、重新打标签都会改变它。
+        """
+        count = max_id = total = checksum = 0
+        names, tagsets = self.names, self.tagsets
+        for r in self.scan():
+            count += 1
+            max_id = max(max_id, r.id)
+            total += r.duration_ms
+            checksum = _checksum(checksum, (r.id, r.start, r.end, r.duration_ms, names[r.name], tagsets[r.tagset]))
+        return count, max_id, total, checksum
+
+    def matches(self, records):
+        count = max_id = total = checksum = 0
+        for rec in records:
+            fields = record_fields(rec)
+            count += 1
+            max_id = max(max_id, fields[0])
+            total += fields[3]
+            checksum = _checksum(checksum, fields)
+        return self.summary() == (count, max_id, total, checksum)
+
+    # ---------- 编码 ----------
+    def _intern(self, text, table, ids, kind, pending):
+        sid = ids.get(text)
+        if sid is None:
+            sid = ids[text] = len(table)
+            table.append(text)
+            pending.append(json.dumps([kind, text], ensure_ascii=False) + "\n")
+        return sid
+
+    def _encode(self, rec, pending):
+        rid, start, end, ms, event, tags = record_fields(rec)
+        nid = self._intern(event, self.names, self.name_ids, "n", pending)
+        sid = self._intern(tags, self.tagsets, self.tagset_ids, "t", pending)
+        return rid, start, end, ms, nid, sid
+
+    def _write_strings(self, lines):
+        if lines:
+            with open(self.str_path, 'a', encoding='utf-8') as f:
+                f.write("".join(lines))
+
+    def _write_header(self):
+        HEADER.pack_into(self.buf, 0, MAGIC, VERSION, RECORD.size, self.slots, self.deleted, self.stamp)
+
+    # ---------- 重建 ----------
+    def rebuild(self, records):
+        """由历史记录整体重建归档（先写临时文件再替换）"""
+        self.close()
+        self.names, self.name_ids, self.tagsets, self.tagset_ids = [], {}, [], {}
+        self.stamp = time.time_ns()
+        lines = [json.dumps(["stamp", self.stamp]) + "\n"]
+        rows = sorted((self._encode(rec, lines) for rec in records), key=lambda r: (r[1], r[0]))
+        capacity = max(self.MIN_CAPACITY, len(rows) * 2)
+        data = bytearray(HEADER.size + capacity * RECORD.size)
+        HEADER.pack_into(data, 0, MAGIC, VERSION, RECORD.size, len(rows), 0, self.stamp)
+        offset = HEADER.size
+        for r in rows:
+            RECORD.pack_into(data, offset, *r)
+            offset += RECORD.size
+        for path, content, mode in ((self.str_path, "".join(lines), 'w'), (self.path, data, 'wb')):
+            tmp = path + ".tmp"
+            with open(tmp, mode, **({} if 'b' in mode else {"encoding": "utf-8"})) as f:
+                f.write(content)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+        self.slots, self.deleted = len(rows), 0
+        self._map()
+
+    # ---------- 增量维护 ----------
+    def follow(self, store, writer):
+        """订阅历史存储的变更；归档的修改交给 writer（WriteBehindWriter）在写入线程中按顺序执行"""
+        store.add_listener(lambda kind, rec, old: self.on_history_change(store, writer, kind, rec, old))
+
+    def on_history_change(self, store, writer, kind, rec, old):
+        # 在通知所在的线程中只取出这次变更的数据（记录视图之后可能被改动），不碰归档文件
+        if kind == "add":
+            task = partial(self.insert, rec.to_dict())
+        elif kind == "update":
+            task = partial(self.update, rec.to_dict(), old)
+        elif kind == "delete":
+            task = partial(self.delete, rec.id, rec.table.start[rec.row])
+        else:
+            # 清空或整体替换：按需加载的后端也要包含尚未加载的部分，在写入线程中读取
+            load = store.snapshot()
+            task = lambda: self.rebuild(load())
+        writer.run_task(lambda: self.apply(task))
+
+    def apply(self, task):
+        """执行一次归档修改（在写入线程中调用）"""
+        if self.mm is None:
+            return
+        try:
+            task()
+        except (OSError, ValueError, BufferError):
+            # 归档只是历史的副本：写不进去就停止维护，下次启动时发现不一致会重建
+            self._unmap()
+
+    def _ensure_capacity(self, slots):
+        size = HEADER.size + slots * RECORD.size
+        if size <= len(self.mm):
+            return
+        new_size = HEADER.size + max(slots, (len(self.mm) - HEADER.size) // RECORD.size * 2) * RECORD.size
+        # 映射存在时不能改变文件大小（Windows），先解除映射
+        self._unmap()
+        with open(self.path, 'r+b') as f:
+            f.truncate(new_size)
+        self._map()
+
+    def _locate(self, rid, start):
+        i = self.bisect(start)
+        while i < self.slots:
+            r = self.row(i)
+            if r.start != start:
+                break
+            if r.id == rid and r.name != DELETED:
+                return i
+            i += 1
+        return -1
+
+    def insert(self, rec):
+        """按开始时间插入一条记录；通常插在末尾，否则只移动其后的记录"""
+        lines = []
+        values = self._encode(rec, lines)
+        self._write_strings(lines)
+        self._ensure_capacity(self.slots + 1)
+        i = bisect_left(self.starts, values[1] + 1)   # 同一开始时间的排在后面
+        at = HEADER.size + i * RECORD.size
+        end = HEADER.size + self.slots * RECORD.size
+        if i < self.slots:
+            self.buf[at + RECORD.size:end + RECORD.size] = self.buf[at:end]
+        RECORD.pack_into(self.buf, at, *values)
+        self.slots += 1
+        self._write_header()
+
+    def update(self, rec, old):
+        """修改记录（rec、old 为修改后、修改前的字典）：开始时间不变时原位改写，否则删除后重新插入"""
+        start = parse_wall(old.get("start_time"))
+        i = self._locate(old["id"], NO_TIME if start is None else start)
+        lines = []
+        values = self._encode(rec, lines)
+        if i >= 0 and values[1] == self.row(i).start:
+            self._write_strings(lines)
+            RECORD.pack_into(self.buf, HEADER.size + i * RECORD.size, *values)
+            return
+        if i >= 0:
+            self._tombstone(i)
+        self._write_strings(lines)
+        self.insert(rec)
+
+    def delete(self, rid, start):
+        """删除记录 id 为 rid、开始挂钟秒数为 start 的记录"""
+        i = self._locate(rid, start)
+        if i >= 0:
+            self._tombstone(i)
+
+    def _tombstone(self, i):
+        struct.pack_into("<i", self.buf, HEADER.size + i * RECORD.size + 32, DELETED)
+        self.deleted += 1
+        if self.deleted > max(self.MIN_CAPACITY, self.slots // 4):
+            self.compact()
+        else:
+            self._write_header()
+
+    def compact(self):
+        """原地去掉墓碑"""
+        live = [r for r in RECORD.iter_unpack(self.buf[HEADER.size:HEADER.size + self.slots * RECORD.size])
+                if r[4] != DELETED]
+        offset = HEADER.size
+        for r in live:
+            RECORD.pack_into(self.buf, offset, *r)
+            offset += RECORD.size
+        self.slots, self.deleted = len(live), 0
+        self._write_header()
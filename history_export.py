@@ -0,0 +1,193 @@
+import json
+import os
+from datetime import date, datetime, timezone
+
+from history_records import NO_TIME, format_wall
+
+EXPORT_FORMATS = ("csv", "jsonl", "ics")
+CSV_FIELDS = ("id", "event", "tags", "start_time", "end_time", "duration", "duration_seconds", "duration_ms")
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def row_filter(table, tags=None, days=None, match_all=False):
+    """筛选条件 -> 判断行号是否满足条件的函数，与 record_matches 的语义相同；没有条件时返回 None
+
+    直接读取列数组：标签条件先换算成满足条件的标签串 id 集合，日期条件换算成挂钟秒数范围，
+    不为每条记录解析标签或时间。
+    """
+    allowed = None
+    if tags:
+        wanted = {table.tag_ids[t] for t in tags if t in table.tag_ids}
+        complete = len(wanted) == len(tags)
+        allowed = set()
+        for sid, tids in enumerate(table.tagset_tags):
+            if (complete and wanted.issubset(tids)) if match_all else not wanted.isdisjoint(tids):
+                allowed.add(sid)
+    if days is None:
+        if allowed is None:
+            return None
+        tagset = table.tagset
+        return lambda row: tagset[row] in allowed
+    lo = (days[0].toordinal() - _EPOCH_ORDINAL) * 86400
+    hi = (days[1].toordinal() + 1 - _EPOCH_ORDINAL) * 86400
+    start, tagset = table.start, table.tagset
+
+    def match(row):
+        if allowed is not None and tagset[row] not in allowed:
+            return False
+        secs = start[row]
+        # 开始时间无法解析的记录不受日期筛选限制（与 DayIndex 一致）
+        return secs == NO_TIME or lo <= secs < hi
+    return match
+
+
+def iter_rows(table, tags=None, days=None, match_all=False):
+    """按筛选条件逐行产出行号，不生成中间列表"""
+    match = row_filter(table, tags, days, match_all)
+    if match is None:
+        return table.rows()
+    return (row for row in table.rows() if match(row))
+
+
+# ---------- 各格式的逐条写出 ----------
+class CsvWriter:
+    encoding = 'utf-8-sig'     # 带 BOM，Excel 能正确识别中文
+
+    def __init__(self, f):
+        import csv    # 只在导出 CSV 时才需要
+        self.writer = csv.writer(f)
+        self.writer.writerow(CSV_FIELDS)
+
+    def write(self, view):
+        rec = view.to_dict()
+        self.writer.writerow([rec.get(k, "") for k in CSV_FIELDS])
+        return True
+
+    def close(self):
+        pass
+
+
+class JsonlWriter:
+    encoding = 'utf-8'
+
+    def __init__(self, f):
+        self.f = f
+
+    def write(self, view):
+        self.f.write(json.dumps(view.to_dict(), ensure_ascii=False) + "\n")
+        return True
+
+    def close(self):
+        pass
+
+
+def ics_escape(text):
+    return (text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+            .replace("\r\n", "\\n").replace("\n", "\\n"))
+
+
+def ics_fold(line):
+    """按 RFC 5545 把超过 75 字节的内容行折行（不拆开多字节字符）"""
+    data = line.encode('utf-8')
+    if len(data) <= 75:
+        return line + "\r\n"
+    parts, current, size = [], [], 0
+    for ch in line:
+        n = len(ch.encode('utf-8'))
+        # 续行以一个空格开头，占一个字节
+        if size + n > (75 if not parts else 74):
+            parts.append("".join(current))
+            current, size = [], 0
+        current.append(ch)
+        size += n
+    parts.append("".join(current))
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def ics_time(secs):
+    """挂钟秒数 -> 不带时区的本地时间（floating time）"""
+    return format_wall(secs).replace("-", "").replace(":", "").replace(" ", "T")
+
+
+class IcsWriter:
+    """每条记录一个 VEVENT；开始时间无法解析的记录跳过"""
+    encoding = 'utf-8'
+
+    def __init__(self, f):
+        import socket    # 只在导出 iCalendar 时才需要
+        self.f = f
+        self.stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        self.host = socket.gethostname() or "localhost"
+        f.write("BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//Event Timer//History Export//ZH\r\n"
+                "CALSCALE:GREGORIAN\r\n")
+
+    def write(self, view):
+        t, row = view.table, view.row
+        start, end = t.start[row], t.end[row]
+        if start == NO_TIME:
+            return False
+        if end == NO_TIME or end < start:
+            end = start + max(t.duration_ms[row], 0) // 1000
+        lines = [
+            "BEGIN:VEVENT",
+            f"UID:event-timer-{view.id}@{self.host}",
+            f"DTSTAMP:{self.stamp}",
+            f"DTSTART:{ics_time(start)}",
+            f"DTEND:{ics_time(end)}",
+            f"SUMMARY:{ics_escape(view['event'])}",
+        ]
+        tags = t.tags_of(row)
+        if tags:
+            lines.append("CATEGORIES:" + ",".join(ics_escape(tag) for tag in tags))
+        lines.append(f"DESCRIPTION:{ics_escape('时长 ' + view['duration'])}")
+        lines.append("END:VEVENT")
+        self.f.write("".join(ics_fold(line) for line in lines))
+        return True
+
+    def close(self):
+        self.f.write("END:VCALENDAR\r\n")
+
+
+WRITERS = {"csv": CsvWriter, "jsonl": JsonlWriter, "ics": IcsWriter}
+
+
+def export_history(table, path, fmt, tags=None, days=None, match_all=False,
+                   progress=None, cancel=None, every=5000):
+    """把满足筛选条件的记录流式写入 path，返回写出的条数；被取消时返回 None
+
+    记录逐条格式化后写进带缓冲的文件，内存占用与记录条数无关。先写 path + ".part"，
+    完成后再改名，取消或出错时删除临时文件。table 应为 ColumnTable 的快照（copy()），
+    可以在后台线程中调用；progress(已扫描行数, 总行数, 已写出条数) 每扫描 every 行调用一次，
+    cancel 为 threading.Event，同样每扫描 every 行检查一次（不论这些行是否满足筛选条件）。
+    """
+    cls = WRITERS[fmt]
+    tmp = path + ".part"
+    total = len(table.live)
+    match = row_filter(table, tags, days, match_all)
+    written = 0
+    next_report = every
+    try:
+        with open(tmp, 'w', encoding=cls.encoding, newline='') as f:
+            writer = cls(f)
+            for row in table.rows():
+                if (match is None or match(row)) and writer.write(table.view(row)):
+                    written += 1
+                if row >= next_report:
+                    next_report = row + every
+                    if cancel is not None and cancel.is_set():
+                        break
+                    if progress is not None:
+                        progress(row, total, written)
+            else:
+                writer.close()
+        if cancel is not None and cancel.is_set():
+            os.remove(tmp)
+            return None
+        os.replace(tmp, path)
+    except:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    if progress is not None:
+        progress(total, total, written)
+    return written
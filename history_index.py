@@ -0,0 +1,227 @@
+from array import array
+from bisect import bisect_left, insort
+from datetime import date, timedelta
+
+from history_records import NO_TIME, parse_tags, parse_wall, wall_day
+
+
+def bits_from_positions(positions, size):
+    """由位置列表一次性构造位图（比逐位 |= 快得多）"""
+    buf = bytearray((size + 7) // 8)
+    for p in positions:
+        buf[p >> 3] |= 1 << (p & 7)
+    return int.from_bytes(buf, 'little')
+
+
+def iter_bits(bits):
+    """按从低到高的顺序返回位图中为 1 的位置"""
+    s = bin(bits)[:1:-1]
+    i = s.find('1')
+    while i >= 0:
+        yield i
+        i = s.find('1', i + 1)
+
+
+class TagIndex:
+    """标签倒排索引
+
+    每个标签对应一个位图（Python 整数），第 i 位为 1 表示列式表第 i 行的记录带有该标签。
+    行号在表中不复用，因此新增、删除、改标签都只改动该记录的几个位；
+    多标签筛选是位图的与/或运算，再按命中的位取出记录。
+    """
+
+    def __init__(self, table):
+        self.rebuild(table)
+
+    def rebuild(self, table):
+        self.table = table
+        positions = {}
+        tagset = table.tagset
+        tagset_tags = table.tagset_tags
+        for row in table.rows():
+            for tid in tagset_tags[tagset[row]]:
+                positions.setdefault(tid, []).append(row)
+        size = len(table.live)
+        self.postings = {table.tag_names[tid]: bits_from_positions(p, size)
+                         for tid, p in positions.items()}
+
+    def add(self, rec):
+        self._set_tags(rec.row, parse_tags(rec.get("tags", "")))
+
+    def remove(self, rec):
+        self._clear_tags(rec.row, parse_tags(rec.get("tags", "")))
+
+    def update(self, rec, old):
+        old_tags = set(parse_tags(old.get("tags", "")))
+        new_tags = set(parse_tags(rec.get("tags", "")))
+        self._clear_tags(rec.row, old_tags - new_tags)
+        self._set_tags(rec.row, new_tags - old_tags)
+
+    def _set_tags(self, row, tags):
+        bit = 1 << row
+        for t in tags:
+            self.postings[t] = self.postings.get(t, 0) | bit
+
+    def _clear_tags(self, row, tags):
+        mask = ~(1 << row)
+        for t in tags:
+            bits = self.postings.get(t, 0) & mask
+            if bits:
+                self.postings[t] = bits
+            else:
+                self.postings.pop(t, None)
+
+    def match(self, tags, match_all=False):
+        """返回带有任一（match_all 时为全部）所选标签的槽位位图"""
+        if match_all:
+            bits = -1
+            for t in tags:
+                bits &= self.postings.get(t, 0)
+                if not bits:
+                    break
+            return max(bits, 0)
+        bits = 0
+        for t in tags:
+            bits |= self.postings.get(t, 0)
+        return bits
+
+    def contains(self, bits, rec):
+        return (bits >> rec.row) & 1 == 1
+
+    def records(self, bits):
+        view = self.table.view
+        return [view(row) for row in iter_bits(bits)]
+
+
+# ---------- 按日分桶 ----------
+def record_day(rec):
+    """记录开始时间所在的本地日期；无法解析时返回 None"""
+    if not isinstance(rec, dict):
+        return rec.day
+    secs = parse_wall(rec.get("start_time"))
+    return None if secs is None else wall_day(secs)
+
+
+def week_range(today):
+    """today 所在周（周一到周日）"""
+    first = today - timedelta(days=today.weekday())
+    return first, first + timedelta(days=6)
+
+
+def month_range(today):
+    """today 所在月（1 日到月末）"""
+    first = today.replace(day=1)
+    nxt = (first + timedelta(days=32)).replace(day=1)
+    return first, nxt - timedelta(days=1)
+
+
+def parse_day_range(text, today=None):
+    """解析日期筛选文本，返回闭区间 (起, 止)；无法解析时返回 None
+
+    支持 "2024-05-01"、"2024-05-01~2024-05-07"（也可用“至”分隔）、"本周"、"本月"。
+    """
+    text = text.strip()
+    if not text:
+        return None
+    today = today or date.today()
+    if text == "本周":
+        return week_range(today)
+    if text == "本月":
+        return month_range(today)
+    parts = text.replace("至", "~").split("~")
+    try:
+        if len(parts) == 1:
+            d = date.fromisoformat(parts[0].strip())
+            return d, d
+        if len(parts) == 2:
+            first = date.fromisoformat(parts[0].strip())
+            last = date.fromisoformat(parts[1].strip())
+            return (first, last) if first <= last else (last, first)
+    except ValueError:
+        pass
+    return None
+
+
+def format_day_range(days):
+    first, last = days
+    if first == last:
+        return first.isoformat()
+    return f"{first.isoformat()}~{last.isoformat()}"
+
+
+class DayIndex:
+    """按本地日期分桶的历史索引
+
+    加载和新增时把记录的行号放进开始日期对应的桶，days 保存有记录的日期（有序）。
+    单日筛选直接取桶，日期范围沿 days 顺序遍历相邻的桶。
+    开始时间无法解析的记录放在 undated 中，任何日期筛选都包含它们（与旧行为一致）。
+    """
+
+    def __init__(self, table):
+        self.rebuild(table)
+
+    def rebuild(self, table):
+        self.table = table
+        self.undated = array('i')
+        start = table.start
+        by_day = {}
+        for row in table.rows():
+            secs = start[row]
+            if secs == NO_TIME:
+                self.undated.append(row)
+                continue
+            key = secs // 86400
+            bucket = by_day.get(key)
+            if bucket is None:
+                bucket = by_day[key] = array('i')
+            bucket.append(row)
+        # 日期 -> 行号数组
+        self.buckets = {wall_day(key * 86400): bucket for key, bucket in by_day.items()}
+        self.days = sorted(self.buckets)    # 有记录的日期，升序
+
+    def add(self, rec):
+        d = rec.day
+        if d is None:
+            self.undated.append(rec.row)
+            return
+        bucket = self.buckets.get(d)
+        if bucket is None:
+            bucket = self.buckets[d] = array('i')
+            insort(self.days, d)
+        bucket.append(rec.row)
+
+    def remove(self, rec):
+        self._remove(rec.row, rec.day)
+
+    def _remove(self, row, d):
+        bucket = self.undated if d is None else self.buckets.get(d)
+        if bucket is None or row not in bucket:
+            return
+        bucket.remove(row)
+        if d is not None and not bucket:
+            del self.buckets[d]
+            del self.days[bisect_left(self.days, d)]
+
+    def update(self, rec, old):
+        old_day = record_day(old)
+        if old_day != rec.day:
+            self._remove(rec.row, old_day)
+            self.add(rec)
+
+    def records(self, first, last):
+        """闭区间 [first, last] 内的记录"""
+        if first == last:
+            rows = list(self.buckets.get(first, ()))
+        else:
+            rows = []
+            days = self.days
+            i = bisect_left(days, first)
+            while i < len(days) and days[i] <= last:
+                rows.extend(self.buckets[days[i]])
+                i += 1
+        rows.extend(self.undated)
+        view = self.table.view
+        return [view(row) for row in rows]
+
+    def count(self, day):
+        return len(self.buckets.get(day, ()))
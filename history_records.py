@@ -0,0 +1,391 @@
+from array import array
+from bisect import bisect_left
+from datetime import date
+
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+FIELDS = ("id", "event", "tags", "start_time", "end_time", "duration", "duration_seconds", "duration_ms")
+NO_TIME = -(1 << 63)      # 时间列中表示“原始字符串无法解析”
+MAX_MS = (2 ** 31 - 1) * 1000    # 时长上限（与旧的 int32 秒数一致）
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def parse_tags(tag_str):
+    """解析标签字符串（逗号或空格分隔，# 前缀可选）"""
+    if not tag_str:
+        return []
+    tags = set()
+    for part in tag_str.split(','):
+        for sub in part.split():
+            t = sub.strip()
+            if t:
+                if t.startswith('#'):
+                    t = t[1:]
+                tags.add(t)
+    return list(tags)
+
+
+def format_duration(sec):
+    h = int(sec // 3600)
+    m = int((sec % 3600) // 60)
+    return f"{h}h{m:02d}m"
+
+
+# ---------- 挂钟秒数 ----------
+# 历史时间是本地时间字符串，这里按“挂钟秒数”存储：把本地日期时间当作从 1970-01-01 00:00:00 起的秒数，
+# 不做时区换算，因此与字符串可以无损互转，整除 86400 即得本地日期。
+def parse_wall(text):
+    """'YYYY-MM-DD HH:MM:SS' -> 挂钟秒数；格式不符返回 None"""
+    if not isinstance(text, str) or len(text) != 19 or text[4] != '-' or text[7] != '-' \
+            or text[10] != ' ' or text[13] != ':' or text[16] != ':':
+        return None
+    digits = text[0:4] + text[5:7] + text[8:10] + text[11:13] + text[14:16] + text[17:19]
+    if not (digits.isascii() and digits.isdigit()):
+        return None
+    h, m, s = int(text[11:13]), int(text[14:16]), int(text[17:19])
+    if h > 23 or m > 59 or s > 59:
+        return None
+    try:
+        d = date(int(text[0:4]), int(text[5:7]), int(text[8:10]))
+    except ValueError:
+        return None
+    return (d.toordinal() - _EPOCH_ORDINAL) * 86400 + h * 3600 + m * 60 + s
+
+
+def format_wall(secs):
+    days, rem = divmod(secs, 86400)
+    d = date.fromordinal(_EPOCH_ORDINAL + days)
+    h, rem = divmod(rem, 3600)
+    m, s = divmod(rem, 60)
+    return f"{d.year:04d}-{d.month:02d}-{d.day:02d} {h:02d}:{m:02d}:{s:02d}"
+
+
+def wall_day(secs):
+    return date.fromordinal(_EPOCH_ORDINAL + secs // 86400)
+
+
+def _parse_duration_text(text):
+    """解析 'XhYYm' 形式的时长字符串，失败返回 None"""
+    if not isinstance(text, str) or not text.endswith('m'):
+        return None
+    h, sep, m = text[:-1].partition('h')
+    if not sep or not h.isdigit() or not m.isdigit():
+        return None
+    return int(h) * 3600 + int(m) * 60
+
+
+class RecordView:
+    """列式存储中一行历史记录的只读视图
+
+    用法与原来的记录字典相同（rec["event"]、rec.get("tags", "")、dict(rec)），
+    但字段值按需从列中取出并格式化；修改请通过存储的 update()。
+    两个视图指向同一张表的同一行即视为相等。
+    """
+    __slots__ = ("table", "row")
+
+    def __init__(self, table, row):
+        self.table = table
+        self.row = row
+
+    def __getitem__(self, key):
+        t = self.table
+        row = self.row
+        extra = t.extras.get(row)
+        if extra is not None and key in extra:
+            return extra[key]
+        if key == "id":
+            return t.ids[row]
+        if key == "event":
+            return t.names[t.name[row]]
+        if key == "tags":
+            return t.tagsets[t.tagset[row]]
+        if key == "start_time":
+            return format_wall(t.start[row])
+        if key == "end_time":
+            return format_wall(t.end[row])
+        if key == "duration":
+            return format_duration(t.duration_ms[row] // 1000)
+        if key == "duration_seconds":
+            return t.duration_ms[row] // 1000
+        if key == "duration_ms":
+            return t.duration_ms[row]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        extra = self.table.extras.get(self.row)
+        if not extra:
+            return FIELDS
+        return FIELDS + tuple(k for k in extra if k not in FIELDS)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def to_dict(self):
+        return {k: self[k] for k in self.keys()}
+
+    @property
+    def id(self):
+        return self.table.ids[self.row]
+
+    # 排序、筛选直接读取列，避免格式化字符串
+    @property
+    def start_wall(self):
+        return self.table.start[self.row]
+
+    @property
+    def duration_seconds(self):
+        return self.table.duration_ms[self.row] // 1000
+
+    @property
+    def duration_ms(self):
+        return self.table.duration_ms[self.row]
+
+    @property
+    def day(self):
+        secs = self.table.start[self.row]
+        return None if secs == NO_TIME else wall_day(secs)
+
+    def __eq__(self, other):
+        return isinstance(other, RecordView) and other.table is self.table and other.row == self.row
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.row)
+
+    def __repr__(self):
+        return f"RecordView({self.to_dict()!r})"
+
+
+class ColumnTable:
+    """历史记录的列式内存表示
+
+    每条记录占一行：开始/结束时间为 int64 挂钟秒数，时长为 int64 毫秒（秒数由毫秒换算），
+    事件名和标签字符串都驻留为整数 id（标签字符串另外解析为标签 id 元组）。
+    与原始字符串不能互转的字段（无法解析的时间、非标准时长、额外字段）
+    按行放在 extras 中，因此导出的字典与导入时完全一致。
+    删除只打墓碑标记，行号在表的生命周期内不变、不复用，可直接作为索引中的位置。
+
+    每条记录另有持久的记录 id（随记录保存）。id 按行号严格递增分配，
+    因此 ids 列本身有序，按 id 查找记录是一次二分查找，不需要额外的字典。
+    按需加载的旧分片会以 keep_id=True 追加 id 较小的记录，此后改用 id -> 行号的字典查找。
+    """
+
+    def __init__(self):
+        self.ids = array('q')
+        self.start = array('q')
+        self.end = array('q')
+        self.duration_ms = array('q')
+        self.name = array('i')
+        self.tagset = array('i')
+        self.live = bytearray()
+        self.names = []            # 事件名 id -> 事件名
+        self.name_ids = {}
+        self.tagsets = []          # 标签串 id -> 原始标签字符串
+        self.tagset_ids = {}
+        self.tagset_tags = []      # 标签串 id -> 标签 id 元组
+        self.tag_names = []        # 标签 id -> 标签名
+        self.tag_ids = {}
+        self.extras = {}           # 行号 -> {字段: 原始值}，只在少数记录上存在
+        self.count = 0
+        self.next_id = 1
+        self.assigned_ids = False  # 是否为缺少 id（或 id 顺序不对）的记录分配了新 id
+        self.id_rows = None        # ids 列不再有序时的 id -> 行号
+
+    @classmethod
+    def from_records(cls, records):
+        table = cls()
+        for rec in records:
+            table.append(rec)
+        return table
+
+    # ---------- 驻留 ----------
+    def _name_id(self, name):
+        nid = self.name_ids.get(name)
+        if nid is None:
+            nid = self.name_ids[name] = len(self.names)
+            self.names.append(name)
+        return nid
+
+    def _tagset_id(self, tag_str):
+        sid = self.tagset_ids.get(tag_str)
+        if sid is None:
+            tids = []
+            for t in sorted(parse_tags(tag_str)):
+                tid = self.tag_ids.get(t)
+                if tid is None:
+                    tid = self.tag_ids[t] = len(self.tag_names)
+                    self.tag_names.append(t)
+                tids.append(tid)
+            sid = self.tagset_ids[tag_str] = len(self.tagsets)
+            self.tagsets.append(tag_str)
+            self.tagset_tags.append(tuple(tids))
+        return sid
+
+    def _encode(self, rec):
+        """记录 -> (开始, 结束, 时长毫秒, 事件名 id, 标签串 id, extras)
+
+        旧记录只有 duration_seconds（或只有 duration 文本），毫秒数按整秒换算。
+        """
+        extra = {}
+        times = []
+        for key in ("start_time", "end_time"):
+            raw = rec.get(key)
+            secs = parse_wall(raw)
+            if secs is None:
+                secs = NO_TIME
+                extra[key] = raw
+            times.append(secs)
+        start, end = times
+
+        text = rec.get("duration")
+        secs = rec.get("duration_seconds")
+        ms = rec.get("duration_ms")
+        if isinstance(ms, int) and not isinstance(ms, bool):
+            ms = max(-MAX_MS, min(ms, MAX_MS))
+            if secs is not None and secs != ms // 1000:
+                extra["duration_seconds"] = secs
+        else:
+            if ms is not None:
+                extra["duration_ms"] = ms
+            if not isinstance(secs, int):
+                secs = _parse_duration_text(text)
+                if secs is None:
+                    secs = end - start if NO_TIME not in (start, end) else 0
+            ms = max(-MAX_MS, min(secs * 1000, MAX_MS))
+        if text is not None and text != format_duration(ms // 1000):
+            extra["duration"] = text
+
+        event = rec.get("event", "")
+        if not isinstance(event, str):
+            extra["event"] = event
+            event = ""
+        tags = rec.get("tags", "") or ""
+        if not isinstance(tags, str):
+            extra["tags"] = tags
+            tags = ""
+        for key in rec.keys():
+            if key not in FIELDS:
+                extra[key] = rec[key]
+        return start, end, ms, self._name_id(event), self._tagset_id(tags), extra
+
+    # ---------- 变更 ----------
+    def append(self, rec, keep_id=False):
+        """追加一条记录；keep_id=True 时信任记录自带的 id（来自同一存储、保证不重复）"""
+        start, end, ms, nid, sid, extra = self._encode(rec)
+        rid = rec.get("id")
+        row = len(self.live)
+        if keep_id and isinstance(rid, int) and rid < self.next_id:
+            if self.id_rows is None:
+                self.id_rows = {r: i for i, r in enumerate(self.ids)}
+        elif not isinstance(rid, int) or rid < self.next_id:
+            # 旧数据没有 id，或 id 与已有记录冲突：分配新 id
+            rid = self.next_id
+            self.assigned_ids = True
+        self.next_id = max(self.next_id, rid + 1)
+        if self.id_rows is not None:
+            self.id_rows[rid] = row
+        self.ids.append(rid)
+        self.start.append(start)
+        self.end.append(end)
+        self.duration_ms.append(ms)
+        self.name.append(nid)
+        self.tagset.append(sid)
+        self.live.append(1)
+        if extra:
+            self.extras[row] = extra
+        self.count += 1
+        return RecordView(self, row)
+
+    def update(self, row, changes):
+        rec = RecordView(self, row).to_dict()
+        rec.update(changes)
+        if "duration" in changes and "duration_seconds" not in changes:
+            rec.pop("duration_seconds", None)
+        if ("duration" in changes or "duration_seconds" in changes) and "duration_ms" not in changes:
+            rec.pop("duration_ms", None)
+        start, end, ms, nid, sid, extra = self._encode(rec)
+        self.start[row] = start
+        self.end[row] = end
+        self.duration_ms[row] = ms
+        self.name[row] = nid
+        self.tagset[row] = sid
+        # 整体替换而不是原地修改：快照线程可能正持有旧的 extras
+        if extra:
+            self.extras[row] = extra
+        else:
+            self.extras.pop(row, None)
+
+    def delete(self, row):
+        if self.live[row]:
+            self.live[row] = 0
+            self.count -= 1
+
+    def clear(self):
+        self.__init__()
+
+    # ---------- 读取 ----------
+    def view(self, row):
+        return RecordView(self, row)
+
+    def row_of(self, rid):
+        """记录 id -> 行号；不存在或已删除时返回 None"""
+        if self.id_rows is not None:
+            i = self.id_rows.get(rid)
+            return i if i is not None and self.live[i] else None
+        ids = self.ids
+        i = bisect_left(ids, rid)
+        if i < len(ids) and ids[i] == rid and self.live[i]:
+            return i
+        return None
+
+    def get(self, rid):
+        row = self.row_of(rid)
+        return None if row is None else RecordView(self, row)
+
+    def rows(self):
+        """存活行的行号"""
+        live = self.live
+        i = live.find(1)
+        while i >= 0:
+            yield i
+            i = live.find(1, i + 1)
+
+    def tags_of(self, row):
+        return [self.tag_names[t] for t in self.tagset_tags[self.tagset[row]]]
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for row in self.rows():
+            yield RecordView(self, row)
+
+    def copy(self, detach=False):
+        """列数组的快照（驻留表为只追加的列表，直接共享）
+
+        detach=True 时驻留表也复制一份：之后要在另一个线程中往副本追加记录时使用，
+        否则两个线程会同时往共享的驻留表里添加新名称。
+        """
+        table = ColumnTable.__new__(ColumnTable)
+        table.__dict__.update(self.__dict__)
+        for name in ("ids", "start", "end", "duration_ms", "name", "tagset"):
+            setattr(table, name, array(getattr(self, name).typecode, getattr(self, name)))
+        table.live = bytearray(self.live)
+        table.extras = dict(self.extras)
+        if self.id_rows is not None:
+            table.id_rows = dict(self.id_rows)
+        if detach:
+            for name in ("names", "name_ids", "tagsets", "tagset_ids", "tagset_tags", "tag_names", "tag_ids"):
+                setattr(table, name, getattr(self, name).copy())
+        return table
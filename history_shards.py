@@ -0,0 +1,461 @@
+import json
+import os
+import threading
+from datetime import date
+
+from history_records import NO_TIME, ColumnTable, parse_wall, wall_day
+from storage import JsonHistoryStore
+
+
+MANIFEST_VERSION = 1
+UNDATED = "undated"          # 开始时间无法解析的记录单独成片，总是加载
+
+
+def month_key(start):
+    """开始挂钟秒数 -> 分片名 'YYYY-MM'"""
+    if start == NO_TIME:
+        return UNDATED
+    d = wall_day(start)
+    return f"{d.year:04d}-{d.month:02d}"
+
+
+def hot_months(today=None):
+    """启动时加载的月份：本月和上月"""
+    today = today or date.today()
+    prev = date(today.year - 1, 12, 1) if today.month == 1 else date(today.year, today.month - 1, 1)
+    return {f"{today.year:04d}-{today.month:02d}", f"{prev.year:04d}-{prev.month:02d}"}
+
+
+def is_cold(month, today=None):
+    return month != UNDATED and month not in hot_months(today)
+
+
+class ShardedHistoryStore(JsonHistoryStore):
+    """按月分片的历史存储：每月一个快照分片 + 共用的追加日志（可选后端）
+
+    shard_dir 中：
+        manifest.json          每个分片的文件名、记录数、开始时间上下界、记录 id 上下界，
+                               以及已并入分片的日志序号和下一个记录 id
+        YYYY-MM.<序号>.json     本月和上月（热分片），启动时加载
+        YYYY-MM.<序号>.json.xz  更早的月份（冷分片，lzma 压缩），日期筛选、日历或导出涉及时才解压加载
+        journal.jsonl          追加日志，格式与 JsonHistoryStore 相同
+    查询和日历计数只覆盖已加载的月份，不在调用线程中解压冷分片：日期筛选涉及的分片先由
+    read_range() 返回的 load() 在后台线程读取，再由 merge_range() 并入（按清单中的时间上下界跳过不相关的分片）。
+    需要全部记录时（导出、分析、切换后端）用 snapshot()：冷分片只读进快照，不常驻内存。
+    分片中 id 缺失或与已加载记录重复的记录（手工修改或损坏的分片）在加载时分配新 id，
+    并立即压缩写回，之后的日志按新 id 引用它们。
+    压缩只重写有变更的月份（以及刚变冷、需要压缩的分片），分片写成新文件名，
+    清单原子替换后才删除旧文件，因此任何时刻崩溃都能从清单 + 日志恢复。
+    """
+
+    def __init__(self, shard_dir, writer=None, compact_threshold=500, today=None):
+        JsonHistoryStore.__init__(self, os.path.join(shard_dir, "manifest.json"), writer, compact_threshold)
+        self.shard_dir = shard_dir
+        self.journal_file = os.path.join(shard_dir, "journal.jsonl")
+        self.rotated_file = os.path.join(shard_dir, "journal.old.jsonl")
+        self.today = today
+        self.manifest = {}         # 月份 -> 分片信息
+        self.loaded = set()        # 已在内存中的月份（清单中没有的月份视为已加载的空分片）
+        self.dirty = set()         # 自上次压缩以来有变更的月份
+        self._rewrite_all = False
+        self._replaying = False    # 回放日志期间，重复 id 的记录等回放结束再分配新 id
+        self._collided = []        # 等待分配新 id 的分片记录
+        # 写入线程压缩失败时把那些月份交还这里，由下一次 compact() 在修改存储的线程中并回 dirty
+        self._retry_lock = threading.Lock()
+        self._retry_months = set()
+        # 加载线程/Tk 线程读取分片与写入线程替换、删除分片文件互斥
+        self._files_lock = threading.Lock()
+
+    def exists(self):
+        return os.path.exists(self.data_file) or os.path.exists(self.journal_file)
+
+    # ---------- 清单与分片文件 ----------
+    def _read_manifest(self):
+        """返回 (分片信息, 已并入的日志序号, 下一个记录 id)"""
+        if not os.path.exists(self.data_file):
+            return {}, 0, 1
+        with open(self.data_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return data.get("shards", {}), data.get("seq", 0), data.get("next_id", 1)
+
+    def _open_shard(self, name, mode='rt'):
+        path = os.path.join(self.shard_dir, name)
+        # 压缩模块只在读写冷分片时才导入，不拖慢启动
+        if name.endswith(".xz"):
+            import lzma
+            return lzma.open(path, mode, encoding='utf-8')
+        if name.endswith(".gz"):
+            import gzip
+            return gzip.open(path, mode, encoding='utf-8')
+        return open(path, mode[0], encoding='utf-8')
+
+    def _read_shard(self, month):
+        import lzma
+        with self._files_lock:
+            name = self.manifest[month]["file"]
+            try:
+                with self._open_shard(name) as f:
+                    return json.load(f)["records"]
+            except (lzma.LZMAError, EOFError) as e:
+                raise ValueError(f"分片 {name} 已损坏: {e}")
+
+    def _load_shard(self, month):
+        self._merge_shard(month, self._read_shard(month))
+
+    def _merge_shard(self, month, records):
+        """把一个尚未加载的分片并入内存表和索引（不通知监听者、不写日志）"""
+        self.loaded.add(month)
+        table = self.records
+        for rec in records:
+            rid = rec.get("id")
+            if not isinstance(rid, int) or table.row_of(rid) is not None:
+                self._collided.append(rec)
+                continue
+            view = table.append(rec, keep_id=True)
+            self.tag_index.add(view)
+            self.day_index.add(view)
+        if self._collided and not self._replaying:
+            self._reassign()
+
+    def _reassign(self):
+        """给 id 缺失或重复的分片记录分配新 id，并把它们所在的月份尽快写回分片
+
+        新 id 从 next_id 起分配，不会与任何分片或日志中的 id 冲突；
+        回放日志期间不能分配（日志中稍后的新增记录可能正用着这些 id），等回放结束再调用。
+        """
+        records, self._collided = self._collided, []
+        for rec in records:
+            rec = dict(rec)
+            rec.pop("id", None)
+            view = self.records.append(rec)
+            self.tag_index.add(view)
+            self.day_index.add(view)
+            self.dirty.add(self._row_month(view.row))
+        self.compact()
+
+    def _ensure_month(self, month):
+        if month in self.manifest and month not in self.loaded:
+            self._load_shard(month)
+
+    def _month_of(self, rec):
+        start = parse_wall(rec.get("start_time"))
+        return month_key(NO_TIME if start is None else start)
+
+    def _row_month(self, row):
+        return month_key(self.records.start[row])
+
+    def _unloaded_months(self, days=None):
+        """尚未加载、开始日期与 days（不给时为全部日期）有交集的分片"""
+        months = []
+        for month, entry in self.manifest.items():
+            if month in self.loaded or month == UNDATED:
+                continue
+            if days is None or (wall_day(entry["first"]) <= days[1] and wall_day(entry["last"]) >= days[0]):
+                months.append(month)
+        return months
+
+    def load_range(self, first, last):
+        """在调用线程中加载开始日期与 [first, last] 有交集的分片"""
+        for month in self._unloaded_months((first, last)):
+            self._load_shard(month)
+
+    def read_range(self, first, last):
+        months = self._unloaded_months((first, last))
+        if not months:
+            return None
+
+        def load():
+            shards = []
+            for month in months:
+                try:
+                    shards.append((month, self._read_shard(month)))
+                except KeyError:
+                    continue    # 读取之前该月被清空，分片已删除
+            return shards
+        return load
+
+    def merge_range(self, loaded):
+        for month, records in loaded:
+            # 读取期间该月可能已被其他操作加载或清空
+            if month in self.manifest and month not in self.loaded:
+                self._merge_shard(month, records)
+
+    def snapshot(self, days=None):
+        """内存表在这里复制；尚未加载的分片在 load() 中逐个读取、追加到快照，不并入存储"""
+        table = self.records.copy(detach=True)
+        months = self._unloaded_months(days)
+
+        def load():
+            for month in months:
+                try:
+                    records = self._read_shard(month)
+                except KeyError:
+                    continue    # 快照之后该月被清空，分片已删除
+                for rec in records:
+                    rid = rec.get("id")
+                    if isinstance(rid, int) and table.row_of(rid) is None:
+                        table.append(rec, keep_id=True)
+                    else:
+                        rec = dict(rec)
+                        rec.pop("id", None)
+                        table.append(rec)
+            months.clear()
+            return table
+        return load
+
+    def unloaded(self):
+        return sum(entry["count"] for month, entry in self.manifest.items() if month not in self.loaded)
+
+    # ---------- 加载 ----------
+    def load(self):
+        os.makedirs(self.shard_dir, exist_ok=True)
+        self.manifest, seq, next_id = self._read_manifest()
+        self.loaded = set()
+        self.dirty = set()
+        hot = hot_months(self.today)
+        records = []
+        self._collided = []
+        seen = set()
+        for month in self.manifest:
+            if month in hot or month == UNDATED:
+                for rec in self._read_shard(month):
+                    rid = rec.get("id")
+                    if isinstance(rid, int) and rid not in seen:
+                        seen.add(rid)
+                        records.append(rec)
+                    else:
+                        self._collided.append(rec)
+                self.loaded.add(month)
+        del seen
+        # 分片内按 id 有序，合并后重新排序，内存表仍可按 id 二分查找
+        records.sort(key=lambda rec: rec["id"])
+        self.records = ColumnTable.from_records(records)
+        del records
+        self.records.next_id = max(self.records.next_id, next_id)
+        self.tag_index.rebuild(self.records)
+        self.day_index.rebuild(self.records)
+
+        self.seq = seq
+        ops = 0
+        self._replaying = True
+        try:
+            for path in (self.rotated_file, self.journal_file):
+                for op in self._read_journal(path):
+                    if op.get("seq", 0) <= self.seq:
+                        continue
+                    self.seq = op["seq"]
+                    ops += 1
+                    self._replay(op)
+        finally:
+            self._replaying = False
+        self._journal_ops = ops
+        if ops:
+            self.tag_index.rebuild(self.records)
+            self.day_index.rebuild(self.records)
+        if self._collided:
+            self._reassign()
+        elif ops >= self.compact_threshold:
+            self.compact()
+        return self.records
+
+    def _find(self, rid):
+        """按记录 id 找行号；不在内存中时按清单的 id 上下界加载可能包含它的分片"""
+        row = self.records.row_of(rid)
+        if row is not None:
+            return row
+        for month, entry in list(self.manifest.items()):
+            if month not in self.loaded and entry["min_id"] <= rid <= entry["max_id"]:
+                self._load_shard(month)
+                row = self.records.row_of(rid)
+                if row is not None:
+                    return row
+        return None
+
+    def _replay(self, op):
+        kind = op.get("op")
+        table = self.records
+        if kind == "add":
+            self._ensure_month(self._month_of(op["rec"]))
+            view = table.append(op["rec"], keep_id=True)
+            self.dirty.add(self._row_month(view.row))
+        elif kind == "set":
+            row = self._find(op["rec"].get("id"))
+            if row is not None:
+                self.dirty.add(self._row_month(row))
+                self._ensure_month(self._month_of(op["rec"]))
+                table.update(row, op["rec"])
+                self.dirty.add(self._row_month(row))
+        elif kind == "del":
+            for rid in op.get("ids", ()):
+                row = self._find(rid)
+                if row is not None:
+                    self.dirty.add(self._row_month(row))
+                    table.delete(row)
+        elif kind == "clear":
+            self._drop_all()
+            next_id = table.next_id
+            table.clear()
+            table.next_id = next_id
+
+    def _drop_all(self):
+        # 清单中的分片都视为已加载，压缩时按空分片处理（即删除）
+        self.loaded |= set(self.manifest)
+        self.dirty |= set(self.manifest)
+
+    # ---------- 变更 ----------
+    # 写日志可能立即触发压缩，压缩的序号会盖过这一条日志，所以涉及的月份要在写日志之前标记为有变更
+    def append(self, rec):
+        month = self._month_of(rec)
+        self._ensure_month(month)
+        self.dirty.add(month)
+        return JsonHistoryStore.append(self, rec)
+
+    def update(self, rec, changes):
+        new_month = self._month_of(dict(rec.to_dict(), **changes))
+        self._ensure_month(new_month)
+        self.dirty |= {self._row_month(rec.row), new_month}
+        JsonHistoryStore.update(self, rec, changes)
+
+    def delete_many(self, recs):
+        self.dirty |= {self._row_month(rec.row) for rec in recs}
+        JsonHistoryStore.delete_many(self, recs)
+
+    def clear(self):
+        self._drop_all()
+        next_id = self.records.next_id
+        JsonHistoryStore.clear(self)
+        self.records.next_id = next_id
+
+    def replace_all(self, records):
+        self.writer.flush()
+        os.makedirs(self.shard_dir, exist_ok=True)
+        self.manifest = self._read_manifest()[0]
+        self._drop_all()
+        self._rewrite_all = True
+        return JsonHistoryStore.replace_all(self, records)
+
+    # ---------- 压缩 ----------
+    def compact(self, wait=False):
+        """把有变更的月份写成新分片并更新清单；由写入线程按顺序执行"""
+        if self._compacting and not wait:
+            return
+        self._compacting = True
+        self._journal_ops = 0
+        self._notify_compact()
+        months, self.dirty = self.dirty, set()
+        with self._retry_lock:
+            months |= self._retry_months
+            self._retry_months = set()
+        if self._rewrite_all:
+            months |= {self._row_month(row) for row in self.records.rows()}
+            self._rewrite_all = False
+        snapshot = self.records.copy()
+        seq = self.seq
+        next_id = self.records.next_id
+        self.writer.run_task(lambda: self._compact_files(snapshot, seq, months, next_id))
+        if wait:
+            self.writer.flush()
+            error, self._compact_error = self._compact_error, None
+            if error is not None:
+                raise error
+
+    def _compact_files(self, snapshot, seq, months, next_id):
+        try:
+            self._rotate_journal()
+            self._write_shards(snapshot, seq, months, next_id)
+        except (OSError, ValueError) as e:
+            # 待压缩日志仍在，下次压缩重写这些月份；重启时也会重新回放。
+            # dirty 只在修改存储的线程中改动，这里不直接写它
+            with self._retry_lock:
+                self._retry_months |= months
+            self._compact_error = e
+        finally:
+            self._compacting = False
+
+    def _write_shards(self, snapshot, seq, months, next_id):
+        import lzma
+        rows_by_month = {month: [] for month in months}
+        for row in snapshot.rows():
+            rows = rows_by_month.get(month_key(snapshot.start[row]))
+            if rows is not None:
+                rows.append(row)
+        shards = dict(self.manifest)
+        taken = {entry["file"] for entry in shards.values()}
+        obsolete = []
+        for month, rows in rows_by_month.items():
+            old = shards.pop(month, None)
+            if old is not None:
+                obsolete.append(old["file"])
+            if rows:
+                shards[month] = self._write_shard(snapshot, month, rows, seq, taken)
+        # 刚变冷的月份：直接压缩原文件的字节，不需要解析
+        for month, entry in list(shards.items()):
+            if month not in rows_by_month and is_cold(month, self.today) and not entry["file"].endswith(".xz"):
+                with self._open_shard(entry["file"]) as f:
+                    data = f.read().encode('utf-8')
+                name = self._shard_name(month, seq, True, taken)
+                self._write_file(name, lzma.compress(data))
+                shards[month] = dict(entry, file=name)
+                obsolete.append(entry["file"])
+
+        manifest = {"version": MANIFEST_VERSION, "seq": seq, "next_id": next_id, "shards": shards}
+        self._write_file("manifest.json", json.dumps(manifest, ensure_ascii=False, indent=1).encode('utf-8'))
+        with self._files_lock:
+            self.manifest = shards
+            referenced = {entry["file"] for entry in shards.values()}
+            # 旧分片，以及崩溃时留下的、清单没有引用的分片
+            for name in set(obsolete) | set(os.listdir(self.shard_dir)):
+                if name not in referenced and name.endswith((".json", ".json.xz", ".json.gz")) \
+                        and name != "manifest.json":
+                    try:
+                        os.remove(os.path.join(self.shard_dir, name))
+                    except OSError:
+                        pass
+        # 清单已记录 seq，即使这里删除失败，重放时也会跳过旧日志
+        if os.path.exists(self.rotated_file):
+            os.remove(self.rotated_file)
+
+    def _shard_name(self, month, seq, compress, taken):
+        n = 0
+        while True:
+            name = f"{month}.{seq}.{n}.json" + (".xz" if compress else "")
+            if name not in taken:
+                taken.add(name)
+                return name
+            n += 1
+
+    def _write_shard(self, snapshot, month, rows, seq, taken):
+        import lzma
+        compress = is_cold(month, self.today)
+        data = json.dumps({"month": month, "records": [snapshot.view(row).to_dict() for row in rows]},
+                          ensure_ascii=False).encode('utf-8')
+        name = self._shard_name(month, seq, compress, taken)
+        self._write_file(name, lzma.compress(data) if compress else data)
+        starts = [snapshot.start[row] for row in rows]
+        ids = [snapshot.ids[row] for row in rows]
+        return {"file": name, "count": len(rows), "first": min(starts), "last": max(starts),
+                "min_id": min(ids), "max_id": max(ids)}
+
+    def _write_file(self, name, data):
+        path = os.path.join(self.shard_dir, name)
+        tmp = path + ".tmp"
+        with open(tmp, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+
+def import_json_shards(data_file, shard_dir):
+    """一次性把 JSON 历史（快照 + 日志）导入按月分片的存储，返回导入条数"""
+    source = JsonHistoryStore(data_file)
+    try:
+        records = source.read()[0]
+    finally:
+        source.close()
+    store = ShardedHistoryStore(shard_dir)
+    try:
+        store.replace_all(records)
+    finally:
+        store.close()
+    return len(records)
@@ -0,0 +1,258 @@
+import json
+import os
+from datetime import date, timedelta
+
+from history_index import record_day
+from history_records import RecordView, parse_tags
+
+
+STATS_VERSION = 1
+UNTAGGED = ""      # 没有标签的记录计入空标签
+
+
+def _parts(rec):
+    """(开始日期, 事件名, 标签列表, 毫秒时长)；rec 可以是 RecordView 或修改前的字典"""
+    if isinstance(rec, RecordView):
+        return rec.day, rec["event"], rec.table.tags_of(rec.row), rec.duration_ms
+    ms = rec.get("duration_ms")
+    if not isinstance(ms, int):
+        ms = (rec.get("duration_seconds") or 0) * 1000
+    return record_day(rec), rec.get("event", ""), parse_tags(rec.get("tags", "")), ms
+
+
+def _bump(table, key, ms, n):
+    """table[key] 为 [毫秒, 条数]；条数减到 0 时删除该项"""
+    cell = table.get(key)
+    if cell is None:
+        cell = table[key] = [0, 0]
+    cell[0] += ms
+    cell[1] += n
+    if cell[1] <= 0:
+        del table[key]
+
+
+def _merge(into, table):
+    for key, (ms, n) in table.items():
+        cell = into.get(key)
+        if cell is None:
+            into[key] = [ms, n]
+        else:
+            cell[0] += ms
+            cell[1] += n
+
+
+def history_stamp(store):
+    """判断汇总是否与历史一致的标记
+
+    带追加日志的存储每次变更序号加一，直接用日志序号；
+    其他后端（SQLite）用 (条数, 下一个 id, 总时长)。这里要遍历全部记录，只在加载和重建时调用，
+    单条变更由 StatsRollup 增量推算。
+    """
+    seq = getattr(store, "seq", None)
+    if seq is not None:
+        return ["seq", seq]
+    return table_stamp(store.records)
+
+
+def table_stamp(table):
+    return ["sum", len(table), table.next_id, sum(table.duration_ms[row] for row in table.rows())]
+
+
+class StatsRollup:
+    """历史统计的物化汇总（毫秒时长和条数）
+
+    days: 日期 -> {"total": [ms, n], "tags": {标签: [ms, n]}, "events": {事件名: [ms, n]}}
+    weeks: 周一日期 -> [ms, n]；months: (年, 月) -> [ms, n]
+    记录按开始日期计入；跟随历史存储的变更增量维护，新增/删除一条记录只改动
+    它的日期、周、月、事件名和各个标签对应的计数，修改（如重新打标签）按“减去旧值、加上新值”处理。
+    汇总不随每次变更保存，只在历史压缩和退出时写出；启动时标记与历史一致就直接使用，
+    否则（例如上次没有正常退出）由全部记录重建。
+    历史被清空或整体替换时需要遍历全部记录，follow() 给出 writer 时在写入线程中重建，
+    重建完成前的变更先暂存在 pending 中，换上新汇总后按顺序补上。
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.stamp = None
+        self.pending = None       # 后台重建期间暂存的变更 (kind, 新记录的各项, 旧记录的各项)
+        self._generation = 0
+        self.clear()
+
+    def clear(self):
+        self.days = {}
+        self.weeks = {}
+        self.months = {}
+
+    # ---------- 维护 ----------
+    def add(self, rec, sign=1):
+        self._add(_parts(rec), sign)
+
+    def _add(self, parts, sign=1):
+        day, event, tags, ms = parts
+        if day is None:
+            return
+        ms *= sign
+        stats = self.days.get(day)
+        if stats is None:
+            stats = self.days[day] = {"total": [0, 0], "tags": {}, "events": {}}
+        stats["total"][0] += ms
+        stats["total"][1] += sign
+        for tag in tags or [UNTAGGED]:
+            _bump(stats["tags"], tag, ms, sign)
+        _bump(stats["events"], event, ms, sign)
+        if stats["total"][1] <= 0:
+            del self.days[day]
+        _bump(self.weeks, day - timedelta(days=day.weekday()), ms, sign)
+        _bump(self.months, (day.year, day.month), ms, sign)
+
+    def remove(self, rec):
+        self.add(rec, -1)
+
+    def rebuild(self, records):
+        self.clear()
+        for rec in records:
+            self.add(rec)
+
+    def follow(self, store, lock=None, writer=None):
+        """订阅历史存储的变更；lock 与写入线程序列化汇总时持有的锁相同
+
+        不给 writer 时清空或整体替换历史后在调用线程中重建（只用于测试和命令行工具）。
+        """
+        def on_change(kind, rec, old):
+            if lock is None:
+                self.on_history_change(store, kind, rec, old, writer)
+            else:
+                with lock:
+                    self.on_history_change(store, kind, rec, old, writer)
+        store.add_listener(on_change)
+
+    def on_history_change(self, store, kind, rec, old, writer=None):
+        if kind == "reset":
+            if writer is None:
+                self.rebuild(store.snapshot()())
+                self.stamp = history_stamp(store)
+            else:
+                self._rebuild_in(writer, store)
+            return
+        # 记录视图会随之后的修改变化，这里就取出各项
+        parts = _parts(rec)
+        old_parts = _parts(old) if kind == "update" else None
+        if self.pending is not None:
+            self.pending.append((kind, parts, old_parts))
+        else:
+            self._apply(store, kind, parts, old_parts)
+
+    def _apply(self, store, kind, parts, old_parts):
+        if kind == "add":
+            self._add(parts)
+        elif kind == "delete":
+            self._add(parts, -1)
+        else:
+            self._add(old_parts, -1)
+            self._add(parts)
+        stamp = self.stamp
+        if stamp is None or stamp[0] != "sum":
+            self.stamp = history_stamp(store)
+            return
+        # (条数, 下一个 id, 总时长) 按这一条变更推算，不遍历全部记录
+        count, total = stamp[1], stamp[3]
+        if kind == "add":
+            count, total = count + 1, total + parts[3]
+        elif kind == "delete":
+            count, total = count - 1, total - parts[3]
+        else:
+            total += parts[3] - old_parts[3]
+        self.stamp = ["sum", count, store.records.next_id, total]
+
+    def _rebuild_in(self, writer, store):
+        """在写入线程中由快照重建，完成后持写入锁换上并补上期间暂存的变更
+
+        重建期间汇总为空、标记为 None，此时写出的汇总文件在下次启动时不会被采用。
+        """
+        load = store.snapshot()
+        seq = getattr(store, "seq", None)
+        self.clear()
+        self.stamp = None
+        self.pending = []
+        self._generation += 1
+        generation = self._generation
+
+        def rebuild():
+            fresh = StatsRollup()
+            table = load()
+            fresh.rebuild(table)
+            stamp = ["seq", seq] if seq is not None else table_stamp(table)
+            with writer.lock:
+                if generation != self._generation:
+                    return    # 重建期间历史又被整体替换，由较新的一次重建接手
+                self.days, self.weeks, self.months = fresh.days, fresh.weeks, fresh.months
+                self.stamp = stamp
+                pending, self.pending = self.pending, None
+                for change in pending:
+                    self._apply(store, *change)
+        writer.run_task(rebuild)
+
+    # ---------- 读写 ----------
+    def load(self, store):
+        """读取保存的汇总；缺失、损坏或与历史不一致时重建。返回是否需要回写
+
+        重建要读取全部记录，只在加载线程中调用。
+        """
+        stamp = history_stamp(store)
+        if self.path is not None and os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if isinstance(data, dict) and data.get("version") == STATS_VERSION \
+                        and data.get("stamp") == stamp:
+                    self._from_json(data["days"])
+                    self.stamp = stamp
+                    return False
+            except (OSError, ValueError, KeyError):
+                import traceback    # 只在汇总文件损坏时才需要
+                traceback.print_exc()
+        self.rebuild(store.snapshot()())
+        self.stamp = stamp
+        return True
+
+    def _from_json(self, days):
+        self.clear()
+        for key, stats in days.items():
+            day = date.fromisoformat(key)
+            self.days[day] = stats
+            total = stats["total"]
+            _merge(self.weeks, {day - timedelta(days=day.weekday()): total})
+            _merge(self.months, {(day.year, day.month): total})
+
+    def to_json(self):
+        """保存格式（在写入线程中持锁调用）"""
+        return {"version": STATS_VERSION, "stamp": self.stamp,
+                "days": {day.isoformat(): stats for day, stats in sorted(self.days.items())}}
+
+    # ---------- 查询 ----------
+    def summary(self, first=None, last=None):
+        """[first, last] 内的 (总计 [ms, n], 标签 -> [ms, n], 事件名 -> [ms, n])；不给日期时为全部"""
+        total, tags, events = [0, 0], {}, {}
+        for day, stats in self.days.items():
+            if (first is None or day >= first) and (last is None or day <= last):
+                total[0] += stats["total"][0]
+                total[1] += stats["total"][1]
+                _merge(tags, stats["tags"])
+                _merge(events, stats["events"])
+        return total, tags, events
+
+    def week_total(self, day):
+        return self.weeks.get(day - timedelta(days=day.weekday()), [0, 0])[0]
+
+    def month_total(self, day):
+        return self.months.get((day.year, day.month), [0, 0])[0]
+
+    def daily(self, first, last):
+        """[first, last] 内每天的总毫秒数（没有记录的日期为 0）"""
+        result = []
+        day = first
+        while day <= last:
+            stats = self.days.get(day)
+            result.append((day, stats["total"][0] if stats else 0))
+            day += timedelta(days=1)
+        return result
@@ -0,0 +1,80 @@
+# ---------- 虚拟化历史表格的窗口计算 ----------
+# VirtualHistoryView 只在 Treeview 中保留视口内的行和少量预渲染行。这里是与 Tk 无关的部分：
+# 视口第一行的位置、渲染区间、滚动条位置，以及滚动和单条增删时渲染区间怎样变化。
+# 行号都是在排好序的全部匹配记录中的位置，区间为左闭右开。
+
+
+def visible_rows(height, top, row_height):
+    """控件高度为 height、第一行顶端在 top 处时能完整显示的行数（至少 1 行）"""
+    return max(1, (height - top) // max(1, row_height))
+
+
+def clamp_offset(offset, total, visible):
+    """视口第一行的位置：不小于 0，滚到底时最后一行贴着视口底部"""
+    return max(0, min(offset, total - visible))
+
+
+def render_window(offset, total, visible, overscan):
+    """返回 (夹紧后的视口第一行, 渲染区间)；渲染区间从视口第一行起，多预渲染 overscan 行"""
+    offset = clamp_offset(offset, total, visible)
+    return offset, (offset, min(total, offset + visible + overscan))
+
+
+def window_changes(old, new):
+    """渲染区间由 old 换成 new 时要移出和补入的行
+
+    返回 (移出的行号, 从上方补入的行号（由下往上，逐个插到最前面）, 从下方补入的行号)；
+    两个区间没有重叠（或 old 为空）时返回 None，应整体重绘。
+    """
+    cur_lo, cur_hi = old
+    lo, hi = new
+    if cur_lo == cur_hi or hi <= cur_lo or lo >= cur_hi:
+        return None
+    removed = list(range(cur_lo, min(lo, cur_hi))) + list(range(max(hi, cur_lo), cur_hi))
+    return removed, range(min(cur_lo, hi) - 1, lo - 1, -1), range(max(cur_hi, lo), hi)
+
+
+def scrollbar_span(offset, total, visible):
+    """滚动条滑块的 (起, 止)，以全部行数的比例表示"""
+    if total <= visible:
+        return 0, 1
+    return offset / total, min(1.0, (offset + visible) / total)
+
+
+def offset_at_fraction(fraction, total):
+    """拖动滚动条到 fraction 处对应的视口第一行（未夹紧）"""
+    return int(float(fraction) * total)
+
+
+def offset_showing(offset, row, visible):
+    """让第 row 行落在视口内所需的最小滚动：返回新的视口第一行"""
+    if row < offset:
+        return row
+    if row >= offset + visible:
+        return row - visible + 1
+    return offset
+
+
+# ---------- 单条增删 ----------
+def window_after_insert(window, i, room):
+    """在第 i 行处插入一行后：返回 (视口第一行的变化, 新的渲染区间, 是否要在控件中插入这一行)
+
+    插在视口上方时视口内容保持不动（第一行随之下移）；插在区间内，或区间还不满 room 行、
+    且正好接在区间末尾时插入控件（再往后的行不在区间内，插入会使渲染的行不连续）。
+    """
+    lo, hi = window
+    if i < lo or (i == lo and lo > 0):
+        return 1, (lo + 1, hi + 1), False
+    if i < hi or (i == hi and hi - lo < room):
+        return 0, (lo, hi + 1), True
+    return 0, window, False
+
+
+def window_after_remove(window, i):
+    """删除第 i 行后：返回 (视口第一行的变化, 新的渲染区间, 是否要从控件中删除这一行)"""
+    lo, hi = window
+    if i < lo:
+        return -1, (lo - 1, hi - 1), False
+    if i < hi:
+        return 0, (lo, hi - 1), True
+    return 0, window, False
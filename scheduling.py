@@ -0,0 +1,156 @@
+import heapq
+import time
+from tkinter import TclError
+
+
+class TickScheduler:
+    """统一的界面刷新节拍
+
+    所有周期性刷新都注册为订阅者 fn() -> 距离下次需要刷新的秒数（None 表示没有要求）。
+    每次节拍按顺序调用全部订阅者，然后只在最早的那个时间点再安排一次 after()，
+    因此无论有多少计时事件，同一时刻只有一个待执行的回调。
+    计时显示是分钟精度，订阅者返回到下一个分钟边界的秒数，节拍就对齐到分钟边界。
+    """
+    MIN_DELAY = 0.05
+    EPSILON = 0.01     # 略晚于边界触发，避免浮点误差导致在边界前醒来
+
+    def __init__(self, after, after_cancel, max_interval=60.0):
+        self.after = after
+        self.after_cancel = after_cancel
+        self.max_interval = max_interval
+        self.subscribers = {}
+        self._job = None
+        self._kicked = False
+
+    def add(self, key, fn):
+        self.subscribers[key] = fn
+        self.kick()
+
+    def remove(self, key):
+        self.subscribers.pop(key, None)
+
+    def kick(self):
+        """状态变化后尽快刷新一次（同一轮事件中多次调用只刷新一次）"""
+        if self._kicked:
+            return
+        self._cancel()
+        self._kicked = True
+        self._job = self.after(0, self._tick)
+
+    def stop(self):
+        self._cancel()
+        self.subscribers.clear()
+
+    def _cancel(self):
+        if self._job is not None:
+            try:
+                self.after_cancel(self._job)
+            except TclError:
+                pass    # 回调已执行或窗口已销毁
+            self._job = None
+        self._kicked = False
+
+    def _tick(self):
+        self._job = None
+        self._kicked = False
+        delay = self.max_interval
+        for fn in list(self.subscribers.values()):
+            try:
+                d = fn()
+            except:
+                # 一个订阅者出错不影响其他订阅者和下一次节拍，但要留下记录
+                import traceback
+                traceback.print_exc()
+                continue
+            if d is not None and d < delay:
+                delay = d
+        if not self.subscribers:
+            return
+        delay = max(self.MIN_DELAY, delay + self.EPSILON)
+        self._job = self.after(int(delay * 1000), self._tick)
+
+
+def seconds_to_next_minute(seconds):
+    """计时秒数到下一个整分钟还要多久"""
+    return 60 - seconds % 60
+
+
+class DeadlineScheduler:
+    """按截止时间触发的调度器（最小堆）
+
+    每个键最多有一个待触发的截止时间，schedule() 重新设定、cancel() 取消；
+    堆中过期的旧条目在出堆时按版本号丢弃。任何时候只安排一个 after()，
+    定在堆顶的截止时间，到点后在 Tk 主循环中调用 callback(key, when)；堆为空时不安排任何唤醒。
+    """
+
+    def __init__(self, after, after_cancel, clock=time.time):
+        self.after = after
+        self.after_cancel = after_cancel
+        self.clock = clock
+        self.heap = []            # (截止时间, 版本号, 键)
+        self.entries = {}         # 键 -> (截止时间, 版本号, callback)
+        self._version = 0
+        self._job = None
+        self._armed_at = None
+
+    def schedule(self, key, when, callback):
+        self._version += 1
+        self.entries[key] = (when, self._version, callback)
+        heapq.heappush(self.heap, (when, self._version, key))
+        self._arm()
+
+    def cancel(self, key):
+        if self.entries.pop(key, None) is not None:
+            self._arm()
+
+    def clear(self):
+        self.entries.clear()
+        self.heap = []
+        self._arm()
+
+    def next_deadline(self):
+        self._discard_stale()
+        return self.heap[0][0] if self.heap else None
+
+    def _discard_stale(self):
+        heap = self.heap
+        while heap:
+            when, version, key = heap[0]
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] == version:
+                return
+            heapq.heappop(heap)
+
+    def _arm(self):
+        when = self.next_deadline()
+        if when == self._armed_at:
+            return
+        if self._job is not None:
+            try:
+                self.after_cancel(self._job)
+            except TclError:
+                pass    # 回调已执行或窗口已销毁
+            self._job = None
+        self._armed_at = when
+        if when is not None:
+            delay = max(0, when - self.clock())
+            # 向上取整到毫秒，保证醒来时已到截止时间
+            self._job = self.after(int(delay * 1000) + 1, self._fire)
+
+    def _fire(self):
+        self._job = None
+        self._armed_at = None
+        now = self.clock()
+        while True:
+            self._discard_stale()
+            if not self.heap or self.heap[0][0] > now:
+                break
+            when, version, key = heapq.heappop(self.heap)
+            callback = self.entries.pop(key)[2]
+            try:
+                callback(key, when)
+            except:
+                # 出错的提醒或自动停止不能悄无声息地消失
+                import traceback
+                traceback.print_exc()
+        self._arm()
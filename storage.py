@@ -0,0 +1,794 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+from history_index import DayIndex, TagIndex, record_day
+from history_records import TIME_FORMAT, ColumnTable, parse_tags
+
+
+SNAPSHOT_VERSION = 2
+
+
+def record_key(rec):
+    """历史记录的自然键（事件名 + 开始/结束时间）"""
+    return (rec.get("event"), rec.get("start_time"), rec.get("end_time"))
+
+
+def to_epoch(dt_str):
+    try:
+        return int(datetime.strptime(dt_str, TIME_FORMAT).timestamp())
+    except:
+        return None
+
+
+def record_matches(rec, tags=None, days=None, match_all=False):
+    """记录是否满足标签（任一匹配，match_all 时需全部匹配）和日期范围 (起, 止) 筛选"""
+    if tags:
+        rec_tags = set(parse_tags(rec.get("tags", "")))
+        if not (tags <= rec_tags if match_all else rec_tags & tags):
+            return False
+    if days is not None:
+        d = record_day(rec)
+        if d is not None and not days[0] <= d <= days[1]:
+            return False
+    return True
+
+
+def atomic_write_text(path, text):
+    """先写临时文件再重命名，崩溃时不会留下写了一半的文件"""
+    tmp = path + ".tmp"
+    try:
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+class WriteBehindWriter:
+    """后台合并写入线程
+
+    mark_dirty 只登记“某个文件需要重写”，写入线程在合并窗口结束后统一落盘，
+    同一文件在一个窗口内最多写一次；整文件写入使用临时文件 + 重命名。
+    追加行和任务按提交顺序执行，调用方（Tk 线程）不会因磁盘 I/O 阻塞。
+    """
+
+    def __init__(self, window=1.0, lock=None):
+        self.window = window
+        self.lock = lock if lock is not None else threading.RLock()  # 序列化数据时持有
+        self.on_error = None
+        self._cond = threading.Condition()
+        self._dirty = {}
+        self._queue = []
+        self._deadline = None
+        self._busy = False
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def mark_dirty(self, path, producer):
+        """登记需要整体重写的 JSON 文件；producer 在写入线程中持锁调用"""
+        with self._cond:
+            self._dirty[path] = producer
+            self._schedule()
+
+    def append_line(self, path, line):
+        with self._cond:
+            if self._queue and self._queue[-1][0] == "append" and self._queue[-1][1] == path:
+                self._queue[-1][2].append(line)
+            else:
+                self._queue.append(("append", path, [line]))
+            self._schedule()
+
+    def run_task(self, fn):
+        """在写入线程中按提交顺序执行一个磁盘操作"""
+        with self._cond:
+            self._queue.append(("task", fn, None))
+            self._schedule()
+
+    def _schedule(self):
+        if self._deadline is None:
+            self._deadline = time.monotonic() + self.window
+            self._cond.notify_all()
+
+    def _pending(self):
+        return bool(self._dirty or self._queue)
+
+    def flush(self):
+        """立即写出所有待写内容并等待完成（退出程序时使用）"""
+        if threading.current_thread() is self._thread:
+            return
+        with self._cond:
+            if self._pending():
+                self._deadline = 0
+                self._cond.notify_all()
+            while self._pending() or self._busy:
+                self._cond.wait()
+
+    def close(self):
+        self.flush()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed:
+                    if self._deadline is None:
+                        self._cond.wait()
+                        continue
+                    remaining = self._deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if self._closed and not self._pending():
+                    return
+                queue, self._queue = self._queue, []
+                dirty, self._dirty = self._dirty, {}
+                self._deadline = None
+                self._busy = True
+            try:
+                self._write_batch(queue, dirty)
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def _write_batch(self, queue, dirty):
+        for kind, target, lines in queue:
+            try:
+                if kind == "append":
+                    with open(target, 'a', encoding='utf-8') as f:
+                        f.write("".join(lines))
+                else:
+                    target()
+            except Exception as e:
+                self._report(target if kind == "append" else None, e)
+        for path, producer in dirty.items():
+            try:
+                with self.lock:
+                    text = json.dumps(producer(), ensure_ascii=False, indent=2)
+                atomic_write_text(path, text)
+            except Exception as e:
+                self._report(path, e)
+
+    def _report(self, path, error):
+        if self.on_error:
+            try:
+                self.on_error(path, error)
+            except:
+                import traceback    # 只在出错时才需要
+                traceback.print_exc()
+
+
+class HistoryStore:
+    """历史存储后端的公共部分：列式内存表和变更通知
+
+    records 为 ColumnTable，迭代得到只读的 RecordView；JSON 只作为导入/导出格式。
+    监听者以 listener(kind, rec, old) 的形式收到通知，kind 为
+    "add"/"update"/"delete"/"reset"（清空或整体替换，rec 为 None），old 为修改前的字典。
+    tag_index（标签倒排索引）和 day_index（按日分桶）随每次变更同步维护，
+    不需要内存索引的后端传 indexed=False。
+    压缩（或 SQLite 的整理）开始时调用 compact_listeners 中的 fn()，派生数据可以借此一起落盘。
+    """
+
+    def __init__(self, indexed=True):
+        self.records = ColumnTable()
+        self.listeners = []
+        self.compact_listeners = []
+        self.tag_index = TagIndex(self.records) if indexed else None
+        self.day_index = DayIndex(self.records) if indexed else None
+
+    def add_listener(self, fn):
+        self.listeners.append(fn)
+
+    def remove_listener(self, fn):
+        self.listeners.remove(fn)
+
+    def add_compact_listener(self, fn):
+        self.compact_listeners.append(fn)
+
+    def _notify_compact(self):
+        for fn in self.compact_listeners:
+            fn()
+
+    def _notify(self, kind, rec=None, old=None):
+        if self.tag_index is not None:
+            for index in (self.tag_index, self.day_index):
+                if kind == "add":
+                    index.add(rec)
+                elif kind == "delete":
+                    index.remove(rec)
+                elif kind == "update":
+                    index.update(rec, old)
+                else:
+                    index.rebuild(self.records)
+        for fn in self.listeners:
+            fn(kind, rec, old)
+
+    def get(self, rid):
+        """按记录 id 取记录，不存在时返回 None"""
+        return self.records.get(rid)
+
+    def snapshot(self, days=None):
+        """全部记录的只读快照，返回 load()，调用它得到一张独立的 ColumnTable
+
+        本方法在修改存储的线程（Tk 线程）中调用，只复制内存中的列数组；load() 可以在任何线程中调用。
+        给出 days 时，快照至少包含开始日期在 days 内的全部记录：按需加载的后端只读取相关的部分，
+        读到的记录只进快照，不并入存储，用完即释放。
+        """
+        table = self.records.copy()
+        return lambda: table
+
+    def unloaded(self):
+        """尚未加载到内存的记录条数"""
+        return 0
+
+    def read_range(self, first, last):
+        """开始日期与 [first, last] 有交集、尚未加载的记录：返回在后台线程中调用的 load()，
+        其结果在修改存储的线程中交给 merge_range() 并入；记录都在内存中时返回 None
+        """
+        return None
+
+    def merge_range(self, loaded):
+        pass
+
+    def query(self, tags=None, days=None, match_all=False):
+        """按标签和日期范围 (起, 止) 筛选；标签走倒排索引，日期直接取对应的日期桶"""
+        if self.tag_index is None:
+            return [ev for ev in self.records if record_matches(ev, tags, days, match_all)]
+        bits = self.tag_index.match(tags, match_all) if tags else None
+        if days is None:
+            return list(self.records) if bits is None else self.tag_index.records(bits)
+        candidates = self.day_index.records(*days)
+        if bits is None:
+            return candidates
+        return [ev for ev in candidates if self.tag_index.contains(bits, ev)]
+
+    def day_counts(self, first, last):
+        """[first, last] 内每天的记录数（供日历标记有记录的日期）"""
+        if self.day_index is not None:
+            index = self.day_index
+            return {d: index.count(d) for d in index.days if first <= d <= last}
+        counts = {}
+        for ev in self.query(None, (first, last)):
+            d = record_day(ev)
+            if d is not None:
+                counts[d] = counts.get(d, 0) + 1
+        return counts
+
+
+class JsonHistoryStore(HistoryStore):
+    """历史记录存储：快照文件 + 追加式日志（JSONL）
+
+    每次新增、修改、删除只向日志追加一行，不再重写整个历史文件；
+    日志累积到一定条数后压缩为新快照。所有写盘都交给 WriteBehindWriter 在后台完成。
+    启动时读取快照并回放日志，旧版纯列表格式的历史文件会被自动迁移。
+    """
+
+    def __init__(self, data_file, writer=None, compact_threshold=500):
+        HistoryStore.__init__(self)
+        self.data_file = data_file
+        base = os.path.splitext(data_file)[0]
+        self.journal_file = base + ".journal.jsonl"
+        self.rotated_file = base + ".journal.old.jsonl"
+        self.compact_threshold = compact_threshold
+        self.seq = 0
+        self._own_writer = writer is None
+        self.writer = writer if writer is not None else WriteBehindWriter(window=0)
+        self._journal_ops = 0
+        self._compacting = False
+        self._compact_error = None
+
+    # ---------- 加载 ----------
+    def load(self):
+        records, seq, ops, legacy = self.read()
+        self.records = ColumnTable.from_records(records)
+        del records
+        self.seq = seq
+        self._journal_ops = ops
+        self.tag_index.rebuild(self.records)
+        self.day_index.rebuild(self.records)
+        # 新分配的记录 id 要尽快写进快照，之后的日志按 id 引用记录
+        if legacy or self.records.assigned_ids or ops >= self.compact_threshold:
+            self.compact()
+        return self.records
+
+    def read(self):
+        """读取快照并回放日志，不改动任何文件；返回 (记录, 序号, 日志条数, 是否旧格式)"""
+        records = []
+        seq = 0
+        legacy = False
+        if os.path.exists(self.data_file):
+            try:
+                with open(self.data_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if isinstance(data, list):
+                    records = data
+                    legacy = True
+                else:
+                    records = data.get("records", [])
+                    seq = data.get("seq", 0)
+            except:
+                records = []
+
+        ops = 0
+        by_id = None     # 记录 id -> 位置（遇到修改/删除时才建立）
+        by_key = None    # 旧版日志按自然键定位：键 -> 位置列表
+        for path in (self.rotated_file, self.journal_file):
+            for op in self._read_journal(path):
+                if op.get("seq", 0) <= seq:
+                    continue
+                seq = op["seq"]
+                ops += 1
+                kind = op.get("op")
+                if kind == "add":
+                    records.append(op["rec"])
+                    if by_id is not None:
+                        self._locate(by_id, by_key, op["rec"], len(records) - 1)
+                elif kind == "clear":
+                    records = []
+                    by_id = by_key = None
+                elif kind in ("set", "del"):
+                    if by_id is None:
+                        by_id, by_key = {}, {}
+                        for i, r in enumerate(records):
+                            if r is not None:
+                                self._locate(by_id, by_key, r, i)
+                    if kind == "set":
+                        rec = op["rec"]
+                        if "id" in rec:
+                            i = by_id.get(rec["id"])
+                        else:
+                            i = next(iter(by_key.get(record_key(rec), ())), None)
+                        if i is not None and records[i] is not None:
+                            records[i] = rec
+                    elif "ids" in op:
+                        for rid in op["ids"]:
+                            i = by_id.pop(rid, None)
+                            if i is not None:
+                                records[i] = None
+                    else:
+                        idxs = by_key.get(tuple(op["key"]), [])
+                        while idxs and records[idxs[0]] is None:
+                            idxs.pop(0)
+                        if idxs:
+                            records[idxs.pop(0)] = None
+        if by_id is not None:
+            records = [r for r in records if r is not None]
+        return records, seq, ops, legacy
+
+    @staticmethod
+    def _locate(by_id, by_key, rec, i):
+        if "id" in rec:
+            by_id[rec["id"]] = i
+        by_key.setdefault(record_key(rec), []).append(i)
+
+    def _read_journal(self, path):
+        if not os.path.exists(path):
+            return
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # 崩溃时可能留下半行，跳过
+                    continue
+
+    # ---------- 变更（每次追加一行日志）----------
+    def append(self, rec):
+        view = self.records.append(rec)
+        self._write_op({"op": "add", "rec": view.to_dict()})
+        self._notify("add", view)
+        return view
+
+    def update(self, rec, changes):
+        old = rec.to_dict()
+        self.records.update(rec.row, changes)
+        self._write_op({"op": "set", "rec": rec.to_dict()})
+        self._notify("update", rec, old)
+
+    def delete(self, rec):
+        self.delete_many([rec])
+
+    def delete_many(self, recs):
+        """删除多条记录，只追加一行日志"""
+        if not recs:
+            return
+        for rec in recs:
+            self.records.delete(rec.row)
+        self._write_op({"op": "del", "ids": [rec.id for rec in recs]})
+        for rec in recs:
+            self._notify("delete", rec)
+
+    def clear(self):
+        self.records.clear()
+        self._write_op({"op": "clear"})
+        self._notify("reset")
+
+    def replace_all(self, records):
+        """用给定记录整体替换（切换存储后端时使用）"""
+        self.writer.flush()
+        # 新快照的序号要盖过磁盘上残留的旧日志，否则下次启动会被重放
+        for path in (self.rotated_file, self.journal_file):
+            for op in self._read_journal(path):
+                self.seq = max(self.seq, op.get("seq", 0))
+        self.records = ColumnTable.from_records(records)
+        self.compact(wait=True)
+        self._notify("reset")
+        return self.records
+
+    def _write_op(self, op):
+        self.seq += 1
+        op["seq"] = self.seq
+        self.writer.append_line(self.journal_file, json.dumps(op, ensure_ascii=False) + "\n")
+        self._journal_ops += 1
+        if self._journal_ops >= self.compact_threshold:
+            self.compact()
+
+    # ---------- 压缩 ----------
+    def compact(self, wait=False):
+        """把日志并入新快照；由写入线程按顺序执行，wait=True 时等待完成"""
+        if self._compacting and not wait:
+            return
+        self._compacting = True
+        self._journal_ops = 0
+        self._notify_compact()
+        # 列数组的副本很便宜；转成字典、序列化都在写入线程中进行
+        snapshot = self.records.copy()
+        seq = self.seq
+        self.writer.run_task(lambda: self._compact_files(snapshot, seq))
+        if wait:
+            self.writer.flush()
+            error, self._compact_error = self._compact_error, None
+            if error is not None:
+                raise error
+
+    def _compact_files(self, snapshot, seq):
+        try:
+            self._rotate_journal()
+            self._write_snapshot(snapshot, seq)
+        except OSError as e:
+            # 待压缩日志仍在，下次启动会重新回放
+            self._compact_error = e
+        finally:
+            self._compacting = False
+
+    def _rotate_journal(self):
+        if os.path.exists(self.journal_file):
+            if os.path.exists(self.rotated_file):
+                # 上一次压缩没有完成：把当前日志并入待压缩日志
+                with open(self.journal_file, 'rb') as src, open(self.rotated_file, 'ab') as dst:
+                    dst.write(src.read())
+                os.remove(self.journal_file)
+            else:
+                os.replace(self.journal_file, self.rotated_file)
+
+    def _write_snapshot(self, records, seq):
+        tmp = self.data_file + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({"version": SNAPSHOT_VERSION, "seq": seq,
+                       "records": [rec.to_dict() for rec in records]},
+                      f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.data_file)
+        # 快照已记录 seq，即使这里删除失败，重放时也会跳过旧日志
+        if os.path.exists(self.rotated_file):
+            os.remove(self.rotated_file)
+
+    def close(self):
+        if self._own_writer:
+            self.writer.close()
+        else:
+            self.writer.flush()
+
+
+class SqliteHistoryStore(HistoryStore):
+    """基于 SQLite 的历史记录存储（可选后端）
+
+    开始/结束时间戳、持续时间和事件名都建有索引，标签通过 event_tags 关联表
+    建立索引，因此按标签/日期筛选和删除都是索引查找而不是全表扫描。
+    数据库行 id 即记录 id。写操作在写入线程中用独立连接提交；尚未提交的新增/修改在查询时直接按内存记录判断。
+    内存中仍保留一份列式表，供标签统计等界面代码使用。
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY,
+            event TEXT NOT NULL,
+            tags TEXT NOT NULL DEFAULT '',
+            start_time TEXT,
+            end_time TEXT,
+            start_epoch INTEGER,
+            end_epoch INTEGER,
+            duration TEXT,
+            duration_seconds INTEGER,
+            duration_ms INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS idx_events_start ON events(start_epoch);
+        CREATE INDEX IF NOT EXISTS idx_events_end ON events(end_epoch);
+        CREATE INDEX IF NOT EXISTS idx_events_duration ON events(duration_seconds);
+        CREATE INDEX IF NOT EXISTS idx_events_event ON events(event);
+        CREATE TABLE IF NOT EXISTS tags (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
+        );
+        CREATE TABLE IF NOT EXISTS event_tags (
+            tag_id INTEGER NOT NULL REFERENCES tags(id),
+            event_id INTEGER NOT NULL REFERENCES events(id) ON DELETE CASCADE,
+            PRIMARY KEY (tag_id, event_id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_event_tags_event ON event_tags(event_id);
+    """
+
+    def __init__(self, db_file, writer=None):
+        # 筛选直接走数据库索引，不需要内存倒排索引
+        HistoryStore.__init__(self, indexed=False)
+        self.db_file = db_file
+        self.conn = None
+        self._own_writer = writer is None
+        self.writer = writer if writer is not None else WriteBehindWriter(window=0)
+        self._wconn = None         # 写入线程专用连接
+        self._tag_ids = {}         # 仅写入线程使用
+        self._pending = {}         # 尚未提交的新增/修改：记录 id -> 记录
+        self._pending_lock = threading.Lock()
+
+    def _open(self):
+        conn = sqlite3.connect(self.db_file, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    def _connect(self):
+        if self.conn is None:
+            self.conn = self._open()
+            self.conn.executescript(self.SCHEMA)
+            columns = {row[1] for row in self.conn.execute("PRAGMA table_info(events)")}
+            if "duration_ms" not in columns:
+                # 旧数据库：补上毫秒时长列，旧记录保持 NULL（读取时按整秒换算）
+                with self.conn:
+                    self.conn.execute("ALTER TABLE events ADD COLUMN duration_ms INTEGER")
+        return self.conn
+
+    def _writer_conn(self):
+        if self._wconn is None:
+            self._wconn = self._open()
+            self._tag_ids = dict(self._wconn.execute("SELECT name, id FROM tags"))
+        return self._wconn
+
+    def exists(self):
+        return os.path.exists(self.db_file)
+
+    # ---------- 加载 ----------
+    def load(self):
+        conn = self._connect()
+        self.records.clear()
+        cur = conn.execute("SELECT id, event, tags, start_time, end_time, duration, duration_seconds, "
+                           "duration_ms FROM events ORDER BY id")
+        for row_id, event, tags, start, end, dur, secs, ms in cur:
+            rec = {
+                "id": row_id,
+                "event": event,
+                "tags": tags,
+                "start_time": start,
+                "end_time": end,
+                "duration": dur,
+                "duration_seconds": secs
+            }
+            if ms is not None:
+                rec["duration_ms"] = ms
+            self.records.append(rec)
+        return self.records
+
+    # ---------- 写入线程中执行的 SQL ----------
+    def _tag_id(self, conn, name):
+        tid = self._tag_ids.get(name)
+        if tid is None:
+            conn.execute("INSERT OR IGNORE INTO tags(name) VALUES (?)", (name,))
+            tid = conn.execute("SELECT id FROM tags WHERE name = ?", (name,)).fetchone()[0]
+            self._tag_ids[name] = tid
+        return tid
+
+    def _columns(self, rec):
+        return (rec.get("event", ""), rec.get("tags", "") or "", rec.get("start_time"), rec.get("end_time"),
+                to_epoch(rec.get("start_time", "")), to_epoch(rec.get("end_time", "")),
+                rec.get("duration"), rec.get("duration_seconds", 0), rec.get("duration_ms"))
+
+    def _insert(self, conn, row_id, values, tag_str):
+        conn.execute(
+            "INSERT INTO events(id, event, tags, start_time, end_time, start_epoch, end_epoch, "
+            "duration, duration_seconds, duration_ms) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", (row_id,) + values)
+        self._link_tags(conn, row_id, tag_str)
+
+    def _link_tags(self, conn, row_id, tag_str):
+        conn.executemany("INSERT OR IGNORE INTO event_tags(tag_id, event_id) VALUES (?, ?)",
+                         [(self._tag_id(conn, t), row_id) for t in parse_tags(tag_str)])
+
+    def _submit(self, row_id, rec, write):
+        """记录未提交的变更并交给写入线程执行 write(conn)"""
+        token = object()
+        with self._pending_lock:
+            if rec is None:
+                self._pending.pop(row_id, None)
+            else:
+                self._pending[row_id] = (token, rec)
+
+        def task():
+            conn = self._writer_conn()
+            with conn:
+                write(conn)
+            with self._pending_lock:
+                entry = self._pending.get(row_id)
+                if entry is not None and entry[0] is token:
+                    del self._pending[row_id]
+        self.writer.run_task(task)
+
+    # ---------- 变更 ----------
+    def append(self, rec):
+        view = self.records.append(rec)
+        row_id = view.id
+        values = self._columns(view)
+        tag_str = view.get("tags", "")
+        self._submit(row_id, view, lambda conn: self._insert(conn, row_id, values, tag_str))
+        self._notify("add", view)
+        return view
+
+    def update(self, rec, changes):
+        row_id = rec.id
+        if self.records.row_of(row_id) is None:
+            return
+        old = rec.to_dict()
+        self.records.update(rec.row, changes)
+        values = self._columns(rec)
+        tag_str = rec.get("tags", "")
+
+        def write(conn):
+            conn.execute(
+                "UPDATE events SET event = ?, tags = ?, start_time = ?, end_time = ?, start_epoch = ?, "
+                "end_epoch = ?, duration = ?, duration_seconds = ?, duration_ms = ? WHERE id = ?", values + (row_id,))
+            conn.execute("DELETE FROM event_tags WHERE event_id = ?", (row_id,))
+            self._link_tags(conn, row_id, tag_str)
+        self._submit(row_id, rec, write)
+        self._notify("update", rec, old)
+
+    def delete(self, rec):
+        self.delete_many([rec])
+
+    def delete_many(self, recs):
+        """删除多条记录，在一个事务中提交"""
+        recs = [rec for rec in recs if self.records.row_of(rec.id) is not None]
+        if not recs:
+            return
+        ids = [rec.id for rec in recs]
+        for rec in recs:
+            self.records.delete(rec.row)
+        with self._pending_lock:
+            for row_id in ids:
+                self._pending.pop(row_id, None)
+
+        def task():
+            conn = self._writer_conn()
+            with conn:
+                conn.executemany("DELETE FROM events WHERE id = ?", [(row_id,) for row_id in ids])
+        self.writer.run_task(task)
+        for rec in recs:
+            self._notify("delete", rec)
+
+    def clear(self):
+        self.records.clear()
+        with self._pending_lock:
+            self._pending.clear()
+
+        def task():
+            conn = self._writer_conn()
+            with conn:
+                conn.execute("DELETE FROM event_tags")
+                conn.execute("DELETE FROM events")
+        self.writer.run_task(task)
+        self._notify("reset")
+
+    def replace_all(self, records):
+        """一次性导入全部记录（覆盖数据库中已有内容），等待写入完成"""
+        self._connect()
+        self.clear()
+        rows = []
+        for rec in records:
+            # 保留原记录 id（从 JSON 导入或切换后端时 id 不变）
+            view = self.records.append(rec)
+            rows.append((view.id, self._columns(view), view.get("tags", "")))
+
+        def task():
+            conn = self._writer_conn()
+            with conn:
+                for row_id, values, tag_str in rows:
+                    self._insert(conn, row_id, values, tag_str)
+        self.writer.run_task(task)
+        self.writer.flush()
+        self._notify("reset")
+        return self.records
+
+    # ---------- 查询 ----------
+    def query(self, tags=None, days=None, match_all=False):
+        """按标签和日期范围筛选，走索引；未提交的变更按内存记录判断"""
+        self._connect()
+        sql = "SELECT id FROM events"
+        where = []
+        params = []
+        if days is not None:
+            first, last = days
+            start = datetime(first.year, first.month, first.day)
+            end = datetime(last.year, last.month, last.day) + timedelta(days=1)
+            # 开始时间无法解析的记录与 JSON 后端一致：不受日期筛选影响
+            where.append("(start_epoch IS NULL OR (start_epoch >= ? AND start_epoch < ?))")
+            params += [int(start.timestamp()), int(end.timestamp())]
+        if tags:
+            sub = ("SELECT et.event_id FROM event_tags et JOIN tags t ON t.id = et.tag_id "
+                   "WHERE t.name IN (%s)" % ",".join("?" * len(tags)))
+            params += list(tags)
+            if match_all:
+                sub += " GROUP BY et.event_id HAVING COUNT(*) = ?"
+                params.append(len(tags))
+            where.append("id IN (%s)" % sub)
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        with self._pending_lock:
+            pending = dict(self._pending)
+        get = self.records.get
+        result = [rec for rec in (get(row_id) for (row_id,) in self.conn.execute(sql, params)
+                                  if row_id not in pending) if rec is not None]
+        for row_id, (_, rec) in pending.items():
+            if self.records.row_of(row_id) is not None and record_matches(rec, tags, days, match_all):
+                result.append(rec)
+        return result
+
+    def compact(self, wait=False):
+        self._notify_compact()
+
+        def task():
+            self._writer_conn().execute("PRAGMA optimize")
+        self.writer.run_task(task)
+        if wait:
+            self.writer.flush()
+
+    def close(self):
+        def task():
+            if self._wconn is not None:
+                self._wconn.close()
+                self._wconn = None
+        self.writer.run_task(task)
+        if self._own_writer:
+            self.writer.close()
+        else:
+            self.writer.flush()
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+def import_json_history(data_file, db_file):
+    """一次性把 JSON 历史（快照 + 日志）导入 SQLite，返回导入条数"""
+    source = JsonHistoryStore(data_file)
+    try:
+        records = source.read()[0]
+    finally:
+        source.close()
+    store = SqliteHistoryStore(db_file)
+    try:
+        store.replace_all(records)
+    finally:
+        store.close()
+    return len(records)
@@ -0,0 +1,176 @@
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+import autocomplete
+from autocomplete import (EXACT_BONUS, HALF_LIFE, TOP_K, NameIndex, frecency_at, match_syllables,
+                          migrate_names, romanize)
+
+NOW = datetime(2024, 3, 1, 12, 0, 0)
+
+
+def names(**frecency):
+    ts = NOW.timestamp()
+    return {name: {"frecency": float(f), "updated": ts} for name, f in frecency.items()}
+
+
+@pytest.fixture
+def no_pinyin(monkeypatch):
+    """模拟未安装 pypinyin：导入失败，并清掉已缓存的注音函数"""
+    monkeypatch.setitem(sys.modules, "pypinyin", None)
+    monkeypatch.setattr(autocomplete, "_pinyin", None)
+
+
+@pytest.fixture
+def fake_pinyin(monkeypatch):
+    readings = {"开": ["kai"], "会": ["hui", "kuai"], "写": ["xie"], "代": ["dai"], "码": ["ma"]}
+    monkeypatch.setattr(autocomplete, "_pinyin", lambda text: [readings.get(ch, []) for ch in text])
+
+
+# ---------- 前缀与子串 ----------
+def test_prefix_search_uses_trie_cache_in_score_order():
+    index = NameIndex(names(写代码=5, 写文档=9, 写周报=1, 读书=20), now=NOW)
+    assert index.search("写", now=NOW) == ["写文档", "写代码", "写周报"]
+    assert index._find("写代").top == ["写代码"]
+    assert index.search("", k=2, now=NOW) == ["读书", "写文档"]
+    assert index.search("跑", now=NOW) == []
+
+
+def test_exact_match_beats_prefix_and_substring_beats_nothing():
+    index = NameIndex(names(开会=1, 开会准备=50, 周会开会=80), now=NOW)
+    assert index.search("开会", now=NOW) == ["开会", "开会准备", "周会开会"]
+    assert index.search("会准", now=NOW) == ["开会准备"]
+
+
+def test_substring_candidates_come_from_bigram_postings():
+    index = NameIndex(names(晨间跑步=1, 夜跑=2, 跑步机=3), now=NOW)
+    assert index._substring_candidates("跑步") == {"晨间跑步", "跑步机"}
+    assert index._substring_candidates("步跑") == set()
+    # 不以查询开头的子串匹配排在前缀匹配之后
+    assert index.search("跑步", now=NOW) == ["跑步机", "晨间跑步"]
+
+
+def test_remove_refills_prefix_cache_from_children():
+    data = names(**{f"任务{i:02d}": i for i in range(TOP_K + 5)})
+    index = NameIndex(data, now=NOW)
+    top = index.search("任务", now=NOW)
+    index.remove(top[0])
+    assert index.search("任务", now=NOW) == top[1:] + ["任务04"]
+    assert top[0] not in index._substring_candidates("任务")
+
+
+# ---------- 模糊匹配与拼音 ----------
+def test_fuzzy_fallback_skips_characters(no_pinyin):
+    index = NameIndex(names(写周报=1, 读书=1), now=NOW)
+    assert index.search("写报", now=NOW) == ["写周报"]
+    assert index.search("ab", now=NOW) == []
+
+
+def test_pinyin_is_skipped_cleanly_without_pypinyin(no_pinyin):
+    assert romanize("开会code") == (("开",), ("会",), ("code",))
+    index = NameIndex(names(开会=3), now=NOW)
+    assert index.search("kh", now=NOW) == []
+    assert index.search("co", now=NOW) == []
+    assert not index.truncated
+
+
+def test_pinyin_initials_and_full_spelling(fake_pinyin):
+    syllables = romanize("开会")
+    assert syllables == (("开", "kai"), ("会", "hui", "kuai"))
+    assert match_syllables("kh", syllables) == (0, 0)
+    assert match_syllables("hui", syllables) == (1, 0)
+    index = NameIndex(names(开会=1, 写代码=1, 代码评审=30), now=NOW)
+    assert index.search("kh", now=NOW) == ["开会"]
+    assert index.search("kaihui", now=NOW) == ["开会"]
+    # 从第一个字起匹配的加分高于从中间起匹配，即使后者热度更高
+    assert index.search("dm", now=NOW)[0] == "代码评审"
+    assert index.search("xdm", now=NOW) == ["写代码"]
+
+
+def test_real_pypinyin(monkeypatch):
+    pytest.importorskip("pypinyin")
+    monkeypatch.setattr(autocomplete, "_pinyin", None)
+    index = NameIndex(names(开会=1), now=NOW)
+    assert index.search("kh", now=NOW) == ["开会"]
+
+
+# ---------- 使用热度 ----------
+def test_frecency_decays_by_half_life():
+    data = {"frecency": 8.0, "updated": NOW.timestamp()}
+    assert frecency_at(data, NOW.timestamp() + HALF_LIFE) == pytest.approx(4.0)
+    assert frecency_at(data, NOW.timestamp() + 3 * HALF_LIFE) == pytest.approx(1.0)
+
+
+def test_recent_use_outranks_old_heavy_use():
+    index = NameIndex(names(老习惯=3), now=NOW)
+    later = NOW + timedelta(seconds=2 * HALF_LIFE)
+    index.use("新习惯", later)
+    index.use("新习惯", later)
+    # 老习惯衰减到 0.75，新习惯两次刚发生的使用是 2
+    assert index.search("", now=later) == ["新习惯", "老习惯"]
+    assert index.data["新习惯"]["frecency"] == pytest.approx(2.0)
+
+
+def test_use_promotes_name_along_its_trie_path():
+    index = NameIndex(names(写代码=5, 写文档=6), now=NOW)
+    index.use("写代码", NOW)
+    index.use("写代码", NOW)
+    assert index.search("写", now=NOW) == ["写代码", "写文档"]
+    assert index.scores["写代码"] > index.scores["写文档"]
+    assert index.scores["写代码"] < EXACT_BONUS
+
+
+def test_new_day_rebuilds_scores():
+    index = NameIndex(names(读书=1), now=NOW)
+    tomorrow = NOW + timedelta(days=1)
+    index.search("读", now=tomorrow)
+    assert index.day == tomorrow.date()
+    assert index.scores["读书"] < NameIndex(names(读书=1), now=NOW).scores["读书"]
+
+
+def test_migrate_names_converts_legacy_counts():
+    data = {
+        "读书": {"count": 4, "last_used": "2024-02-16 12:00:00"},
+        "跑步": {"count": 2},
+        "坏数据": {"count": "很多", "last_used": "不是时间"},
+        "新格式": {"frecency": 1.5, "updated": 0.0},
+    }
+    assert migrate_names(data, NOW)
+    assert data["读书"] == {"frecency": 4.0,
+                          "updated": datetime(2024, 2, 16, 12, 0, 0).timestamp()}
+    assert data["跑步"] == {"frecency": 2.0, "updated": NOW.timestamp()}
+    assert data["坏数据"] == {"frecency": 0.0, "updated": NOW.timestamp()}
+    assert data["新格式"] == {"frecency": 1.5, "updated": 0.0}
+    assert not migrate_names(data, NOW)
+    # 读书的四次使用已过去一个半衰期，折合 2 次，与跑步持平
+    assert frecency_at(data["读书"], NOW.timestamp()) == pytest.approx(2.0)
+
+
+def test_migrate_names_clamps_future_last_used():
+    data = {"读书": {"count": 1, "last_used": "2030-01-01 00:00:00"}}
+    migrate_names(data, NOW)
+    assert data["读书"]["updated"] == NOW.timestamp()
+
+
+# ---------- 名称数上限 ----------
+def test_trim_evicts_coldest_but_keeps_just_used():
+    data = names(a=5, b=4, c=3, d=2, e=1)
+    index = NameIndex(data, now=NOW)
+    index.use("新", NOW)
+    removed = index.trim(4, keep="新")
+    assert sorted(removed) == ["d", "e"]
+    assert set(data) == {"a", "b", "c", "新"} == set(index.scores)
+    assert index.search("", now=NOW) == ["a", "b", "c", "新"]
+    assert index.trim(4) == []
+
+
+def test_trim_many_rebuilds_index():
+    data = names(**{f"n{i:03d}": i for i in range(TOP_K * 3)})
+    index = NameIndex(data, now=NOW)
+    removed = index.trim(10)
+    assert len(removed) == TOP_K * 3 - 10
+    assert sorted(data) == [f"n{i:03d}" for i in range(TOP_K * 3 - 10, TOP_K * 3)]
+    assert set(index.romans) == set(data)
+    assert index.search("n", now=NOW) == sorted(data, reverse=True)
+    assert index._substring_candidates("n0") == {n for n in data if "n0" in n}
@@ -0,0 +1,88 @@
+import threading
+
+from commands import QUIT_APP, SHOW_MAIN_WINDOW, CommandQueue
+
+
+class FakeLoop:
+    """记录 after() 和唤醒请求，由测试代替 Tk 主循环执行"""
+
+    def __init__(self):
+        self.pending = []
+        self.wakes = 0
+
+    def after(self, ms, fn):
+        self.pending.append(fn)
+
+    def wake(self):
+        self.wakes += 1
+
+    def run(self):
+        pending, self.pending = self.pending, []
+        for fn in pending:
+            fn()
+
+
+def make_queue():
+    loop = FakeLoop()
+    commands = CommandQueue(loop.after, loop.wake)
+    return loop, commands
+
+
+def test_one_wake_per_batch():
+    loop, commands = make_queue()
+    seen = []
+    commands.register(SHOW_MAIN_WINDOW, seen.append)
+    for i in range(5):
+        commands.post(SHOW_MAIN_WINDOW, i)
+    assert loop.wakes == 1
+    commands.drain()
+    assert seen == [0, 1, 2, 3, 4]
+    commands.post(SHOW_MAIN_WINDOW, 5)
+    assert loop.wakes == 2
+    commands.drain()
+    assert seen[-1] == 5
+    assert commands.stats()["count"] == 6
+
+
+def test_idle_queue_schedules_nothing():
+    loop, commands = make_queue()
+    commands.register(SHOW_MAIN_WINDOW, lambda: None)
+    commands.start()
+    loop.run()
+    assert loop.pending == [] and loop.wakes == 0
+
+
+def test_start_drains_commands_posted_before_main_loop():
+    loop, commands = make_queue()
+    seen = []
+    commands.register(SHOW_MAIN_WINDOW, seen.append)
+    commands.post(SHOW_MAIN_WINDOW, 1)
+    commands.start()
+    loop.run()
+    assert seen == [1]
+
+
+def test_posts_from_other_threads():
+    loop, commands = make_queue()
+    seen = []
+    commands.register(SHOW_MAIN_WINDOW, seen.append)
+    threads = [threading.Thread(target=lambda k=k: [commands.post(SHOW_MAIN_WINDOW, k * 100 + i) for i in range(100)])
+               for k in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    commands.drain()
+    assert sorted(seen) == sorted(k * 100 + i for k in range(4) for i in range(100))
+
+
+def test_handler_error_is_logged_and_later_commands_run(capsys):
+    loop, commands = make_queue()
+    seen = []
+    commands.register(QUIT_APP, lambda: 1 / 0)
+    commands.register(SHOW_MAIN_WINDOW, seen.append)
+    commands.post(QUIT_APP)
+    commands.post(SHOW_MAIN_WINDOW, 1)
+    commands.drain()
+    assert seen == [1]
+    assert "ZeroDivisionError" in capsys.readouterr().err
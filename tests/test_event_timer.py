@@ -0,0 +1,245 @@
+import threading
+import time
+from datetime import date, timedelta
+
+import pytest
+
+tk = pytest.importorskip("tkinter")
+
+from headless import background_load, close_app, load_app, make_app, pump
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = make_app(str(tmp_path))
+    load_app(app)
+    yield app
+    close_app(app)
+
+
+def test_live_stats_running_event(app):
+    app.engine.start("写代码", "#工作")
+    (day, name, tags, ms), = app.live_stats()
+    assert name == "写代码"
+    assert tags == ["工作"]
+    assert day == app.current_events["写代码"]["start_time"].date()
+    assert ms >= 0
+
+
+def test_live_stats_skips_event_paused_in_mode_b(app):
+    app.engine.start("写代码")
+    app.engine.start("开会")
+    app.engine.pause("写代码", "B")
+    assert [name for _, name, _, _ in app.live_stats()] == ["开会"]
+    # 模式 B 暂停时记下的一段已进入历史和统计汇总
+    assert len(app.history_store.records) == 1
+    assert app.stats.summary()[0][1] == 1
+
+
+def test_live_stats_keeps_event_paused_in_mode_a(app):
+    app.engine.start("写代码")
+    app.engine.pause("写代码", "A")
+    assert [name for _, name, _, _ in app.live_stats()] == ["写代码"]
+
+
+def wait_for(app, done, timeout=5.0):
+    """代替主循环执行命令，直到 done() 为真"""
+    deadline = time.monotonic() + timeout
+    pump(app)
+    while not done():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+        pump(app)
+
+
+def cold_record(event, day):
+    start = f"{day} 09:00:00"
+    return {"event": event, "tags": "", "start_time": start, "end_time": f"{day} 10:00:00",
+            "duration": "1h00m", "duration_seconds": 3600, "duration_ms": 3600000}
+
+
+def test_date_filter_reads_cold_shards_in_background(tmp_path):
+    app = make_app(str(tmp_path), backend="sharded")
+    load_app(app)
+    old = (date.today() - timedelta(days=400)).replace(day=1)
+    app.history_store.replace_all([cold_record("很久以前", old.isoformat())])
+    close_app(app)
+
+    app = make_app(str(tmp_path), backend="sharded")
+    load_app(app)
+    try:
+        assert app.history_store.unloaded() == 1
+        app.specific_date_var.set(old.isoformat())
+        app.update_history_display()
+        # 先显示已加载的部分，冷分片在后台线程中读取
+        assert app.history_view.rows == [] and app.range_loads == {(old, old)}
+        assert "正在加载" in app.hist_frame.text
+        wait_for(app, lambda: not app.range_loads)
+        assert [r["event"] for r in app.history_view.rows] == ["很久以前"]
+        assert app.history_store.unloaded() == 0
+        assert "正在加载" not in app.hist_frame.text
+    finally:
+        close_app(app)
+
+
+def test_timing_works_before_background_load_finishes(tmp_path):
+    app = make_app(str(tmp_path))
+    load_app(app)
+    app.engine.start("旧事件")
+    app.engine.stop("旧事件")
+    close_app(app)
+
+    app = make_app(str(tmp_path))
+    release = threading.Event()
+    read = app.read_startup_data
+
+    def slow_read():
+        release.wait(5)
+        return read()
+    app.read_startup_data = slow_read
+    app.start_background_load()
+    try:
+        # 加载尚未完成：照常计时，历史表和补全只是暂时为空
+        assert app.loading and app.history_store is None
+        app.engine.start("早到", "#工作")
+        assert app.engine.stop("早到") is not None
+        app.show_history_progress()
+        app.update_history_display()
+        app.event_entry.insert(0, "早")
+        app.update_dropdown_list()
+        assert app.history_view.rows == []
+        assert "加载中" in app.hist_frame.text
+        assert [r["event"] for r in app.engine.pending_records] == ["早到"]
+
+        release.set()
+        wait_for(app, lambda: not app.loading)
+        # 加载期间完成的记录补写进历史，只出现一次
+        events = [r["event"] for r in app.history_store.records]
+        assert sorted(events) == ["旧事件", "早到"]
+        assert sorted(r["event"] for r in app.history_view.rows) == ["旧事件", "早到"]
+        assert app.engine.pending_records == []
+        assert app.stats.summary()[0][1] == 2
+        assert "已加载 2 条" in app.status_bar.text
+        app.update_dropdown_list()
+        assert app.dropdown_listbox.items == ["早到"]
+    finally:
+        release.set()
+        close_app(app)
+
+    app = make_app(str(tmp_path))
+    load_app(app)
+    try:
+        assert sorted(r["event"] for r in app.history_store.records) == ["旧事件", "早到"]
+    finally:
+        close_app(app)
+
+
+def test_background_load_reports_command_latency(tmp_path):
+    app = make_app(str(tmp_path))
+    load_app(app)
+    app.history_store.replace_all([cold_record(f"事件{i}", "2024-03-01") for i in range(5)])
+    close_app(app)
+
+    app = make_app(str(tmp_path))
+    app.HISTORY_FIRST_CHUNK = 2     # 分三批填充，后两批经 after() 执行
+    try:
+        stats = background_load(app)
+        assert stats["count"] == 1      # DATA_LOADED
+        assert 0 <= stats["p95_ms"] <= stats["max_ms"]
+        assert len(app.history_view.rows) == 5
+        assert app.hist_frame.text == "历史记录"
+    finally:
+        close_app(app)
+
+
+class FakeButton:
+    def __init__(self):
+        self.state = "normal"
+
+    def winfo_exists(self):
+        return True
+
+    def config(self, state):
+        self.state = state
+
+
+def gate_import(app):
+    """让切换线程在导入前等待，返回放行用的 Event"""
+    release = threading.Event()
+    run = app.import_history
+
+    def slow_import(backend, load):
+        release.wait(5)
+        run(backend, load)
+    app.import_history = slow_import
+    return release
+
+
+def test_backend_switch_imports_in_background_and_keeps_changes(tmp_path):
+    app = make_app(str(tmp_path))
+    load_app(app)
+    store = app.history_store
+    for i in range(3):
+        store.append(cold_record(f"事件{i}", "2024-03-0%d" % (i + 1)))
+    app.update_history_display()
+    app.backend_buttons = [FakeButton()]
+    release = gate_import(app)
+    try:
+        app.switch_history_backend("sqlite")
+        # 导入尚未完成：仍在使用旧存储，界面照常可用
+        assert app.switching_backend == "sqlite" and app.history_backend == "json"
+        assert app.history_store is store
+        assert app.backend_buttons[0].state == "disabled"
+        app.switch_history_backend("sharded")      # 切换期间不重复切换
+        assert app.switching_backend == "sqlite"
+        app.engine.start("切换中")
+        app.engine.stop("切换中")
+        first, second = sorted(store.records, key=lambda r: r.id)[:2]
+        store.update(first, {"tags": "#改过"})
+        store.delete(second)
+
+        release.set()
+        wait_for(app, lambda: app.switching_backend is None)
+        assert app.history_backend == "sqlite" and app.history_store is not store
+        assert app.backend_buttons[0].state == "normal"
+        expected = [("事件0", "#改过"), ("事件2", ""), ("切换中", "")]
+        assert sorted((r["event"], r["tags"]) for r in app.history_store.records) == sorted(expected)
+        assert sorted(r["event"] for r in app.history_view.rows) == sorted(e for e, _ in expected)
+        assert app.stats.summary()[0][1] == 3
+        assert "改过" in app.stats.summary()[1]
+        assert store.listeners.count(app.record_switch_change) == 0
+    finally:
+        release.set()
+        close_app(app)
+
+    app = make_app(str(tmp_path), backend="sqlite")
+    load_app(app)
+    try:
+        assert sorted((r["event"], r["tags"]) for r in app.history_store.records) == sorted(expected)
+    finally:
+        close_app(app)
+
+
+def test_failed_backend_switch_keeps_old_store(tmp_path, monkeypatch):
+    import event_timer
+    app = make_app(str(tmp_path))
+    load_app(app)
+    store = app.history_store
+    store.append(cold_record("保留", "2024-03-01"))
+    errors = []
+    monkeypatch.setattr(event_timer.messagebox, "showerror", lambda title, text: errors.append(text))
+
+    def broken(self, records):
+        raise OSError("磁盘已满")
+    monkeypatch.setattr(event_timer.ShardedHistoryStore, "replace_all", broken)
+    try:
+        app.switch_history_backend("sharded")
+        wait_for(app, lambda: app.switching_backend is None)
+        assert app.history_backend == "json" and app.history_store is store
+        assert errors and "磁盘已满" in errors[0]
+        assert app.record_switch_change not in store.listeners
+        store.append(cold_record("之后", "2024-03-02"))
+        assert app.switch_changes == []
+        assert sorted(r["event"] for r in store.records) == ["之后", "保留"]
+    finally:
+        close_app(app)
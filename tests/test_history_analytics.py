@@ -0,0 +1,109 @@
+from datetime import date
+
+import pytest
+
+from history_analytics import HistoryAnalytics
+from history_records import ColumnTable
+
+MIN = 60 * 1000
+
+
+def rec(event, start, minutes, end="不是时间"):
+    ms = int(minutes * MIN)
+    return {"event": event, "tags": "", "start_time": start, "end_time": end,
+            "duration": "", "duration_seconds": ms // 1000, "duration_ms": ms}
+
+
+# 2024-03-04 是星期一
+RECORDS = [
+    rec("写代码", "2024-03-04 09:30:00", 60),      # 跨两个小时
+    rec("写代码", "2024-03-04 14:00:00", 10),
+    rec("写代码", "2024-03-06 23:50:00", 30),      # 跨天，拆到星期三和星期四
+    rec("写代码", "不是时间", 40),                  # 计入百分位和长尾，不计入热力图和每日趋势
+    rec("开会", "2024-03-05 10:00:00", 45),
+    rec("开会", "不是时间", 15),
+    rec("跑步", "2024-03-10 07:00:00", 5),
+    rec("喝水", "2024-03-10 08:00:00", 0),
+    rec("已删除", "2024-03-04 08:00:00", 600),
+]
+
+
+@pytest.fixture
+def table():
+    table = ColumnTable.from_records(RECORDS)
+    table.delete(table.row_of(len(RECORDS)))
+    return table
+
+
+def analyse(table, use_numpy):
+    if use_numpy:
+        np = pytest.importorskip("numpy")
+        return HistoryAnalytics(table, np=np)
+    return HistoryAnalytics(table, use_numpy=False)
+
+
+@pytest.fixture(params=[False, True], ids=["python", "numpy"])
+def analytics(request, table):
+    return analyse(table, request.param)
+
+
+def test_numpy_and_python_agree(table):
+    with_numpy = analyse(table, True).run()
+    without = analyse(table, False).run()
+    assert with_numpy.pop("backend") == "NumPy" and without.pop("backend") == "Python"
+    percentiles = with_numpy.pop("percentiles")
+    assert percentiles.keys() == without["percentiles"].keys()
+    for name, (n, total, points) in without.pop("percentiles").items():
+        assert percentiles[name][:2] == (n, total)
+        assert percentiles[name][2] == pytest.approx(points)
+    assert with_numpy == without
+
+
+def test_percentiles_by_hand(analytics):
+    result = analytics.percentiles()
+    # 写代码 排序后为 10, 30, 40, 60 分钟：p50 位于 1.5 -> 35，p90 位于 2.7 -> 54，p99 位于 2.97 -> 59.4
+    n, total, points = result["写代码"]
+    assert (n, total) == (4, 140 * MIN)
+    assert points == pytest.approx([35 * MIN, 54 * MIN, 59.4 * MIN])
+    assert result["开会"] == (2, 60 * MIN, pytest.approx([30 * MIN, 42 * MIN, 44.7 * MIN]))
+    assert result["喝水"] == (1, 0, [0, 0, 0])
+    assert "已删除" not in result
+    assert analytics.count == 8
+
+
+def test_hour_of_week_splits_across_hours_and_days(analytics):
+    grid = analytics.hour_of_week()
+    assert grid[0][9] == 30 * MIN and grid[0][10] == 30 * MIN and grid[0][14] == 10 * MIN
+    assert grid[1][10] == 45 * MIN
+    assert grid[2][23] == 10 * MIN and grid[3][0] == 20 * MIN
+    assert grid[6][7] == 5 * MIN
+    assert sum(map(sum, grid)) == 150 * MIN
+
+
+def test_daily_fills_gaps_and_rolling_average(analytics):
+    daily = analytics.daily()
+    assert daily[0] == (date(2024, 3, 4), 70 * MIN)
+    assert daily[-1] == (date(2024, 3, 10), 5 * MIN)
+    assert [ms // MIN for _, ms in daily] == [70, 45, 30, 0, 0, 0, 5]
+    rolling = HistoryAnalytics.rolling(daily, window=2)
+    assert rolling[:3] == [70 * MIN, 57.5 * MIN, 37.5 * MIN]
+
+
+def test_long_tail_by_hand(analytics):
+    head, tail = analytics.long_tail(head_share=0.8)
+    # 总时长 205 分钟：写代码 140 未达到 80%（164），加上开会 60 后达到
+    assert head == [("写代码", 140 * MIN, 4), ("开会", 60 * MIN, 2)]
+    assert tail == [("跑步", 5 * MIN, 1), ("喝水", 0, 1)]
+    head, tail = analytics.long_tail(head_share=0.5)
+    assert [name for name, _, _ in head] == ["写代码"]
+
+
+def test_empty_history(table):
+    for view in list(table):
+        table.delete(view.row)
+    for use_numpy in (False, True):
+        result = analyse(table, use_numpy).run()
+        assert result["count"] == 0
+        assert result["percentiles"] == {} and result["daily"] == [] and result["rolling"] == []
+        assert result["long_tail"] == ([], [])
+        assert sum(map(sum, result["hour_of_week"])) == 0
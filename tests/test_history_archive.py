@@ -0,0 +1,155 @@
+import random
+
+import pytest
+
+from history_analytics import HistoryAnalytics
+from history_archive import HistoryArchive
+from history_records import format_wall, parse_wall
+from storage import JsonHistoryStore, WriteBehindWriter
+
+BASE = parse_wall("2024-01-01 00:00:00")
+
+
+def rec(i, rng):
+    start = BASE + rng.randrange(0, 90 * 86400)
+    ms = rng.randrange(60, 4 * 3600) * 1000
+    return {"event": f"事件{rng.randrange(12)}", "tags": rng.choice(["", "#工作", "#学习 #阅读"]),
+            "start_time": format_wall(start), "end_time": format_wall(start + ms // 1000),
+            "duration": "", "duration_seconds": ms // 1000, "duration_ms": ms}
+
+
+def archive_rows(archive):
+    return sorted((r.id, r.start, r.end, r.duration_ms, archive.name(r.name), archive.tags(r.tagset))
+                  for r in archive.scan())
+
+
+def table_rows(table):
+    return sorted((r.id, r.start_wall, table.end[r.row], r.duration_ms, r["event"], r["tags"]) for r in table)
+
+
+@pytest.fixture
+def env(tmp_path):
+    writer = WriteBehindWriter(window=0)
+    store = JsonHistoryStore(str(tmp_path / "h.json"), writer=writer)
+    store.load()
+    rng = random.Random(7)
+    store.replace_all([rec(i, rng) for i in range(300)])
+    archive = HistoryArchive(str(tmp_path / "h.archive"))
+    archive.MIN_CAPACITY = 16    # 让少量记录也会触发扩容和压实
+    archive.rebuild(store.records)
+    archive.follow(store, writer)
+    yield store, archive, writer, rng
+    store.close()
+    writer.run_task(archive.close)
+    writer.close()
+
+
+def edit(store, rng, n=400):
+    for _ in range(n):
+        live = list(store.records)
+        roll = rng.random()
+        if roll < 0.5 or not live:
+            store.append(rec(0, rng))
+        elif roll < 0.75:
+            r = rng.choice(live)
+            changes = {"tags": "#改过"} if rng.random() < 0.5 else {"start_time": rec(0, rng)["start_time"]}
+            store.update(r, changes)
+        else:
+            store.delete(rng.choice(live))
+
+
+def wrap(fn, probe, log):
+    """调用 fn，probe() 的值有变化时记一次"""
+    def call(*args):
+        before = probe()
+        fn(*args)
+        if probe() != before:
+            log.append(before)
+    return call
+
+
+def test_incremental_matches_rebuild(env, tmp_path):
+    store, archive, writer, rng = env
+    grown, compacted = [], []
+    archive._ensure_capacity = wrap(archive._ensure_capacity, lambda: len(archive.mm), grown)
+    archive.compact = wrap(archive.compact, lambda: archive.deleted, compacted)
+    edit(store, rng, 1000)
+    writer.flush()
+    assert grown and compacted
+    assert archive.mm is not None
+    assert archive_rows(archive) == table_rows(store.records)
+    assert archive.matches(store.records)
+    starts = [archive.starts[i] for i in range(len(archive.starts))]
+    assert starts == sorted(starts)
+
+    fresh = HistoryArchive(str(tmp_path / "fresh.archive"))
+    fresh.rebuild(store.records)
+    assert archive_rows(fresh) == archive_rows(archive)
+    fresh.close()
+
+
+def test_reset_rebuilds_and_reopen_keeps_contents(env, tmp_path):
+    store, archive, writer, rng = env
+    store.clear()
+    edit(store, rng, 50)
+    store.replace_all([rec(0, rng) for _ in range(40)])
+    writer.flush()
+    expected = table_rows(store.records)
+    assert archive_rows(archive) == expected
+
+    writer.run_task(archive.close)
+    writer.flush()
+    reopened = HistoryArchive(archive.path)
+    assert reopened.open() and reopened.matches(store.records)
+    assert archive_rows(reopened) == expected
+    reopened.close()
+
+
+def test_open_rejects_mismatched_string_table(env):
+    store, archive, writer, rng = env
+    writer.flush()
+    writer.run_task(archive.close)
+    writer.flush()
+    with open(archive.str_path, "r+", encoding="utf-8") as f:
+        f.write('["stamp", 1]\n')
+    assert not HistoryArchive(archive.path).open()
+
+
+@pytest.mark.parametrize("use_numpy", [False, True])
+def test_columns_match_table_analytics(env, use_numpy):
+    np = pytest.importorskip("numpy") if use_numpy else None
+    store, archive, writer, rng = env
+    edit(store, rng, 100)
+    writer.flush()
+    from_archive = HistoryAnalytics.from_columns(*archive.columns(np), np=np).run()
+    from_table = HistoryAnalytics(store.records.copy(), np=np, use_numpy=use_numpy).run()
+    for key in ("count", "hour_of_week", "daily", "long_tail"):
+        assert from_archive[key] == from_table[key]
+    assert from_archive["percentiles"].keys() == from_table["percentiles"].keys()
+    # 取列后归档仍可继续扩容
+    edit(store, rng, 100)
+    writer.flush()
+    assert archive.mm is not None and archive.matches(store.records)
+
+
+@pytest.mark.parametrize("changes", [{"tags": "#改过"}, {"event": "改名"}, {"end_time": "2024-06-01 00:00:00"}])
+def test_matches_detects_retag_and_rename(env, tmp_path, changes):
+    store, archive, writer, rng = env
+    writer.flush()
+    detached = HistoryArchive(str(tmp_path / "detached.archive"))
+    detached.rebuild(store.records)
+    assert detached.matches(store.records)
+    # 条数、最大 id 和时长总和都不变，只有名称、标签或结束时间不同
+    store.update(next(iter(store.records)), changes)
+    assert not detached.matches(store.records)
+    assert detached.sync(store.records) and detached.matches(store.records)
+    detached.close()
+
+
+def test_record_uses_store_field_names(env):
+    store, archive, writer, rng = env
+    writer.flush()
+    view = store.get(1)
+    i = archive._locate(1, view.start_wall)
+    expected = {k: view[k] for k in ("id", "event", "tags", "start_time", "end_time", "duration_ms")}
+    assert archive.record(i) == expected
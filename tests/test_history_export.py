@@ -0,0 +1,149 @@
+import csv
+import json
+import threading
+from datetime import date
+from itertools import product
+
+import pytest
+
+import history_export
+from history_export import export_history, ics_fold, iter_rows
+from history_records import ColumnTable
+from storage import record_matches
+
+
+def rec(event, start, end, tags="", ms=1800000):
+    return {"event": event, "tags": tags, "start_time": start, "end_time": end,
+            "duration": "0h30m", "duration_seconds": ms // 1000, "duration_ms": ms}
+
+
+RECORDS = [
+    rec("写代码", "2024-03-01 10:00:00", "2024-03-01 10:30:00", "#工作 #编程"),
+    rec("开会", "2024-03-02 23:30:00", "2024-03-03 00:30:00", "#工作", 3600000),
+    rec("跑步", "2024-03-05 07:00:00", "2024-03-05 07:40:00", "#运动", 2400000),
+    rec("读书", "不是时间", "不是时间", "#学习 #工作", 600000),
+    rec("发呆", "2024-03-03 00:00:00", "2024-03-03 00:10:00", "", 600000),
+]
+
+
+@pytest.fixture
+def table():
+    table = ColumnTable.from_records(RECORDS)
+    table.delete(table.row_of(5))
+    table.append(rec("散步", "2024-03-02 19:00:00", "2024-03-02 19:20:00", "#运动 #户外", 1200000))
+    return table
+
+
+# ---------- 折行 ----------
+def test_ics_fold_short_line_unchanged():
+    assert ics_fold("SUMMARY:开会") == "SUMMARY:开会\r\n"
+    line = "X" * 75
+    assert ics_fold(line) == line + "\r\n"
+
+
+@pytest.mark.parametrize("pad", range(70, 76))
+def test_ics_fold_never_splits_multibyte_characters(pad):
+    # 三字节的汉字从第 pad 个字节开始，覆盖正好落在 75 字节边界两侧的情况
+    line = "D" * pad + "写代码" * 40
+    folded = ics_fold(line)
+    assert folded.endswith("\r\n")
+    parts = folded[:-2].split("\r\n")
+    assert all(p.startswith(" ") for p in parts[1:])
+    assert all(len(p.encode("utf-8")) <= 75 for p in parts)
+    assert "".join(p[1:] if i else p for i, p in enumerate(parts)) == line
+    # 首行尽量填满：再放下一个字就会超过 75 字节
+    first = parts[0].encode("utf-8")
+    assert len(first) > 72
+
+
+# ---------- 筛选 ----------
+TAG_FILTERS = [None, {"工作"}, {"工作", "编程"}, {"运动", "学习"}, {"不存在"}, {"工作", "不存在"}]
+DAY_FILTERS = [None, (date(2024, 3, 1), date(2024, 3, 2)), (date(2024, 3, 3), date(2024, 3, 3)),
+               (date(2024, 4, 1), date(2024, 4, 30))]
+
+
+@pytest.mark.parametrize("tags,days,match_all", list(product(TAG_FILTERS, DAY_FILTERS, (False, True))))
+def test_iter_rows_matches_record_matches(table, tags, days, match_all):
+    expected = [view.id for view in table if record_matches(view.to_dict(), tags, days, match_all)]
+    assert [table.view(row).id for row in iter_rows(table, tags, days, match_all)] == expected
+
+
+def test_unparseable_start_is_kept_by_day_filter(table):
+    rows = iter_rows(table, days=(date(2030, 1, 1), date(2030, 1, 1)))
+    assert [table.view(row)["event"] for row in rows] == ["读书"]
+
+
+# ---------- 导出 ----------
+def test_export_csv(table, tmp_path):
+    path = str(tmp_path / "h.csv")
+    assert export_history(table, path, "csv", tags={"运动"}) == 2
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert [r["event"] for r in rows] == ["跑步", "散步"]
+    assert rows[1]["tags"] == "#运动 #户外"
+    assert rows[1]["duration_ms"] == "1200000"
+    assert not (tmp_path / "h.csv.part").exists()
+
+
+def test_export_jsonl(table, tmp_path):
+    path = str(tmp_path / "h.jsonl")
+    assert export_history(table, path, "jsonl") == 5
+    with open(path, encoding="utf-8") as f:
+        lines = [json.loads(line) for line in f]
+    assert lines == [view.to_dict() for view in table]
+
+
+def test_export_ics_skips_unparseable_start(table, tmp_path):
+    path = str(tmp_path / "h.ics")
+    assert export_history(table, path, "ics", tags={"工作"}) == 2
+    with open(path, encoding="utf-8", newline="") as f:
+        text = f.read()
+    assert text.startswith("BEGIN:VCALENDAR\r\n") and text.endswith("END:VCALENDAR\r\n")
+    assert "\n" not in text.replace("\r\n", "")
+    assert text.count("BEGIN:VEVENT") == 2
+    assert "DTSTART:20240302T233000\r\nDTEND:20240303T003000\r\n" in text
+    assert "CATEGORIES:工作,编程\r\n" in text
+    assert "读书" not in text
+
+
+def test_progress_and_cancel_are_checked_on_non_matching_rows(tmp_path):
+    table = ColumnTable.from_records([rec(f"事件{i}", "2024-03-01 10:00:00", "2024-03-01 10:30:00")
+                                      for i in range(100)])
+    cancel = threading.Event()
+    reports = []
+
+    def progress(scanned, total, written):
+        reports.append((scanned, total, written))
+        cancel.set()
+    path = str(tmp_path / "h.csv")
+    # 没有一行满足条件，也要按扫描行数汇报进度并响应取消
+    assert export_history(table, path, "csv", tags={"不存在"}, progress=progress,
+                          cancel=cancel, every=10) is None
+    assert reports == [(10, 100, 0)]
+    assert not (tmp_path / "h.csv").exists()
+    assert not (tmp_path / "h.csv.part").exists()
+
+
+def test_cancel_removes_part_file(table, tmp_path):
+    cancel = threading.Event()
+    cancel.set()
+    path = str(tmp_path / "h.jsonl")
+    assert export_history(table, path, "jsonl", cancel=cancel, every=1) is None
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_write_error_removes_part_file(table, tmp_path, monkeypatch):
+    class Broken(history_export.JsonlWriter):
+        def write(self, view):
+            raise OSError("磁盘已满")
+    monkeypatch.setitem(history_export.WRITERS, "jsonl", Broken)
+    with pytest.raises(OSError):
+        export_history(table, str(tmp_path / "h.jsonl"), "jsonl")
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_final_progress_reports_totals(table, tmp_path):
+    reports = []
+    export_history(table, str(tmp_path / "h.csv"), "csv", progress=lambda *a: reports.append(a))
+    # 行数包括已删除记录留下的空行
+    assert reports[-1] == (6, 6, 5)
@@ -0,0 +1,159 @@
+from datetime import date
+
+import pytest
+
+from history_index import TagIndex, format_day_range, iter_bits, parse_day_range
+from storage import JsonHistoryStore, record_matches
+
+
+def rec(event, start, tags=""):
+    return {"event": event, "tags": tags, "start_time": start, "end_time": start,
+            "duration": "0h00m", "duration_seconds": 0, "duration_ms": 0}
+
+
+RECORDS = [
+    rec("写代码", "2024-03-01 10:00:00", "#工作 #编程"),
+    rec("开会", "2024-03-02 09:00:00", "#工作"),
+    rec("跑步", "2024-03-05 07:00:00", "#运动"),
+    rec("读书", "不是时间", "#学习"),
+    rec("发呆", "2024-03-02 23:59:59"),
+]
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = JsonHistoryStore(str(tmp_path / "h.json"))
+    store.load()
+    store.replace_all(RECORDS)
+    yield store
+    store.close()
+
+
+def ids(records):
+    return sorted(r.id for r in records)
+
+
+def expected(store, tags=None, days=None, match_all=False):
+    return ids(r for r in store.records if record_matches(r.to_dict(), tags, days, match_all))
+
+
+# ---------- 标签位图 ----------
+def assert_tag_index_consistent(store):
+    """增量维护的位图与从头重建的一致，且每一位都对应带该标签的存活行"""
+    rebuilt = TagIndex(store.records).postings
+    assert store.tag_index.postings == rebuilt
+    for tag, bits in rebuilt.items():
+        assert bits
+        for row in iter_bits(bits):
+            assert store.records.live[row] and tag in store.records.tags_of(row)
+
+
+def test_tag_postings_follow_add_delete_retag(store):
+    assert_tag_index_consistent(store)
+    added = store.append(rec("散步", "2024-03-06 19:00:00", "#运动 #户外"))
+    assert store.tag_index.postings["户外"] == 1 << added.row
+    assert_tag_index_consistent(store)
+
+    store.update(store.get(1), {"tags": "#编程 #周末"})      # 去掉 工作，保留 编程，新增 周末
+    assert_tag_index_consistent(store)
+    assert ids(store.query({"工作"})) == [2]
+    assert ids(store.query({"周末"})) == [1]
+
+    store.delete(store.get(4))
+    assert "学习" not in store.tag_index.postings
+    store.update(added, {"tags": ""})
+    assert "户外" not in store.tag_index.postings
+    assert_tag_index_consistent(store)
+
+
+@pytest.mark.parametrize("tags", [{"工作"}, {"工作", "编程"}, {"运动", "学习"}, {"不存在"}, {"工作", "不存在"}])
+@pytest.mark.parametrize("match_all", [False, True])
+def test_tag_match_agrees_with_record_matches(store, tags, match_all):
+    store.update(store.get(3), {"tags": "#运动 #工作"})
+    store.delete(store.get(2))
+    assert ids(store.query(tags, match_all=match_all)) == expected(store, tags, match_all=match_all)
+    days = (date(2024, 3, 1), date(2024, 3, 2))
+    assert ids(store.query(tags, days, match_all)) == expected(store, tags, days, match_all)
+
+
+def test_match_all_of_nothing_is_empty(store):
+    assert store.tag_index.match({"工作", "不存在"}, match_all=True) == 0
+    assert store.tag_index.records(0) == []
+
+
+# ---------- 按日分桶 ----------
+def bucket_ids(store):
+    index = store.day_index
+    view = store.records.view
+    return ({d: sorted(view(row).id for row in index.buckets[d]) for d in index.days},
+            sorted(view(row).id for row in index.undated))
+
+
+def test_day_buckets_and_undated_records(store):
+    buckets, undated = bucket_ids(store)
+    assert buckets == {date(2024, 3, 1): [1], date(2024, 3, 2): [2, 5], date(2024, 3, 5): [3]}
+    assert undated == [4]
+    assert store.day_index.days == sorted(buckets)
+    assert store.day_counts(date(2024, 3, 1), date(2024, 3, 3)) == {date(2024, 3, 1): 1, date(2024, 3, 2): 2}
+
+
+def test_day_buckets_follow_changes(store):
+    store.update(store.get(3), {"start_time": "2024-03-03 08:00:00"})    # 换到新的一天，旧桶清空
+    store.update(store.get(4), {"start_time": "2024-03-01 12:00:00"})    # 无法解析 -> 有日期
+    store.update(store.get(1), {"start_time": "又坏了"})                  # 有日期 -> 无法解析
+    store.update(store.get(2), {"event": "例会"})                         # 日期不变
+    store.delete(store.get(5))
+    store.append(rec("散步", "2024-02-29 19:00:00"))
+    buckets, undated = bucket_ids(store)
+    assert buckets == {date(2024, 2, 29): [6], date(2024, 3, 1): [4], date(2024, 3, 2): [2],
+                       date(2024, 3, 3): [3]}
+    assert undated == [1]
+    assert store.day_index.days == sorted(buckets)
+
+
+@pytest.mark.parametrize("days", [
+    (date(2024, 3, 2), date(2024, 3, 2)),
+    (date(2024, 3, 1), date(2024, 3, 5)),
+    (date(2024, 3, 3), date(2024, 3, 4)),
+    (date(2023, 1, 1), date(2023, 12, 31)),
+])
+def test_day_range_agrees_with_record_matches(store, days):
+    # 开始时间无法解析的记录不受日期筛选限制
+    assert 4 in ids(store.query(days=days))
+    assert ids(store.query(days=days)) == expected(store, days=days)
+
+
+# ---------- 日期筛选文本 ----------
+TODAY = date(2024, 3, 10)    # 星期日
+
+
+@pytest.mark.parametrize("text,result", [
+    ("", None),
+    ("   ", None),
+    ("2024-03-01", (date(2024, 3, 1), date(2024, 3, 1))),
+    (" 2024-03-01 ", (date(2024, 3, 1), date(2024, 3, 1))),
+    ("2024-03-01~2024-03-07", (date(2024, 3, 1), date(2024, 3, 7))),
+    ("2024-03-01 至 2024-03-07", (date(2024, 3, 1), date(2024, 3, 7))),
+    ("2024-03-07~2024-03-01", (date(2024, 3, 1), date(2024, 3, 7))),    # 起止颠倒时自动交换
+    ("本周", (date(2024, 3, 4), date(2024, 3, 10))),
+    ("本月", (date(2024, 3, 1), date(2024, 3, 31))),
+    ("2024-02-30", None),
+    ("2024-03-01~", None),
+    ("2024-03-01~2024-03-02~2024-03-03", None),
+    ("昨天", None),
+])
+def test_parse_day_range(text, result):
+    assert parse_day_range(text, TODAY) == result
+
+
+def test_month_and_week_ranges_at_boundaries():
+    assert parse_day_range("本月", date(2024, 2, 29)) == (date(2024, 2, 1), date(2024, 2, 29))
+    assert parse_day_range("本月", date(2023, 12, 31)) == (date(2023, 12, 1), date(2023, 12, 31))
+    assert parse_day_range("本周", date(2024, 3, 4)) == (date(2024, 3, 4), date(2024, 3, 10))
+    assert parse_day_range("本周", date(2024, 1, 1)) == (date(2024, 1, 1), date(2024, 1, 7))
+    assert parse_day_range("本周", date(2023, 12, 31)) == (date(2023, 12, 25), date(2023, 12, 31))
+
+
+def test_format_day_range_round_trips():
+    for days in [(date(2024, 3, 1), date(2024, 3, 1)), (date(2024, 3, 1), date(2024, 3, 7))]:
+        assert parse_day_range(format_day_range(days)) == days
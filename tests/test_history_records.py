@@ -0,0 +1,115 @@
+from history_records import NO_TIME, ColumnTable, parse_wall
+
+
+def rec(event="写代码", start="2024-03-01 10:00:00", end="2024-03-01 10:30:00", tags="#工作", **kw):
+    r = {"event": event, "tags": tags, "start_time": start, "end_time": end,
+         "duration": "0h30m", "duration_seconds": 1800, "duration_ms": 1800000}
+    r.update(kw)
+    return r
+
+
+def without_id(view):
+    d = view.to_dict()
+    d.pop("id")
+    return d
+
+
+# ---------- 编码与还原 ----------
+def test_round_trip_standard_record():
+    table = ColumnTable()
+    view = table.append(rec())
+    assert without_id(view) == rec()
+    assert view.start_wall == parse_wall("2024-03-01 10:00:00")
+    assert view.duration_ms == 1800000
+    assert table.tags_of(view.row) == ["工作"]
+
+
+def test_round_trip_irregular_fields():
+    odd = [
+        rec(start="昨天", end=None),
+        rec(duration="大约半小时"),
+        rec(duration_seconds=1799),
+        rec(duration_ms="1800000"),
+        rec(event=42, tags=["工作"]),
+        rec(note="补记", color="red"),
+    ]
+    table = ColumnTable.from_records(odd)
+    assert [without_id(v) for v in table] == odd
+    assert table.start[0] == NO_TIME
+    assert len(table.extras) == len(odd)
+
+
+def test_legacy_durations_derive_milliseconds():
+    table = ColumnTable.from_records([
+        {"event": "只有秒数", "start_time": "2020-01-01 08:00:00", "end_time": "2020-01-01 09:00:00",
+         "duration": "1h00m", "duration_seconds": 3600},
+        {"event": "只有文本", "start_time": "2020-01-01 08:00:00", "end_time": "2020-01-01 09:00:00",
+         "duration": "0h45m"},
+        {"event": "只有时间", "start_time": "2020-01-01 08:00:00", "end_time": "2020-01-01 08:20:00"},
+    ])
+    assert list(table.duration_ms) == [3600000, 2700000, 1200000]
+    assert [v["duration_seconds"] for v in table] == [3600, 2700, 1200]
+    assert table.extras == {}
+
+
+def test_update_and_delete_keep_other_rows():
+    table = ColumnTable.from_records([rec(event=f"事件{i}") for i in range(5)])
+    first = table.view(0)
+    table.update(first.row, {"tags": "#学习", "duration": "1h00m"})
+    assert first["tags"] == "#学习"
+    assert first.duration_ms == 3600000
+    table.delete(2)
+    assert len(table) == 4
+    assert [v["event"] for v in table] == ["事件0", "事件1", "事件3", "事件4"]
+
+
+# ---------- 记录 id ----------
+def test_missing_ids_are_assigned_in_order():
+    table = ColumnTable.from_records([rec(event=f"事件{i}") for i in range(3)])
+    assert list(table.ids) == [1, 2, 3]
+    assert table.assigned_ids
+    assert table.next_id == 4
+    assert table.get(2)["event"] == "事件1"
+
+
+def test_existing_ids_are_kept():
+    table = ColumnTable.from_records([rec(id=5), rec(id=9)])
+    assert list(table.ids) == [5, 9]
+    assert not table.assigned_ids
+    assert table.append(rec()).id == 10
+
+
+def test_conflicting_id_gets_a_new_one():
+    table = ColumnTable.from_records([rec(id=5), rec(id=5), rec(id=3), rec(id="7")])
+    assert list(table.ids) == [5, 6, 7, 8]
+    assert table.assigned_ids
+
+
+def test_keep_id_allows_older_ids():
+    table = ColumnTable.from_records([rec(id=10), rec(id=11)])
+    view = table.append(rec(event="旧分片", id=4), keep_id=True)
+    assert view.id == 4
+    assert table.get(4)["event"] == "旧分片"
+    assert table.row_of(11) == 1
+    assert table.append(rec()).id == 12
+
+
+def test_deleted_ids_are_not_found_or_reused():
+    table = ColumnTable.from_records([rec(id=1), rec(id=2)])
+    table.delete(table.row_of(2))
+    assert table.get(2) is None
+    assert table.append(rec()).id == 3
+
+
+def test_copy_is_independent():
+    table = ColumnTable.from_records([rec(id=1), rec(id=2)])
+    snapshot = table.copy()
+    table.update(0, {"event": "改过"})
+    table.delete(1)
+    table.append(rec())
+    assert [v["event"] for v in snapshot] == ["写代码", "写代码"]
+    assert snapshot.get(2) is not None and snapshot.get(3) is None
+
+    detached = table.copy(detach=True)
+    detached.append(rec(event="只在副本里"))
+    assert "只在副本里" not in table.names
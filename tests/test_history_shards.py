@@ -0,0 +1,181 @@
+import json
+import lzma
+import os
+import threading
+from datetime import date
+
+import pytest
+
+from history_shards import ShardedHistoryStore
+
+TODAY = date(2024, 3, 15)
+MONTHS = ["2023-10", "2023-11", "2023-12", "2024-01", "2024-02", "2024-03"]
+
+
+def rec(event, month, day=1, tags="#工作"):
+    start = f"{month}-{day:02d} 09:00:00"
+    return {"event": event, "tags": tags, "start_time": start, "end_time": f"{month}-{day:02d} 10:00:00",
+            "duration": "1h00m", "duration_seconds": 3600, "duration_ms": 3600000}
+
+
+RECORDS = [rec(f"{month} 第{d}天", month, d) for month in MONTHS for d in (1, 10, 20)] + [
+    {"event": "没有时间", "tags": "", "start_time": "?", "end_time": "?",
+     "duration": "0h10m", "duration_seconds": 600, "duration_ms": 600000}]
+
+
+def contents(records):
+    return sorted((r.id, r["event"], r["tags"], r["start_time"]) for r in records)
+
+
+def open_store(path, **kw):
+    store = ShardedHistoryStore(str(path), today=TODAY, **kw)
+    store.load()
+    return store
+
+
+def make_store(path):
+    store = open_store(path)
+    store.replace_all(RECORDS)
+    expected = contents(store.records)
+    store.close()
+    return expected
+
+
+def test_round_trip_keeps_cold_months_on_disk(tmp_path):
+    expected = make_store(tmp_path)
+    files = os.listdir(tmp_path)
+    assert sum(name.endswith(".json.xz") for name in files) == 4
+
+    store = open_store(tmp_path)
+    # 启动只加载本月、上月和无日期的分片
+    assert len(store.records) == 7
+    assert store.unloaded() == 12
+    assert contents(store.snapshot()()) == expected
+    # 快照读过的冷分片不常驻
+    assert len(store.records) == 7
+    store.close()
+
+
+def fetch(store, first, last):
+    """按界面的做法加载日期范围：后台线程读取分片，调用线程并入"""
+    load = store.read_range(first, last)
+    if load is None:
+        return
+    result = []
+    worker = threading.Thread(target=lambda: result.append(load()))
+    worker.start()
+    worker.join()
+    store.merge_range(result[0])
+
+
+def test_date_query_loads_only_overlapping_months(tmp_path):
+    make_store(tmp_path)
+    store = open_store(tmp_path)
+    days = (date(2023, 12, 5), date(2023, 12, 31))
+    # 查询本身不解压冷分片，只覆盖已加载的月份
+    assert [r["event"] for r in store.query(days=days)] == ["没有时间"]
+    assert store.day_counts(*days) == {}
+    assert store.unloaded() == 12
+    fetch(store, *days)
+    assert store.read_range(*days) is None
+    hits = store.query(days=days)
+    assert sorted(r["event"] for r in hits) == ["2023-12 第10天", "2023-12 第20天", "没有时间"]
+    assert store.unloaded() == 9
+    assert store.day_counts(*days) == {date(2023, 12, 10): 1, date(2023, 12, 20): 1}
+    snapshot = store.snapshot(days=(date(2023, 11, 1), date(2023, 11, 30)))()
+    assert sum(r["start_time"].startswith("2023-11") for r in snapshot) == 3
+    store.close()
+
+
+def edit(store):
+    fetch(store, date(2023, 10, 1), date(2023, 10, 31))
+    cold = store.query(days=(date(2023, 10, 1), date(2023, 10, 31)))
+    store.update(next(r for r in cold if r["start_time"]), {"tags": "#复盘"})
+    store.delete(store.records.view(0))
+    store.append(rec("新的一天", "2024-03", 14))
+    store.append(rec("补记", "2023-11", 30))
+    return contents(store.snapshot()())
+
+
+def test_replay_matches_compaction(tmp_path):
+    for name in ("a", "b"):
+        make_store(tmp_path / name)
+    store = open_store(tmp_path / "a", compact_threshold=1000)
+    expected = edit(store)
+    store.close()
+    store = open_store(tmp_path / "b", compact_threshold=1)
+    assert edit(store) == expected
+    store.close()
+
+    for name in ("a", "b"):
+        store = open_store(tmp_path / name)
+        assert contents(store.snapshot()()) == expected
+        store.close()
+
+
+def test_duplicate_ids_across_shards_are_reassigned(tmp_path):
+    make_store(tmp_path)
+    with open(tmp_path / "manifest.json", encoding="utf-8") as f:
+        shards = json.load(f)["shards"]
+    hot_id = next(r["id"] for r in open_store(tmp_path).records if r["start_time"].startswith("2024-03"))
+    # 手工修改冷分片，让其中一条记录与热分片中的记录同 id
+    path = tmp_path / shards["2023-10"]["file"]
+    data = json.loads(lzma.decompress(path.read_bytes()))
+    data["records"][0]["id"] = hot_id
+    path.write_bytes(lzma.compress(json.dumps(data, ensure_ascii=False).encode("utf-8")))
+
+    store = open_store(tmp_path)
+    ids = [r.id for r in store.snapshot()()]
+    assert len(ids) == len(RECORDS) == len(set(ids))
+    store.load_range(date(2023, 10, 1), date(2023, 10, 31))
+    moved = next(r for r in store.records if r["event"] == "2023-10 第1天")
+    assert moved.id != hot_id
+    store.close()
+
+    # 新 id 已写回分片，再次打开后不变
+    store = open_store(tmp_path)
+    ids = [r.id for r in store.snapshot()()]
+    assert len(set(ids)) == len(RECORDS)
+    store.load_range(date(2023, 10, 1), date(2023, 10, 31))
+    assert next(r for r in store.records if r["event"] == "2023-10 第1天").id == moved.id
+    store.close()
+
+
+def test_merge_skips_months_loaded_or_cleared_meanwhile(tmp_path):
+    make_store(tmp_path)
+    store = open_store(tmp_path)
+    load = store.read_range(date(2023, 10, 1), date(2023, 11, 30))
+    loaded = load()
+    store.load_range(date(2023, 10, 1), date(2023, 10, 31))
+    store.merge_range(loaded)
+    events = [r["event"] for r in store.records]
+    assert len(events) == len(set(events)) == 13
+
+    load = store.read_range(date(2023, 12, 1), date(2023, 12, 31))
+    loaded = load()
+    store.clear()
+    store.merge_range(loaded)
+    assert len(store.records) == 0
+    store.close()
+
+
+def test_failed_compaction_months_are_retried(tmp_path, monkeypatch):
+    make_store(tmp_path)
+    store = open_store(tmp_path, compact_threshold=1000)
+    store.append(rec("失败后重试", "2024-03", 14))
+
+    def broken(*args):
+        raise OSError("磁盘已满")
+    monkeypatch.setattr(store, "_write_shards", broken)
+    with pytest.raises(OSError):
+        store.compact(wait=True)
+    # 写入线程只把失败的月份交还，不直接改 dirty
+    assert store.dirty == set() and store._retry_months == {"2024-03"}
+    monkeypatch.undo()
+    store.compact(wait=True)
+    assert store._retry_months == set()
+    store.close()
+
+    store = open_store(tmp_path)
+    assert "失败后重试" in [r["event"] for r in store.records]
+    store.close()
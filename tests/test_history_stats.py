@@ -0,0 +1,158 @@
+import json
+import random
+from datetime import timedelta
+
+import pytest
+
+from history_records import format_wall, parse_wall
+from history_stats import StatsRollup, history_stamp
+from storage import JsonHistoryStore, SqliteHistoryStore, WriteBehindWriter
+
+BASE = parse_wall("2024-01-01 00:00:00")
+
+
+def rec(rng):
+    start = BASE + rng.randrange(0, 60 * 86400)
+    ms = rng.randrange(1, 3 * 3600) * 1000 + rng.randrange(1000)
+    start_time = format_wall(start) if rng.random() > 0.05 else "无法解析"
+    return {"event": f"事件{rng.randrange(8)}", "tags": rng.choice(["", "#工作", "#工作 #会议", "#学习"]),
+            "start_time": start_time, "end_time": format_wall(start + ms // 1000),
+            "duration": "", "duration_seconds": ms // 1000, "duration_ms": ms}
+
+
+def edit(store, rng, n):
+    for _ in range(n):
+        live = list(store.records)
+        roll = rng.random()
+        if roll < 0.5 or not live:
+            store.append(rec(rng))
+        elif roll < 0.8:
+            new = rec(rng)
+            store.update(rng.choice(live), {k: new[k] for k in rng.sample(["event", "tags", "start_time", "duration_ms"], 2)})
+        else:
+            store.delete(rng.choice(live))
+
+
+def rebuilt(store):
+    stats = StatsRollup()
+    stats.rebuild(store.records)
+    return stats
+
+
+def same(a, b):
+    return a.days == b.days and a.weeks == b.weeks and a.months == b.months
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "json":
+        store = JsonHistoryStore(str(tmp_path / "h.json"))
+    else:
+        store = SqliteHistoryStore(str(tmp_path / "h.db"))
+    store.load()
+    store.replace_all([rec(random.Random(1)) for _ in range(200)])
+    yield store
+    store.close()
+
+
+def test_incremental_matches_rebuild(store, tmp_path):
+    stats = StatsRollup(str(tmp_path / "stats.json"))
+    stats.load(store)
+    stats.follow(store)
+    edit(store, random.Random(2), 500)
+    assert same(stats, rebuilt(store))
+    # 增量推算的标记与遍历全部记录得到的一致
+    assert stats.stamp == history_stamp(store)
+    store.clear()
+    assert stats.days == {} and stats.stamp == history_stamp(store)
+
+
+def test_saved_rollup_is_reused_until_history_changes(store, tmp_path):
+    path = str(tmp_path / "stats.json")
+    stats = StatsRollup(path)
+    assert stats.load(store)
+    stats.follow(store)
+    edit(store, random.Random(3), 50)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(stats.to_json(), f)
+
+    loaded = StatsRollup(path)
+    assert not loaded.load(store)
+    assert same(loaded, rebuilt(store))
+
+    # 保存之后历史又变了（例如没有正常退出）：标记不一致，重建
+    store.append(rec(random.Random(4)))
+    stale = StatsRollup(path)
+    assert stale.load(store)
+    assert same(stale, rebuilt(store))
+
+
+def test_summary_and_totals(store):
+    stats = rebuilt(store)
+    total, tags, events = stats.summary()
+    dated = [r for r in store.records if r.day is not None]
+    assert total == [sum(r.duration_ms for r in dated), len(dated)]
+    assert sum(n for _, n in events.values()) == len(dated)
+    monday = dated[0].day - timedelta(days=dated[0].day.weekday())
+    week = [r.duration_ms for r in dated if monday <= r.day <= monday + timedelta(days=6)]
+    assert stats.week_total(monday + timedelta(days=3)) == sum(week)
+    assert sum(ms for _, ms in stats.daily(monday, monday + timedelta(days=6))) == sum(week)
+
+
+def test_reset_rebuilds_on_writer_thread(store):
+    writer = WriteBehindWriter(window=60)    # 只有 flush() 才执行排队的重建
+    try:
+        stats = rebuilt(store)
+        stats.stamp = history_stamp(store)
+        stats.follow(store, writer.lock, writer)
+        rng = random.Random(5)
+        store.replace_all([rec(rng) for _ in range(100)])
+        # 调用线程只清空并排队，重建期间的汇总不会以当前标记写出
+        assert stats.days == {} and stats.stamp is None
+        edit(store, rng, 100)
+        assert stats.days == {} and len(stats.pending) == 100
+        writer.flush()
+        assert stats.pending is None
+        assert same(stats, rebuilt(store))
+        assert stats.stamp == history_stamp(store)
+        edit(store, rng, 20)
+        assert same(stats, rebuilt(store))
+    finally:
+        writer.close()
+
+
+def test_newer_reset_supersedes_queued_rebuild(store):
+    writer = WriteBehindWriter(window=60)
+    try:
+        stats = StatsRollup()
+        stats.follow(store, writer.lock, writer)
+        rng = random.Random(6)
+        store.replace_all([rec(rng) for _ in range(50)])
+        edit(store, rng, 30)
+        store.clear()
+        edit(store, rng, 30)
+        writer.flush()
+        assert same(stats, rebuilt(store))
+        assert stats.stamp == history_stamp(store)
+    finally:
+        writer.close()
+
+
+@pytest.mark.parametrize("content", ["{不是 JSON", "[1, 2, 3]", '{"version": 1, "stamp": null}'])
+def test_corrupt_saved_rollup_is_rebuilt(store, tmp_path, content):
+    path = tmp_path / "stats.json"
+    path.write_text(content, encoding="utf-8")
+    stats = StatsRollup(str(path))
+    assert stats.load(store)
+    assert same(stats, rebuilt(store))
+
+
+def test_unreadable_saved_rollup_is_logged(store, tmp_path, capsys):
+    path = tmp_path / "stats.json"
+    stats = StatsRollup(str(path))
+    stats.load(store)
+    data = stats.to_json()
+    del data["days"]
+    path.write_text(json.dumps(data), encoding="utf-8")
+    assert StatsRollup(str(path)).load(store)
+    assert "KeyError" in capsys.readouterr().err
@@ -0,0 +1,132 @@
+import random
+
+import pytest
+
+from history_view import (clamp_offset, offset_at_fraction, offset_showing, render_window, scrollbar_span,
+                          visible_rows, window_after_insert, window_after_remove, window_changes)
+
+VISIBLE, OVERSCAN = 10, 5
+
+
+def test_visible_rows():
+    assert visible_rows(220, 20, 20) == 10
+    assert visible_rows(229, 20, 20) == 10     # 不完整的一行不算
+    assert visible_rows(10, 20, 20) == 1       # 控件尚未显示时至少 1 行
+    assert visible_rows(100, 0, 0) == 100
+
+
+@pytest.mark.parametrize("offset,total,expected", [
+    (0, 100, (0, (0, 15))),
+    (-5, 100, (0, (0, 15))),
+    (40, 100, (40, (40, 55))),
+    (88, 100, (88, (88, 100))),    # 预渲染行在末尾被截断
+    (95, 100, (90, (90, 100))),    # 滚到底时最后一行贴着视口底部
+    (500, 100, (90, (90, 100))),
+    (3, 6, (0, (0, 6))),           # 不足一屏
+    (0, 0, (0, (0, 0))),
+])
+def test_render_window_clamps(offset, total, expected):
+    assert render_window(offset, total, VISIBLE, OVERSCAN) == expected
+    assert clamp_offset(offset, total, VISIBLE) == expected[0]
+
+
+def apply_changes(shown, old, new):
+    """按 window_changes 的结果改动模拟的控件行列表（行号代替记录）"""
+    changes = window_changes(old, new)
+    if changes is None:
+        return list(range(*new)), True
+    removed, above, below = changes
+    shown = [i for i in shown if i not in set(removed)]
+    for i in above:
+        shown.insert(0, i)
+    shown.extend(below)
+    return shown, False
+
+
+def test_window_changes_only_touch_the_edges():
+    removed, above, below = window_changes((10, 25), (13, 28))
+    assert removed == [10, 11, 12] and list(above) == [] and list(below) == [25, 26, 27]
+    removed, above, below = window_changes((10, 25), (8, 23))
+    assert removed == [23, 24] and list(above) == [9, 8] and list(below) == []
+    assert window_changes((10, 25), (10, 25)) == ([], range(9, 9), range(25, 25))
+    # 不重叠或原来为空时整体重绘
+    assert window_changes((10, 25), (25, 40)) is None
+    assert window_changes((0, 0), (0, 15)) is None
+
+
+def test_random_scrolling_keeps_rendered_rows_contiguous():
+    rng = random.Random(3)
+    total = 500
+    offset, window = render_window(0, total, VISIBLE, OVERSCAN)
+    shown = list(range(*window))
+    for _ in range(2000):
+        offset, new = render_window(offset + rng.choice([-1, 1, -3, 3, -10, 10, -200, 200]), total,
+                                    VISIBLE, OVERSCAN)
+        shown, _ = apply_changes(shown, window, new)
+        window = new
+        assert shown == list(range(*window))
+        assert window[0] == offset and window[1] - window[0] <= VISIBLE + OVERSCAN
+
+
+def test_scrollbar_span_and_drag():
+    assert scrollbar_span(0, 5, VISIBLE) == (0, 1)
+    assert scrollbar_span(0, 100, VISIBLE) == (0, 0.1)
+    assert scrollbar_span(90, 100, VISIBLE) == (0.9, 1.0)
+    assert offset_at_fraction("0.5", 100) == 50
+    assert offset_at_fraction(1.0, 100) == 100
+    # 拖到底后由 render_window 夹紧
+    assert render_window(offset_at_fraction(1.0, 100), 100, VISIBLE, OVERSCAN)[0] == 90
+
+
+def test_offset_showing_scrolls_minimally():
+    assert offset_showing(20, 25, VISIBLE) == 20
+    assert offset_showing(20, 19, VISIBLE) == 19
+    assert offset_showing(20, 30, VISIBLE) == 21
+    assert offset_showing(20, 0, VISIBLE) == 0
+
+
+# ---------- 单条增删 ----------
+def test_insert_above_viewport_keeps_content_still():
+    assert window_after_insert((20, 35), 5, VISIBLE + OVERSCAN) == (1, (21, 36), False)
+    # 插在视口第一行的位置：视口不在顶部时算作上方
+    assert window_after_insert((20, 35), 20, VISIBLE + OVERSCAN) == (1, (21, 36), False)
+    assert window_after_insert((0, 15), 0, VISIBLE + OVERSCAN) == (0, (0, 16), True)
+
+
+def test_insert_inside_or_below_window():
+    assert window_after_insert((20, 35), 30, VISIBLE + OVERSCAN) == (0, (20, 36), True)
+    assert window_after_insert((20, 35), 35, VISIBLE + OVERSCAN) == (0, (20, 35), False)
+    # 区间还没填满时插在末尾也要显示，但不能越过区间末尾插入
+    assert window_after_insert((0, 3), 3, VISIBLE + OVERSCAN) == (0, (0, 4), True)
+    assert window_after_insert((20, 30), 32, VISIBLE + OVERSCAN) == (0, (20, 30), False)
+
+
+def test_remove_shifts_or_shrinks_window():
+    assert window_after_remove((20, 35), 5) == (-1, (19, 34), False)
+    assert window_after_remove((20, 35), 20) == (0, (20, 34), True)
+    assert window_after_remove((20, 35), 40) == (0, (20, 35), False)
+
+
+def test_random_edits_keep_window_consistent():
+    rng = random.Random(4)
+    rows = list(range(200))
+    offset, window = render_window(50, len(rows), VISIBLE, OVERSCAN)
+    shown = rows[window[0]:window[1]]
+    next_value = 1000
+    for _ in range(2000):
+        if rng.random() < 0.5 or len(rows) < 2:
+            i = rng.randrange(len(rows) + 1)
+            rows.insert(i, next_value)
+            shift, window, visible = window_after_insert(window, i, VISIBLE + OVERSCAN)
+            if visible:
+                shown.insert(i - (window[0] - shift), next_value)
+            next_value += 1
+        else:
+            i = rng.randrange(len(rows))
+            value = rows.pop(i)
+            shift, window, visible = window_after_remove(window, i)
+            if visible:
+                shown.remove(value)
+        offset += shift
+        assert shown == rows[window[0]:window[1]]
+        assert window[0] == offset
@@ -0,0 +1,18 @@
+import pytest
+
+pytest.importorskip("tkinter")
+
+from check_import_time import BUDGET_MS, best_profile, deferred_imported
+
+
+@pytest.fixture(scope="module")
+def profile():
+    return best_profile("event_timer", runs=5)
+
+
+def test_optional_modules_not_imported_at_startup(profile):
+    assert deferred_imported(profile) == []
+
+
+def test_startup_import_budget(profile):
+    assert profile["event_timer"][1] / 1000 <= BUDGET_MS
@@ -0,0 +1,194 @@
+from tkinter import TclError
+
+import pytest
+
+from scheduling import DeadlineScheduler, TickScheduler
+
+
+class FakeAfter:
+    """模拟 Tk 的 after/after_cancel：记录待执行的回调，由测试推进时间"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.jobs = {}          # 作业 id -> (到期时间, 回调)
+        self.delays = []        # 每次 after() 请求的毫秒数
+        self._next = 0
+
+    def clock(self):
+        return self.now
+
+    def after(self, ms, fn):
+        self._next += 1
+        self.jobs[self._next] = (self.now + ms / 1000, fn)
+        self.delays.append(ms)
+        return self._next
+
+    def after_cancel(self, job):
+        if self.jobs.pop(job, None) is None:
+            raise TclError(f"no such job {job}")
+
+    def advance(self, seconds):
+        """把时间推进 seconds 秒，按到期顺序执行到期的回调"""
+        end = self.now + seconds
+        while True:
+            due = [(t, job) for job, (t, _) in self.jobs.items() if t <= end]
+            if not due:
+                break
+            t, job = min(due)
+            self.now = max(self.now, t)
+            self.jobs.pop(job)[1]()
+        self.now = end
+
+
+# ---------- 界面刷新节拍 ----------
+@pytest.fixture
+def tk():
+    return FakeAfter()
+
+
+def test_kicks_in_one_event_round_coalesce(tk):
+    ticker = TickScheduler(tk.after, tk.after_cancel)
+    calls = []
+    ticker.add("a", lambda: calls.append("a"))
+    ticker.add("b", lambda: calls.append("b"))
+    ticker.kick()
+    assert len(tk.jobs) == 1
+    tk.advance(0)
+    assert calls == ["a", "b"]
+
+
+def test_next_tick_uses_smallest_requested_delay(tk):
+    ticker = TickScheduler(tk.after, tk.after_cancel)
+    ticker.add("slow", lambda: 30)
+    ticker.add("fast", lambda: 5)
+    ticker.add("idle", lambda: None)
+    tk.advance(0)
+    assert len(tk.jobs) == 1
+    assert tk.delays[-1] == int((5 + TickScheduler.EPSILON) * 1000)
+
+
+def test_delay_is_clamped(tk):
+    ticker = TickScheduler(tk.after, tk.after_cancel, max_interval=20)
+    ticker.add("idle", lambda: None)
+    tk.advance(0)
+    assert tk.delays[-1] == int((20 + TickScheduler.EPSILON) * 1000)
+    ticker.add("busy", lambda: 0)
+    tk.advance(0)
+    assert tk.delays[-1] == int(TickScheduler.MIN_DELAY * 1000)
+
+
+def test_failing_subscriber_is_logged_and_others_still_run(tk, capsys):
+    ticker = TickScheduler(tk.after, tk.after_cancel)
+    calls = []
+    ticker.add("broken", lambda: 1 / 0)
+    ticker.add("ok", lambda: calls.append(1) or 10)
+    tk.advance(0)
+    tk.advance(11)
+    assert calls == [1, 1]
+    assert capsys.readouterr().err.count("ZeroDivisionError") == 2
+    assert len(tk.jobs) == 1
+
+
+def test_no_subscribers_no_wakeups(tk):
+    ticker = TickScheduler(tk.after, tk.after_cancel)
+    ticker.add("a", lambda: 1)
+    ticker.remove("a")
+    tk.advance(0)
+    assert tk.jobs == {}
+    ticker.add("a", lambda: 1)
+    ticker.stop()
+    assert tk.jobs == {}
+
+
+def test_cancel_of_already_run_job_is_ignored(tk):
+    ticker = TickScheduler(tk.after, tk.after_cancel)
+    ticker.add("a", lambda: 1)
+    tk.jobs.clear()     # 回调已被 Tk 丢弃
+    ticker.stop()
+    assert ticker._job is None
+
+
+# ---------- 截止时间调度 ----------
+@pytest.fixture
+def deadlines(tk):
+    return DeadlineScheduler(tk.after, tk.after_cancel, clock=tk.clock)
+
+
+def test_fires_in_deadline_order(tk, deadlines):
+    fired = []
+    record = lambda key, when: fired.append((key, when, tk.now))
+    deadlines.schedule("b", 20, record)
+    deadlines.schedule("a", 10, record)
+    deadlines.schedule("c", 30, record)
+    assert len(tk.jobs) == 1
+    tk.advance(25)
+    assert [(k, w) for k, w, _ in fired] == [("a", 10), ("b", 20)]
+    # 每次都在截止时间之后、不早于截止时间触发
+    assert all(now >= when for _, when, now in fired)
+    assert deadlines.next_deadline() == 30
+    tk.advance(10)
+    assert [k for k, _, _ in fired] == ["a", "b", "c"]
+    assert tk.jobs == {} and deadlines.heap == []
+
+
+def test_reschedule_drops_stale_entry_and_rearms(tk, deadlines):
+    fired = []
+    record = lambda key, when: fired.append((key, when))
+    deadlines.schedule("a", 10, record)
+    deadlines.schedule("b", 50, record)
+    deadlines.schedule("a", 40, record)      # 推迟 a：旧的 10 秒条目作废
+    assert deadlines.next_deadline() == 40
+    assert len(deadlines.heap) == 2
+    (job, (due, _)), = tk.jobs.items()
+    assert due >= 40
+    tk.advance(45)
+    assert fired == [("a", 40)]
+    deadlines.schedule("b", 5, record)       # 提前 b：重新定在更早的时间
+    (due, _), = tk.jobs.values()
+    assert due <= tk.now + 5.01
+    tk.advance(10)
+    assert fired == [("a", 40), ("b", 5)]
+    assert tk.jobs == {}
+
+
+def test_cancel_rearms_to_next_or_idles(tk, deadlines):
+    deadlines.schedule("a", 10, lambda *a: None)
+    deadlines.schedule("b", 20, lambda *a: None)
+    deadlines.cancel("a")
+    assert deadlines.next_deadline() == 20
+    (due, _), = tk.jobs.values()
+    assert due >= 20
+    deadlines.cancel("b")
+    assert tk.jobs == {} and deadlines.next_deadline() is None
+    deadlines.cancel("missing")
+    deadlines.schedule("c", 5, lambda *a: None)
+    deadlines.clear()
+    assert tk.jobs == {} and deadlines.heap == []
+
+
+def test_same_deadline_does_not_rearm(tk, deadlines):
+    deadlines.schedule("a", 10, lambda *a: None)
+    deadlines.schedule("b", 20, lambda *a: None)
+    assert len(tk.delays) == 1
+
+
+def test_failing_callback_is_logged_and_later_deadlines_fire(tk, deadlines, capsys):
+    fired = []
+    deadlines.schedule("broken", 1, lambda key, when: 1 / 0)
+    deadlines.schedule("ok", 1, lambda key, when: fired.append(key))
+    tk.advance(2)
+    assert fired == ["ok"]
+    assert "ZeroDivisionError" in capsys.readouterr().err
+
+
+def test_callback_may_reschedule_itself(tk, deadlines):
+    fired = []
+
+    def again(key, when):
+        fired.append(when)
+        if len(fired) < 3:
+            deadlines.schedule(key, when + 10, again)
+    deadlines.schedule("tick", 10, again)
+    tk.advance(100)
+    assert fired == [10, 20, 30]
+    assert tk.jobs == {}
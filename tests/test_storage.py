@@ -0,0 +1,253 @@
+import json
+import os
+import threading
+import time
+from datetime import date
+
+import pytest
+
+from storage import JsonHistoryStore, SqliteHistoryStore, WriteBehindWriter
+
+
+def rec(event, start, end="2024-03-01 10:30:00", tags="", ms=1800000):
+    return {"event": event, "tags": tags, "start_time": start, "end_time": end,
+            "duration": "00:30:00", "duration_seconds": ms // 1000, "duration_ms": ms}
+
+
+RECORDS = [
+    rec("写代码", "2024-03-01 10:00:00", tags="#工作 #编程"),
+    rec("开会", "2024-03-02 09:00:00", "2024-03-02 10:00:00", "#工作", 3600000),
+    rec("跑步", "2024-03-05 07:00:00", "2024-03-05 07:40:00", "#运动", 2400000),
+    rec("读书", "不是时间", "不是时间", "#学习", 600000),
+]
+
+QUERIES = [
+    {},
+    {"days": (date(2024, 3, 1), date(2024, 3, 2))},
+    {"days": (date(2024, 3, 5), date(2024, 3, 5))},
+    {"tags": {"工作"}},
+    {"tags": {"工作", "编程"}, "match_all": True},
+    {"tags": {"学习"}, "days": (date(2024, 3, 1), date(2024, 3, 1))},
+]
+
+
+def contents(records):
+    return sorted((r.id, r["event"], r["tags"], r["start_time"], r["duration_ms"]) for r in records)
+
+
+def open_sqlite(path):
+    store = SqliteHistoryStore(str(path))
+    store.load()
+    return store
+
+
+def test_sqlite_round_trip(tmp_path):
+    store = open_sqlite(tmp_path / "h.db")
+    store.replace_all(RECORDS)
+    first = store.append(rec("散步", "2024-03-06 19:00:00", "2024-03-06 19:20:00", "#运动", 1200000))
+    store.update(first, {"tags": "#运动 #户外"})
+    store.delete(store.get(2))
+    expected = contents(store.records)
+    store.close()
+
+    store = open_sqlite(tmp_path / "h.db")
+    assert contents(store.records) == expected
+    assert store.get(first.id)["tags"] == "#运动 #户外"
+    assert store.get(2) is None
+    store.close()
+
+
+@pytest.mark.parametrize("kw", QUERIES)
+def test_sqlite_query_matches_json(tmp_path, kw):
+    json_store = JsonHistoryStore(str(tmp_path / "h.json"))
+    json_store.load()
+    json_store.replace_all(RECORDS)
+    sqlite_store = open_sqlite(tmp_path / "h.db")
+    sqlite_store.replace_all(RECORDS)
+    try:
+        # 已提交的记录走 SQL，刚追加、尚未提交的记录按内存判断，两种情况都要与 JSON 后端一致
+        assert contents(sqlite_store.query(**kw)) == contents(json_store.query(**kw))
+        extra = rec("发呆", "也不是时间", "也不是时间", "#工作", 60000)
+        json_store.append(extra)
+        sqlite_store.append(extra)
+        assert contents(sqlite_store.query(**kw)) == contents(json_store.query(**kw))
+    finally:
+        json_store.close()
+        sqlite_store.close()
+
+
+# ---------- JSON 快照 + 日志 ----------
+def edit_json(store):
+    """一串新增、修改、删除、清空操作，返回最后留下的内容"""
+    views = [store.append(r) for r in RECORDS]
+    store.update(views[0], {"event": "写文档", "duration_ms": 900000})
+    store.delete_many(views[1:3])
+    store.clear()
+    views = [store.append(r) for r in RECORDS[:3]]
+    store.update(views[2], {"tags": "#运动 #晨练"})
+    store.delete(views[1])
+    return contents(store.records)
+
+
+def open_json(path, **kw):
+    store = JsonHistoryStore(str(path), **kw)
+    store.load()
+    return store
+
+
+def test_json_journal_round_trip(tmp_path):
+    path = tmp_path / "h.json"
+    store = open_json(path, compact_threshold=1000)
+    expected = edit_json(store)
+    store.close()
+    assert (tmp_path / "h.journal.jsonl").exists()
+
+    store = open_json(path)
+    assert contents(store.records) == expected
+    store.close()
+
+
+def test_json_replay_matches_compaction(tmp_path):
+    replayed = open_json(tmp_path / "a.json", compact_threshold=1000)
+    expected = edit_json(replayed)
+    replayed.close()
+    compacted = open_json(tmp_path / "b.json", compact_threshold=2)
+    assert edit_json(compacted) == expected
+    compacted.close()
+
+    for name in ("a.json", "b.json"):
+        store = open_json(tmp_path / name)
+        assert contents(store.records) == expected
+        store.close()
+
+
+def test_json_skips_torn_journal_line(tmp_path):
+    path = tmp_path / "h.json"
+    store = open_json(path, compact_threshold=1000)
+    expected = edit_json(store)
+    store.close()
+    with open(tmp_path / "h.journal.jsonl", "a", encoding="utf-8") as f:
+        f.write('{"op": "add", "rec": {"event": "半')
+
+    store = open_json(path)
+    assert contents(store.records) == expected
+    store.close()
+
+
+def test_json_migrates_legacy_list(tmp_path):
+    path = tmp_path / "h.json"
+    path.write_text(json.dumps(RECORDS, ensure_ascii=False), encoding="utf-8")
+    store = open_json(path)
+    migrated = contents(store.records)
+    store.close()
+    assert [r[1] for r in migrated] == [r["event"] for r in RECORDS]
+    assert sorted(r[0] for r in migrated) == [1, 2, 3, 4]
+
+    data = json.loads(path.read_text(encoding="utf-8"))
+    assert isinstance(data, dict) and [r["id"] for r in data["records"]] == [1, 2, 3, 4]
+    store = open_json(path)
+    assert contents(store.records) == migrated
+    store.close()
+
+
+# ---------- 后台合并写入 ----------
+@pytest.fixture
+def writer():
+    writer = WriteBehindWriter(window=60)    # 窗口足够长，只有 flush() 才会落盘
+    writer.errors = []
+    writer.on_error = lambda path, e: writer.errors.append((path, e))
+    yield writer
+    writer.close()
+
+
+def read_json(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_writer_coalesces_dirty_file(writer, tmp_path):
+    path = str(tmp_path / "names.json")
+    calls = []
+
+    def producer(n):
+        def produce():
+            calls.append(n)
+            return {"version": n}
+        return produce
+    for n in range(5):
+        writer.mark_dirty(path, producer(n))
+    assert not os.path.exists(path)
+    writer.flush()
+    # 一个窗口内多次登记只写一次，写出的是最后一次登记的内容
+    assert calls == [4]
+    assert read_json(path) == {"version": 4}
+    writer.flush()
+    assert calls == [4]
+
+
+def test_writer_runs_appends_and_tasks_in_order(writer, tmp_path):
+    path = str(tmp_path / "log.jsonl")
+    seen = []
+    writer.append_line(path, "1\n")
+    writer.append_line(path, "2\n")
+    writer.run_task(lambda: seen.append(open(path, encoding="utf-8").read()))
+    writer.append_line(path, "3\n")
+    writer.mark_dirty(str(tmp_path / "a.json"), lambda: seen.append("dirty") or [])
+    writer.run_task(lambda: seen.append("task"))
+    writer.flush()
+    # 追加行和任务按提交顺序执行，整文件重写在同一批的最后
+    assert seen == ["1\n2\n", "task", "dirty"]
+    assert open(path, encoding="utf-8").read() == "1\n2\n3\n"
+
+
+def test_flush_waits_for_batch_and_is_noop_on_writer_thread(writer, tmp_path):
+    done = []
+
+    def slow():
+        time.sleep(0.05)
+        writer.flush()          # 写入线程中调用时直接返回，不会自己等自己
+        done.append(threading.current_thread())
+    writer.run_task(slow)
+    writer.flush()
+    assert done == [writer._thread]
+    writer.flush()              # 没有待写内容时立即返回
+
+
+def test_failed_write_keeps_old_file(writer, tmp_path, monkeypatch):
+    path = str(tmp_path / "settings.json")
+    writer.mark_dirty(path, lambda: {"theme": "旧"})
+    writer.flush()
+
+    def broken(fd):
+        raise OSError("磁盘已满")
+    monkeypatch.setattr(os, "fsync", broken)
+    writer.mark_dirty(path, lambda: {"theme": "新"})
+    writer.flush()
+    assert read_json(path) == {"theme": "旧"}
+    assert sorted(os.listdir(tmp_path)) == ["settings.json"]
+    assert [(p, type(e)) for p, e in writer.errors] == [(path, OSError)]
+
+    def unserializable():
+        return {"theme": object()}
+    writer.mark_dirty(path, unserializable)
+    writer.flush()
+    assert read_json(path) == {"theme": "旧"}
+    assert isinstance(writer.errors[-1][1], TypeError)
+
+
+def test_failed_task_is_reported_and_later_work_continues(writer, tmp_path):
+    path = str(tmp_path / "log.jsonl")
+    writer.run_task(lambda: 1 / 0)
+    writer.append_line(path, "ok\n")
+    writer.flush()
+    assert isinstance(writer.errors[0][1], ZeroDivisionError) and writer.errors[0][0] is None
+    assert open(path, encoding="utf-8").read() == "ok\n"
+
+
+def test_close_writes_pending_data(tmp_path):
+    writer = WriteBehindWriter(window=60)
+    path = str(tmp_path / "tags.json")
+    writer.mark_dirty(path, lambda: {"工作": 3})
+    writer.close()
+    assert read_json(path) == {"工作": 3}
+    assert not writer._thread.is_alive()
@@ -0,0 +1,183 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from autocomplete import NameIndex
+from timer_engine import PAUSED, RESUMED, STARTED, STOPPED, TimerEngine
+
+
+class FakeClocks:
+    """可控的挂钟和单调时钟；advance() 同时推进两者，jump_wall() 只改挂钟（模拟校时）"""
+
+    def __init__(self):
+        self.wall = datetime(2024, 3, 1, 9, 0, 0)
+        self.mono = 10 ** 12
+
+    def clock(self):
+        return self.wall
+
+    def monotonic(self):
+        return self.mono
+
+    def advance(self, seconds):
+        self.wall += timedelta(seconds=seconds)
+        self.mono += int(seconds * 1e9)
+
+    def jump_wall(self, seconds):
+        self.wall += timedelta(seconds=seconds)
+
+
+class ListStore:
+    def __init__(self):
+        self.records = []
+
+    def append(self, rec):
+        self.records.append(rec)
+
+
+@pytest.fixture
+def clocks():
+    return FakeClocks()
+
+
+@pytest.fixture
+def engine(clocks):
+    engine = TimerEngine(ListStore(), NameIndex({}, now=clocks.wall),
+                         clock=clocks.clock, monotonic=clocks.monotonic)
+    engine.events = []
+    engine.subscribe(lambda kind, name, info: engine.events.append((kind, name)))
+    return engine
+
+
+def records(engine):
+    return engine.history_store.records
+
+
+# ---------- 状态机 ----------
+def test_start_stop_records_one_entry(engine, clocks):
+    assert engine.start("写代码", "#工作")
+    assert not engine.start("写代码")
+    assert not engine.start("")
+    clocks.advance(90 * 60)
+    rec = engine.stop("写代码")
+    assert rec == records(engine)[0]
+    assert rec["event"] == "写代码" and rec["tags"] == "#工作"
+    assert rec["start_time"] == "2024-03-01 09:00:00"
+    assert rec["end_time"] == "2024-03-01 10:30:00"
+    assert rec["duration"] == "1h30m"
+    assert "写代码" not in engine.current_events
+    assert engine.stop("写代码") is None
+    assert ("started", "写代码") in engine.events and ("stopped", "写代码") in engine.events
+    assert engine.tags_data == {"工作": 1}
+
+
+def test_pause_a_excludes_paused_time(engine, clocks):
+    engine.start("读书")
+    clocks.advance(600)
+    assert engine.pause("读书", "A")
+    assert not engine.pause("读书", "A")
+    assert engine.status("读书") == "paused_a"
+    clocks.advance(3600)
+    assert engine.elapsed_seconds("读书") == 600
+    assert engine.resume("读书")
+    clocks.advance(300)
+    rec = engine.stop("读书")
+    assert rec["duration_ms"] == 900 * 1000
+    assert len(records(engine)) == 1
+    state = [k for k, _ in engine.events if k in (STARTED, PAUSED, RESUMED, STOPPED)]
+    assert state == [STARTED, PAUSED, RESUMED, STOPPED]
+
+
+def test_stop_while_paused_a_ends_at_pause(engine, clocks):
+    engine.start("读书")
+    clocks.advance(600)
+    engine.pause("读书", "A")
+    clocks.advance(3600)
+    rec = engine.stop("读书")
+    assert rec["end_time"] == "2024-03-01 09:10:00"
+    assert rec["duration_ms"] == 600 * 1000
+
+
+def test_stop_with_elapsed_cap_moves_end_time(engine, clocks):
+    engine.start("开会")
+    clocks.advance(3000)
+    rec = engine.stop("开会", elapsed=1800)
+    assert rec["duration_ms"] == 1800 * 1000
+    assert rec["end_time"] == "2024-03-01 09:30:00"
+
+
+def test_records_before_attach_are_kept(clocks):
+    engine = TimerEngine(clock=clocks.clock, monotonic=clocks.monotonic)
+    engine.start("早到")
+    clocks.advance(60)
+    engine.stop("早到")
+    assert engine.pending_records and engine.pending_names
+    store, names = ListStore(), NameIndex({}, now=clocks.wall)
+    engine.attach(store, names, {"旧标签": 3})
+    assert [r["event"] for r in store.records] == ["早到"]
+    assert engine.pending_records == [] and engine.pending_names == []
+    assert "早到" in names.data
+    assert engine.tags_data == {"旧标签": 3}
+
+
+def test_save_failure_is_reported(engine, clocks):
+    def broken(rec):
+        raise OSError("磁盘已满")
+    engine.history_store.append = broken
+    failures = []
+    engine.subscribe(lambda kind, name, info: kind == "save_failed" and failures.append(info["error"]))
+    engine.start("写代码")
+    clocks.advance(60)
+    assert engine.stop("写代码") is not None
+    assert isinstance(failures[0], OSError)
+    assert "写代码" not in engine.current_events
+
+
+# ---------- 单调时钟与毫秒时长 ----------
+def test_mode_b_segments_sum_to_total(engine, clocks):
+    engine.start("写代码")
+    # 不整齐的段长：每段按累计值取整后相减，各段之和与总时长严格相等
+    for seconds in (10.4444, 20.3333, 0.7777):
+        clocks.advance(seconds)
+        assert engine.pause("写代码", "B")
+        assert engine.current_events["写代码"]["start_time"] is None
+        clocks.advance(100)     # 暂停期间不计时
+        assert engine.resume("写代码")
+    clocks.advance(5.5555)
+    total = engine.elapsed_ns("写代码")
+    last = engine.stop("写代码")
+    segments = records(engine)[:-1]
+    assert len(segments) == 3
+    assert [r["duration_ms"] for r in segments] == [10444, 30777 - 10444, 31555 - 30777]
+    assert sum(r["duration_ms"] for r in segments) == 31555
+    assert last["duration_ms"] == total // 1000000 == 37110
+    # 整体记录从第一次开始算起
+    assert last["start_time"] == "2024-03-01 09:00:00"
+
+
+def test_wall_clock_jump_does_not_change_elapsed(engine, clocks):
+    engine.start("写代码")
+    clocks.advance(600)
+    clocks.jump_wall(-3600)     # 系统时间被往回调了一小时
+    clocks.advance(600)
+    assert engine.elapsed_seconds("写代码") == 1200
+    clocks.jump_wall(7200)
+    rec = engine.stop("写代码")
+    assert rec["duration_ms"] == 1200 * 1000
+    assert rec["duration_seconds"] == 1200
+
+
+def test_millisecond_and_second_rounding(engine, clocks):
+    engine.start("短")
+    clocks.advance(59.9996)
+    rec = engine.stop("短")
+    # 毫秒向下取整，整秒数由毫秒数换算（同样向下取整），显示文本按整秒
+    assert rec["duration_ms"] == 59999
+    assert rec["duration_seconds"] == 59
+    assert rec["duration"] == "0h00m"
+    engine.start("长")
+    clocks.advance(3 * 3600 + 59 * 60 + 59.9999)
+    rec = engine.stop("长")
+    assert rec["duration_ms"] == (3 * 3600 + 59 * 60 + 59) * 1000 + 999
+    assert rec["duration_seconds"] == 3 * 3600 + 59 * 60 + 59
+    assert rec["duration"] == "3h59m"
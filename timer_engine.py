@@ -0,0 +1,256 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+from history_records import format_duration, parse_tags
+
+
+# ---------- 变更事件 ----------
+# 订阅者以 fn(kind, name, info) 接收，info 为字典：
+#   STARTED   {"start", "tags", "from_template"}
+#   PAUSED    {"mode", "record"}           模式 B 暂停时 record 为记下的一段，模式 A 为 None
+#   RESUMED   {"mode"}
+#   STOPPED   {"record", "duration", "from_template"}
+#   NAMES_CHANGED / TAGS_CHANGED  {}       名称热度或标签计数变了，需要保存
+#   SAVE_FAILED  {"record", "error"}       写入历史失败（计时状态照常变化）
+STARTED = "started"
+PAUSED = "paused"
+RESUMED = "resumed"
+STOPPED = "stopped"
+NAMES_CHANGED = "names_changed"
+TAGS_CHANGED = "tags_changed"
+SAVE_FAILED = "save_failed"
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class TimerEngine:
+    """计时状态机（不依赖 tkinter）
+
+    持有进行中的事件 current_events，负责开始、暂停（模式 A/B）、恢复、停止，
+    把完成的记录追加到 history_store，并维护事件名热度（name_index）和标签计数（tags_data）。
+    界面通过 subscribe() 订阅变更事件。
+
+    history_store / name_index 可以晚于引擎就绪（例如历史在后台线程加载）：在此之前
+    完成的记录和用过的名称先暂存，attach() 接入时补写，所以加载期间也可以正常计时。
+
+    计时长度只用单调时钟 monotonic()（纳秒）计算，系统时间被校时、夏令时或手动修改都不影响；
+    挂钟 clock() 只用于记录和显示开始/结束时间。测试和压测可以注入这两个假时钟。
+    记录的 duration_ms 为毫秒时长，duration_seconds 仍为整秒（兼容旧数据）；
+    模式 B 各段的毫秒数按累计值取整后相减，各段之和与总时长严格相等。
+
+    current_events 中每个事件的字段：
+        start_time           本段开始的挂钟时间（模式 B 暂停时为 None）
+        original_start_time  第一次开始的挂钟时间
+        mono_start           本段开始的单调时钟读数（未运行时为 None）
+        tags                 标签原始字符串
+        from_template        是否由模板启动
+        status               running / paused_a / paused_b
+        accumulated_ns       本段之前已累计的纳秒数
+        paused_time          模式 A 暂停的挂钟时间
+    """
+
+    def __init__(self, history_store=None, name_index=None, tags_data=None,
+                 clock=datetime.now, monotonic=time.monotonic_ns, lock=None, max_names=1000):
+        self.history_store = history_store
+        self.name_index = name_index
+        self.tags_data = tags_data if tags_data is not None else {}
+        self.clock = clock
+        self.monotonic = monotonic
+        self.lock = lock if lock is not None else threading.RLock()
+        self.max_names = max_names
+        self.current_events = {}
+        self.listeners = []
+        self.pending_records = []    # history_store 就绪前完成的记录
+        self.pending_names = []      # name_index 就绪前用过的 (名称, 时间)
+
+    # ---------- 订阅 ----------
+    def subscribe(self, fn):
+        self.listeners.append(fn)
+
+    def unsubscribe(self, fn):
+        if fn in self.listeners:
+            self.listeners.remove(fn)
+
+    def _emit(self, kind, name, **info):
+        for fn in list(self.listeners):
+            fn(kind, name, info)
+
+    def attach(self, history_store, name_index, tags_data=None):
+        """接入加载完成的数据，补写此前暂存的记录和名称
+
+        tags_data 为加载得到的标签计数，加载期间累计的计数会并入其中。
+        """
+        with self.lock:
+            if tags_data is not None:
+                for t, n in self.tags_data.items():
+                    tags_data[t] = tags_data.get(t, 0) + n
+                self.tags_data = tags_data
+            self.history_store = history_store
+            self.name_index = name_index
+            records, self.pending_records = self.pending_records, []
+            names, self.pending_names = self.pending_names, []
+        for rec in records:
+            self._append(rec)
+        for name, when in names:
+            self.note_name_used(name, when)
+        if tags_data is not None:
+            self._emit(TAGS_CHANGED, None)
+
+    # ---------- 查询 ----------
+    def elapsed_ns(self, name, now=None):
+        """已计时纳秒数；now 为单调时钟读数（默认现在）"""
+        d = self.current_events[name]
+        if d["status"] == "running":
+            return d["accumulated_ns"] + (self.monotonic() if now is None else now) - d["mono_start"]
+        return d["accumulated_ns"]
+
+    def elapsed_seconds(self, name, now=None):
+        return self.elapsed_ns(name, now) / 1e9
+
+    def status(self, name):
+        d = self.current_events.get(name)
+        return None if d is None else d["status"]
+
+    # ---------- 状态变化 ----------
+    def start(self, name, tags="", from_template=False):
+        """开始计时；同名事件已在计时中时返回 False"""
+        if not name or name in self.current_events:
+            return False
+        start = self.clock()
+        self.current_events[name] = {
+            "start_time": start,
+            "original_start_time": start,
+            "mono_start": self.monotonic(),
+            "tags": tags,
+            "from_template": from_template,
+            "status": "running",
+            "accumulated_ns": 0,
+            "paused_time": None
+        }
+        self.note_name_used(name, start)
+        self.note_tags_used(parse_tags(tags))
+        self._emit(STARTED, name, start=start, tags=tags, from_template=from_template)
+        return True
+
+    def pause(self, name, mode='A'):
+        """暂停运行中的事件；模式 B 把本段记为一条历史"""
+        d = self.current_events.get(name)
+        if d is None or d["status"] != "running":
+            return False
+        now = self.clock()
+        before = d["accumulated_ns"]
+        d["accumulated_ns"] = before + self.monotonic() - d["mono_start"]
+        d["mono_start"] = None
+        rec = None
+        if mode == 'A':
+            d["status"] = "paused_a"
+            d["paused_time"] = now
+        else:
+            ms = d["accumulated_ns"] // 1000000 - before // 1000000
+            rec = self._record(name, d["tags"], d["start_time"], now, ms)
+            d["status"] = "paused_b"
+            d["start_time"] = None
+            self._append(rec)
+        self._emit(PAUSED, name, mode=mode, record=rec)
+        return True
+
+    def resume(self, name):
+        """恢复暂停的事件（按暂停时的模式）"""
+        d = self.current_events.get(name)
+        if d is None:
+            return False
+        if d["status"] == "paused_a":
+            d["start_time"] = self.clock()
+            d["mono_start"] = self.monotonic()
+            d["status"] = "running"
+            d["paused_time"] = None
+            self._emit(RESUMED, name, mode='A')
+            return True
+        if d["status"] == "paused_b":
+            # 分段模式：恢复即开始新的一段
+            start = self.clock()
+            self.current_events[name] = {
+                "start_time": start,
+                "original_start_time": d["original_start_time"],
+                "mono_start": self.monotonic(),
+                "tags": d["tags"],
+                "from_template": d.get("from_template", False),
+                "status": "running",
+                "accumulated_ns": d["accumulated_ns"],
+                "paused_time": None
+            }
+            self.note_name_used(name, start)
+            self._emit(RESUMED, name, mode='B')
+            return True
+        return False
+
+    def stop(self, name, elapsed=None):
+        """停止事件并写入历史，返回记录
+
+        elapsed 为指定的总时长（秒，仅运行中的事件使用，如自动停止时的提醒阈值），
+        结束时间相应记为达到该时长的时刻；默认按现在停止。
+        """
+        d = self.current_events.get(name)
+        if d is None:
+            return None
+        total = self.elapsed_ns(name)
+        if d["status"] == "running":
+            end = self.clock()
+            if elapsed is not None and elapsed * 1e9 < total:
+                over = total - int(elapsed * 1e9)
+                total -= over
+                end -= timedelta(microseconds=over // 1000)
+        elif d["status"] == "paused_a":
+            end = d["paused_time"] or self.clock()
+        else:  # paused_b
+            end = self.clock()
+        start = d.get("original_start_time", d["start_time"] or d["paused_time"] or self.clock())
+        rec = self._record(name, d["tags"], start, end, total // 1000000)
+        self._append(rec)
+        del self.current_events[name]
+        self._emit(STOPPED, name, record=rec, duration=rec["duration"],
+                   from_template=d.get("from_template", False))
+        return rec
+
+    def stop_all(self):
+        for name in list(self.current_events):
+            self.stop(name)
+
+    # ---------- 名称与标签计数 ----------
+    def note_name_used(self, name, when):
+        """更新事件名称的使用热度（用于输入补全），超出上限时淘汰最冷的名称"""
+        with self.lock:
+            if self.name_index is None:
+                self.pending_names.append((name, when))
+                return
+            self.name_index.use(name, when)
+            self.name_index.trim(self.max_names, keep=name)
+        self._emit(NAMES_CHANGED, name)
+
+    def note_tags_used(self, tags):
+        with self.lock:
+            for t in tags:
+                self.tags_data[t] = self.tags_data.get(t, 0) + 1
+        self._emit(TAGS_CHANGED, None)
+
+    # ---------- 历史 ----------
+    def _record(self, name, tags, start, end, ms):
+        return {
+            "event": name,
+            "tags": tags,
+            "start_time": start.strftime(TIME_FORMAT),
+            "end_time": end.strftime(TIME_FORMAT),
+            "duration": format_duration(ms // 1000),
+            "duration_seconds": ms // 1000,
+            "duration_ms": ms
+        }
+
+    def _append(self, rec):
+        if self.history_store is None:
+            self.pending_records.append(rec)
+            return
+        try:
+            self.history_store.append(rec)
+        except Exception as e:
+            self._emit(SAVE_FAILED, rec["event"], record=rec, error=e)